@@ -1,4 +1,6 @@
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Ensure project root is importable when running from cookbook subdirectory.
@@ -23,7 +25,21 @@ from nodes import (
 )
 
 
+# Sync nodes (ReqParseNode, TestDesignNode, ...) block on urllib LLM calls; run them on a
+# bounded pool shared by every flow so the FastAPI event loop keeps serving SSE streams.
+SYNC_NODE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, int(os.getenv("FLOW_SYNC_WORKERS", "16"))),
+    thread_name_prefix="flow-sync",
+)
+
+
+# Large specs split into many batches; keep only a bounded number of them in flight per job.
+BATCH_CONCURRENCY = max(1, int(os.getenv("FLOW_BATCH_CONCURRENCY", "8")))
+
+
 class TestCaseParallelFlow(AsyncParallelBatchFlow):
+    max_concurrency = BATCH_CONCURRENCY
+
     async def prep_async(self, shared):
         integrated = shared.get("test_design_spec", {}).get("integrated_matrix", [])
         if not isinstance(integrated, list) or not integrated:
@@ -34,14 +50,22 @@ class TestCaseParallelFlow(AsyncParallelBatchFlow):
         chunks = [integrated[i : i + chunk_size] for i in range(0, len(integrated), chunk_size)]
         if not chunks:
             chunks = [[]]
-        shared["_testcase_batches"] = {}
+        # On a supervisor retry, regenerate only the batches it flagged and keep the approved ones.
+        retry = shared.pop("_testcase_retry_batches", None)
+        if retry is not None and shared.get("_testcase_batch_plan") == chunks and shared.get("_testcase_batches"):
+            indexes = sorted({i for i in retry if 0 <= i < len(chunks)})
+        else:
+            indexes = list(range(len(chunks)))
+            shared["_testcase_batches"] = {}
+            shared["_testcase_batch_feedback"] = {}
+        shared["_testcase_batch_plan"] = chunks
         return [
-            {"batch_index": idx, "batch_total": len(chunks), "integrated_chunk": chunk}
-            for idx, chunk in enumerate(chunks)
+            {"batch_index": idx, "batch_total": len(chunks), "integrated_chunk": chunks[idx]}
+            for idx in indexes
         ]
 
 
-def create_system_test_flow() -> AsyncFlow:
+def create_system_test_flow(checkpoint_store=None) -> AsyncFlow:
     intake = IntakeNode()
     req_parse = ReqParseNode()
     tri = TriPersonaReviewNode()
@@ -51,8 +75,8 @@ def create_system_test_flow() -> AsyncFlow:
     cases_parallel = TestCaseParallelFlow(start=TestCaseBatchGenNode())
     cases_finalize = FinalizeTestCaseNode()
     case_sup = TestCaseSupervisorNode()
-    mapper = HarnessMapperNode()
-    writer = ScriptWriterNode()
+    mapper = HarnessMapperNode(max_concurrency=BATCH_CONCURRENCY)
+    writer = ScriptWriterNode(max_concurrency=BATCH_CONCURRENCY)
     assemble = AssembleResultNode()
 
     intake >> req_parse >> tri >> synth >> design
@@ -61,37 +85,37 @@ def create_system_test_flow() -> AsyncFlow:
     design_sup >> cases_parallel >> cases_finalize >> case_sup
     case_sup - "retry" >> cases_parallel
     case_sup >> mapper >> writer >> assemble
-    return AsyncFlow(start=intake)
+    return AsyncFlow(start=intake, executor=SYNC_NODE_EXECUTOR, checkpoint_store=checkpoint_store)
 
 
-def create_requirement_analysis_flow() -> AsyncFlow:
+def create_requirement_analysis_flow(checkpoint_store=None) -> AsyncFlow:
     intake = IntakeNode()
     req_parse = ReqParseNode()
     tri = TriPersonaReviewNode()
     synth = SynthesisNode()
     intake >> req_parse >> tri >> synth
-    return AsyncFlow(start=intake)
+    return AsyncFlow(start=intake, executor=SYNC_NODE_EXECUTOR, checkpoint_store=checkpoint_store)
 
 
-def create_test_design_flow() -> AsyncFlow:
+def create_test_design_flow(checkpoint_store=None) -> AsyncFlow:
     design = TestDesignNode()
     sup = TestDesignSupervisorNode()
     design >> sup
     sup - "retry" >> design
-    return AsyncFlow(start=design)
+    return AsyncFlow(start=design, executor=SYNC_NODE_EXECUTOR, checkpoint_store=checkpoint_store)
 
 
-def create_test_case_flow() -> AsyncFlow:
+def create_test_case_flow(checkpoint_store=None) -> AsyncFlow:
     parallel = TestCaseParallelFlow(start=TestCaseBatchGenNode())
     finalize = FinalizeTestCaseNode()
     sup = TestCaseSupervisorNode()
     parallel >> finalize >> sup
     sup - "retry" >> parallel
-    return AsyncFlow(start=parallel)
+    return AsyncFlow(start=parallel, executor=SYNC_NODE_EXECUTOR, checkpoint_store=checkpoint_store)
 
 
-def create_script_flow() -> AsyncFlow:
-    mapper = HarnessMapperNode()
-    writer = ScriptWriterNode()
+def create_script_flow(checkpoint_store=None) -> AsyncFlow:
+    mapper = HarnessMapperNode(max_concurrency=BATCH_CONCURRENCY)
+    writer = ScriptWriterNode(max_concurrency=BATCH_CONCURRENCY)
     mapper >> writer
-    return AsyncFlow(start=mapper)
+    return AsyncFlow(start=mapper, executor=SYNC_NODE_EXECUTOR, checkpoint_store=checkpoint_store)
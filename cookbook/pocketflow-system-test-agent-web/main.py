@@ -1,5 +1,7 @@
 import os
 import asyncio
+import collections
+import functools
 import json
 import base64
 import uuid
@@ -7,12 +9,16 @@ import time
 import subprocess
 import re
 import html
-from io import BytesIO
+import csv
+import io
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import unquote
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
@@ -23,9 +29,33 @@ from flow import (
     create_test_case_flow,
     create_test_design_flow,
 )
+from pocketflow import FileCheckpointStore
 from schemas import DEFAULT_ACTION_VOCABULARY, DEFAULT_ASSERTION_VOCABULARY, DEFAULT_CAPABILITIES
-from utils.llm_client import LLMClient
-from utils.rag_store import SimpleRAGStore
+from utils.doc_render import (
+    ENCODINGS as DOC_ENCODINGS,
+    CoalescingRenderer,
+    SectionCache,
+    invalidate_precompressed,
+    pick_encoding,
+    read_precompressed_meta,
+    write_precompressed,
+)
+from utils.event_bus import EventBus, follow_job_events, sse_frame
+from utils.history_index import SORT_COLUMNS as HISTORY_SORT_COLUMNS, DesignHistoryIndex
+from utils.job_store import TERMINAL_STATUSES, JobStore
+from utils.llm_cache import get_default_cache
+from utils.llm_client import LLMClient, aclose_transports
+from utils.llm_limiter import get_default_limiter
+from utils.rag_store import (
+    TEXT_EXTENSIONS as RAG_TEXT_EXTENSIONS,
+    SimpleRAGStore,
+    extract_pdf_pages,
+    iter_chunks,
+    iter_text_file,
+    pdf_page_count,
+)
+from utils.serial_session import ResponseFraming, SerialSessionManager, at_command_timeout
+from utils.xlsx_stream import iter_xlsx
 
 
 class GenerateRequest(BaseModel):
@@ -37,6 +67,8 @@ class GenerateRequest(BaseModel):
     capabilities: Optional[Dict[str, Any]] = None
     action_vocabulary: Optional[List[str]] = None
     assertion_vocabulary: Optional[List[str]] = None
+    bypass_cache: bool = False
+    resume_from: str = ""
 
 
 class PromptSettingsRequest(BaseModel):
@@ -82,6 +114,7 @@ class RequirementRoundRequest(BaseModel):
     round: int = 1
     previous_persona_reviews: Optional[Dict[str, Any]] = None
     open_question_answers: Optional[Dict[str, str]] = None
+    bypass_cache: bool = False
 
 
 class RequirementHITLStartRequest(BaseModel):
@@ -94,6 +127,7 @@ class RequirementHITLStartRequest(BaseModel):
     adb_device_id: str = ""
     at_port: str = ""
     at_baudrate: int = 115200
+    bypass_cache: bool = False
 
 
 class RequirementHITLNextRequest(BaseModel):
@@ -113,6 +147,8 @@ class StageGenerateRequest(BaseModel):
     action_vocabulary: Optional[List[str]] = None
     assertion_vocabulary: Optional[List[str]] = None
     history_record_id: str = ""
+    bypass_cache: bool = False
+    resume_from: str = ""
 
 
 class AutomationRequest(BaseModel):
@@ -164,8 +200,36 @@ at_active_efsm_path = at_build_dir / "active_efsm.json"
 at_compile_report_path = at_build_dir / "compile_report.json"
 design_history_dir = Path(base_dir) / "history" / "designs"
 rag_store = SimpleRAGStore(Path(base_dir) / "rag_data")
+# Long flows save the plain-data part of `shared` after every node so a failed run can resume there.
+checkpoint_store = FileCheckpointStore(Path(base_dir) / "checkpoints")
+# Checkpoints of failed or abandoned runs are removed once untouched for this long; a successful run deletes its own.
+CHECKPOINT_TTL_S = float(os.getenv("CHECKPOINT_TTL_S", str(24 * 3600)))
+CHECKPOINT_SWEEP_INTERVAL_S = 3600
+# Job status, results and event logs live in SQLite so any worker can serve state/stream requests;
+# the dicts below only hold the runtime objects (tasks, request payloads, HITL answer events) of jobs running in this worker.
+job_store = JobStore(
+    Path(os.getenv("JOB_STORE_DIR", "") or Path(base_dir) / "jobs") / "jobs.sqlite3",
+    ttl_s=float(os.getenv("JOB_TTL_S", str(24 * 3600))),
+)
+job_store.fail_orphans("服务进程已退出，任务中断")
+# SQLite writes from the event loop run on this single thread, so a job's state updates and events keep their order.
+job_store_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+JOB_POLL_S = 0.5
+# Live fan-out for jobs running in this worker; event ids are the job store's sequence numbers.
+# Subscribers more than JOB_EVENT_QUEUE_SIZE events behind (stalled SSE clients) are dropped back to store polling.
+event_bus = EventBus(
+    ring_size=int(os.getenv("JOB_EVENT_RING_SIZE", "256")),
+    queue_size=int(os.getenv("JOB_EVENT_QUEUE_SIZE", "1024")),
+)
+# One long-lived session per modem port; AT responses are framed by ATSPEC result codes, not fixed sleeps.
+serial_sessions = SerialSessionManager()
 requirement_hitl_jobs: Dict[str, Dict[str, Any]] = {}
 stage_jobs: Dict[str, Dict[str, Any]] = {}
+rag_ingest_jobs: Dict[str, Dict[str, Any]] = {}
+# Text extraction is CPU-bound (pypdf), so it runs in worker processes; PDFs are split into page ranges.
+rag_ingest_pool = ProcessPoolExecutor(max_workers=max(1, int(os.getenv("RAG_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))))
+RAG_INGEST_PAGES_PER_TASK = 16
+RAG_UPLOAD_MAX_BYTES = int(float(os.getenv("RAG_UPLOAD_MAX_MB", "512")) * 1024 * 1024)
 ALLOWED_PROMPT_FILES = {
     "req_parse.txt",
     "review_spec_lawyer.txt",
@@ -332,6 +396,10 @@ def _ensure_at_agent_assets():
 
 _ensure_at_agent_assets()
 design_history_dir.mkdir(parents=True, exist_ok=True)
+# Summaries for the history list, kept in step with each record.json by _write_design_history_record.
+design_history_index = DesignHistoryIndex(design_history_dir.parent / "designs_index.sqlite3")
+# Rendered design-document sections, shared across records and updates.
+design_doc_sections = SectionCache(max_entries=int(os.getenv("DESIGN_DOC_SECTION_CACHE", "512")))
 
 
 def _valid_history_record_id(record_id: str) -> bool:
@@ -560,21 +628,18 @@ def _render_answered_question_table(items: Any) -> str:
     )
 
 
-def _render_design_document_html(record: Dict[str, Any]) -> str:
-    requirement_input = record.get("requirement_input", []) or []
-    product_profile = record.get("product_profile", {}) if isinstance(record.get("product_profile"), dict) else {}
-    test_environments = record.get("test_environments", {}) if isinstance(record.get("test_environments"), dict) else {}
-    requirement_spec = record.get("requirement_spec", {}) if isinstance(record.get("requirement_spec"), dict) else {}
-    persona_reviews = record.get("persona_reviews", {}) if isinstance(record.get("persona_reviews"), dict) else {}
-    requirement_review_history = record.get("requirement_review_history", {}) if isinstance(record.get("requirement_review_history"), dict) else {}
-    test_design_spec = record.get("test_design_spec", {}) if isinstance(record.get("test_design_spec"), dict) else {}
-    reqs = requirement_spec.get("final_requirements", []) if isinstance(requirement_spec.get("final_requirements"), list) else []
-    objectives = test_design_spec.get("objectives", []) if isinstance(test_design_spec.get("objectives"), list) else []
-    matrices = test_design_spec.get("coverage_matrices", []) if isinstance(test_design_spec.get("coverage_matrices"), list) else []
-    integrated = test_design_spec.get("integrated_matrix", []) if isinstance(test_design_spec.get("integrated_matrix"), list) else []
-    title = record.get("title") or _history_title(requirement_input, requirement_spec)
-    updated_at = record.get("updated_at", "")
+def _render_doc_background(requirement_input: List[Any], profile_lines: List[str], test_environment_lines: List[str]) -> str:
+    return f"""<section class="section">
+        <h2>二、需求输入与产品背景</h2>
+        <div class="grid">
+          <div><h3>原始需求输入</h3>{_render_html_list(requirement_input)}</div>
+          <div><h3>产品通信背景与支持特性</h3>{_render_html_list(profile_lines)}</div>
+          <div><h3>测试团队可用测试环境</h3>{_render_html_list(test_environment_lines)}</div>
+        </div>
+      </section>"""
 
+
+def _render_doc_requirements(reqs: List[Dict[str, Any]]) -> str:
     req_rows = []
     for item in reqs:
         req_rows.append(
@@ -592,12 +657,22 @@ def _render_design_document_html(record: Dict[str, Any]) -> str:
         if req_rows
         else "<p>无</p>"
     )
+    return f'<section class="section"><h2>三、测试需求解读稿</h2>{req_table}</section>'
+
 
+def _render_doc_reviews(persona_reviews: Dict[str, Any], answered_questions: Any) -> str:
     review_sections = []
     for label, key in [("规范评审", "spec"), ("运营商评审", "carrier"), ("现网体验评审", "ux")]:
         reviews = (persona_reviews.get(key) or {}).get("reviews", []) if isinstance(persona_reviews.get(key), dict) else []
         review_sections.append(f"<section><h3>{html.escape(label)}</h3>{_render_history_review_table(reviews)}</section>")
+    answered_question_table = _render_answered_question_table(answered_questions)
+    return (
+        f'<section class="section"><h2>四、三人评审记录</h2>{"".join(review_sections)}'
+        f"<section><h3>用户已确认问题</h3>{answered_question_table}</section></section>"
+    )
+
 
+def _render_doc_objectives(objectives: List[Dict[str, Any]]) -> str:
     obj_rows = []
     for item in objectives:
         obj_rows.append(
@@ -617,6 +692,10 @@ def _render_design_document_html(record: Dict[str, Any]) -> str:
         else "<p>无</p>"
     )
 
+    return f'<section class="section"><h2>五、测试目标</h2>{objective_table}</section>'
+
+
+def _render_doc_matrices(matrices: List[Dict[str, Any]]) -> str:
     matrix_cards = []
     for matrix in matrices:
         dims = matrix.get("dimensions", []) if isinstance(matrix, dict) else []
@@ -636,6 +715,10 @@ def _render_design_document_html(record: Dict[str, Any]) -> str:
         )
     matrix_html = "".join(matrix_cards) if matrix_cards else "<p>无</p>"
 
+    return f'<section class="section"><h2>六、覆盖矩阵</h2>{matrix_html}</section>'
+
+
+def _render_doc_integrated_matrix(integrated: List[Dict[str, Any]]) -> str:
     integrated_rows = []
     for idx, row in enumerate(integrated, start=1):
         cfg = row.get("key_configuration", {}) if isinstance(row, dict) and isinstance(row.get("key_configuration"), dict) else {}
@@ -660,6 +743,37 @@ def _render_design_document_html(record: Dict[str, Any]) -> str:
         else "<p>无</p>"
     )
 
+    return f'<section class="section"><h2>七、整合覆盖矩阵</h2>{integrated_table}</section>'
+
+
+def _render_doc_followups(design_notes: Any, de_scoped: Any, questions_to_ask: Any) -> str:
+    return f"""<section class="section"><h2>八、设计说明</h2>{_render_html_list(design_notes)}</section>
+      <section class="section">
+        <h2>九、范围裁剪与待跟进项</h2>
+        <div class="grid">
+          <div><h3>去范围项</h3>{_render_html_list(de_scoped)}</div>
+          <div><h3>待确认问题</h3>{_render_html_list(questions_to_ask)}</div>
+        </div>
+      </section>"""
+
+
+def _render_design_document_html(record: Dict[str, Any]) -> str:
+    """Renders the design document; each section is cached by a hash of its inputs, so a record update
+    (e.g. the testcases stage) only re-renders the sections whose inputs changed."""
+    requirement_input = record.get("requirement_input", []) or []
+    product_profile = record.get("product_profile", {}) if isinstance(record.get("product_profile"), dict) else {}
+    test_environments = record.get("test_environments", {}) if isinstance(record.get("test_environments"), dict) else {}
+    requirement_spec = record.get("requirement_spec", {}) if isinstance(record.get("requirement_spec"), dict) else {}
+    persona_reviews = record.get("persona_reviews", {}) if isinstance(record.get("persona_reviews"), dict) else {}
+    requirement_review_history = record.get("requirement_review_history", {}) if isinstance(record.get("requirement_review_history"), dict) else {}
+    test_design_spec = record.get("test_design_spec", {}) if isinstance(record.get("test_design_spec"), dict) else {}
+    reqs = requirement_spec.get("final_requirements", []) if isinstance(requirement_spec.get("final_requirements"), list) else []
+    objectives = test_design_spec.get("objectives", []) if isinstance(test_design_spec.get("objectives"), list) else []
+    matrices = test_design_spec.get("coverage_matrices", []) if isinstance(test_design_spec.get("coverage_matrices"), list) else []
+    integrated = test_design_spec.get("integrated_matrix", []) if isinstance(test_design_spec.get("integrated_matrix"), list) else []
+    title = record.get("title") or _history_title(requirement_input, requirement_spec)
+    updated_at = record.get("updated_at", "")
+
     profile_lines = []
     for item in product_profile.get("profile_display", []) if isinstance(product_profile.get("profile_display"), list) else []:
         if isinstance(item, dict):
@@ -668,8 +782,23 @@ def _render_design_document_html(record: Dict[str, Any]) -> str:
             if group and values:
                 profile_lines.append(f"{group}: {'、'.join(str(x) for x in values)}")
     test_environment_lines = _render_test_environment_lines(test_environments)
-    answered_question_table = _render_answered_question_table(requirement_review_history.get("answered_questions", []))
-
+    sections = [
+        design_doc_sections.render("background", _render_doc_background, requirement_input, profile_lines, test_environment_lines),
+        design_doc_sections.render("requirements", _render_doc_requirements, reqs),
+        design_doc_sections.render(
+            "reviews", _render_doc_reviews, persona_reviews, requirement_review_history.get("answered_questions", [])
+        ),
+        design_doc_sections.render("objectives", _render_doc_objectives, objectives),
+        design_doc_sections.render("matrices", _render_doc_matrices, matrices),
+        design_doc_sections.render("integrated_matrix", _render_doc_integrated_matrix, integrated),
+        design_doc_sections.render(
+            "followups",
+            _render_doc_followups,
+            test_design_spec.get("design_notes", []),
+            test_design_spec.get("de_scoped", []),
+            requirement_spec.get("questions_to_ask", []),
+        ),
+    ]
     return f"""<!DOCTYPE html>
 <html lang="zh-CN">
   <head>
@@ -707,32 +836,20 @@ def _render_design_document_html(record: Dict[str, Any]) -> str:
         <h2>一、文档信息</h2>
         {_render_html_kv_table([["记录ID", record.get("record_id", "")], ["最近更新时间", updated_at], ["当前状态", record.get("status", "")]])}
       </section>
-      <section class="section">
-        <h2>二、需求输入与产品背景</h2>
-        <div class="grid">
-          <div><h3>原始需求输入</h3>{_render_html_list(requirement_input)}</div>
-          <div><h3>产品通信背景与支持特性</h3>{_render_html_list(profile_lines)}</div>
-          <div><h3>测试团队可用测试环境</h3>{_render_html_list(test_environment_lines)}</div>
-        </div>
-      </section>
-      <section class="section"><h2>三、测试需求解读稿</h2>{req_table}</section>
-      <section class="section"><h2>四、三人评审记录</h2>{''.join(review_sections)}<section><h3>用户已确认问题</h3>{answered_question_table}</section></section>
-      <section class="section"><h2>五、测试目标</h2>{objective_table}</section>
-      <section class="section"><h2>六、覆盖矩阵</h2>{matrix_html}</section>
-      <section class="section"><h2>七、整合覆盖矩阵</h2>{integrated_table}</section>
-      <section class="section"><h2>八、设计说明</h2>{_render_html_list(test_design_spec.get("design_notes", []))}</section>
-      <section class="section">
-        <h2>九、范围裁剪与待跟进项</h2>
-        <div class="grid">
-          <div><h3>去范围项</h3>{_render_html_list(test_design_spec.get("de_scoped", []))}</div>
-          <div><h3>待确认问题</h3>{_render_html_list(requirement_spec.get("questions_to_ask", []))}</div>
-        </div>
-      </section>
+      {chr(10).join(sections)}
     </div>
   </body>
 </html>"""
 
 
+def _write_design_document(record_id: str, record: Dict[str, Any]):
+    write_precompressed(_history_document_path(record_id), _render_design_document_html(record))
+
+
+# Documents are rendered off the request path; a burst of updates to one record renders only the latest.
+design_doc_renderer = CoalescingRenderer(_write_design_document)
+
+
 def _write_design_history_record(record: Dict[str, Any]) -> Dict[str, Any]:
     record_id = str(record.get("record_id") or uuid.uuid4().hex[:12])
     now = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
@@ -744,7 +861,10 @@ def _write_design_history_record(record: Dict[str, Any]) -> Dict[str, Any]:
     record_dir = _history_record_dir(record_id)
     record_dir.mkdir(parents=True, exist_ok=True)
     _history_record_json_path(record_id).write_text(_safe_json_text(record), encoding="utf-8")
-    _history_document_path(record_id).write_text(_render_design_document_html(record), encoding="utf-8")
+    if design_doc_renderer.submit(record_id, dict(record)) is None:
+        # Shutting down: drop the stale document so it is rendered again on first request.
+        invalidate_precompressed(_history_document_path(record_id))
+    design_history_index.upsert(_history_summary(record))
     return record
 
 
@@ -807,16 +927,124 @@ def _upsert_design_history_record(
     return _write_design_history_record(record)
 
 
-def _list_design_history_records() -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    for path in sorted(design_history_dir.glob("*/record.json"), reverse=True):
+def _sync_design_history_index() -> int:
+    """Indexes records written before the index existed (or by hand) and drops rows whose record is gone."""
+    on_disk = {p.parent.name for p in design_history_dir.glob("*/record.json")}
+    indexed = set(design_history_index.record_ids())
+    for record_id in indexed - on_disk:
+        design_history_index.remove(record_id)
+    summaries: List[Dict[str, Any]] = []
+    for record_id in sorted(on_disk - indexed):
         try:
-            record = json.loads(path.read_text(encoding="utf-8"))
-            items.append(_history_summary(record))
+            record = json.loads(_history_record_json_path(record_id).read_text(encoding="utf-8"))
+            summaries.append(_history_summary(record))
         except Exception:
             continue
-    items.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-    return items
+    return design_history_index.upsert_many(summaries)
+
+
+_sync_design_history_index()
+
+
+def _list_design_history_records(**query: Any) -> tuple[int, List[Dict[str, Any]]]:
+    total, items = design_history_index.query(**query)
+    for item in items:
+        item["document_url"] = _history_document_url(item["record_id"])
+    return total, items
+
+
+@app.on_event("startup")
+async def load_rag_index():
+    # The BM25 postings can be large; load them on a worker thread before the first query needs them.
+    await asyncio.to_thread(rag_store.load_index)
+
+
+def _sweep_checkpoints() -> int:
+    """Deletes checkpoint files (and leftover temp files) not written for CHECKPOINT_TTL_S seconds."""
+    if CHECKPOINT_TTL_S <= 0:
+        return 0
+    cutoff = time.time() - CHECKPOINT_TTL_S
+    removed = 0
+    for path in Path(checkpoint_store.path).glob("*.json*"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+async def _sweep_checkpoints_periodically():
+    while True:
+        await asyncio.to_thread(_sweep_checkpoints)
+        await asyncio.sleep(CHECKPOINT_SWEEP_INTERVAL_S)
+
+
+@app.on_event("startup")
+async def start_checkpoint_sweeper():
+    app.state.checkpoint_sweeper = asyncio.create_task(_sweep_checkpoints_periodically())
+
+
+@app.on_event("shutdown")
+async def stop_checkpoint_sweeper():
+    app.state.checkpoint_sweeper.cancel()
+
+
+@app.on_event("shutdown")
+async def close_llm_transports():
+    await aclose_transports()
+
+
+@app.on_event("shutdown")
+def shutdown_job_store_writer():
+    # Flush queued state updates and events before the process exits.
+    job_store_writer.shutdown(wait=True)
+
+
+@app.on_event("shutdown")
+def shutdown_rag_ingest_pool():
+    rag_ingest_pool.shutdown(wait=False, cancel_futures=True)
+
+
+@app.on_event("shutdown")
+def shutdown_design_doc_renderer():
+    # Documents whose render was dropped are invalidated so the fixed URLs re-render from the saved records.
+    for record_id in design_doc_renderer.shutdown():
+        invalidate_precompressed(_history_document_path(record_id))
+
+
+@app.on_event("shutdown")
+def close_serial_sessions():
+    serial_sessions.close_all()
+
+
+@app.get("/api/llm/cache")
+def llm_cache_stats():
+    cache = get_default_cache()
+    return {"enabled": cache is not None, **(cache.stats() if cache else {})}
+
+
+@app.delete("/api/llm/cache")
+def llm_cache_clear():
+    cache = get_default_cache()
+    if cache is not None:
+        cache.clear()
+    return {"cleared": cache is not None}
+
+
+@app.get("/api/llm/limiter")
+def llm_limiter_stats():
+    return get_default_limiter().stats()
+
+
+@app.get("/api/jobs/stats")
+def job_store_stats():
+    return {
+        **job_store.stats(),
+        "live": {"stage": len(stage_jobs), "hitl": len(requirement_hitl_jobs), "rag_ingest": len(rag_ingest_jobs)},
+        "event_bus": event_bus.stats(),
+    }
 
 
 @app.get("/")
@@ -825,8 +1053,31 @@ def index():
 
 
 @app.get("/api/design-history")
-def list_design_history():
-    return {"items": _list_design_history_records()}
+def list_design_history(
+    offset: int = 0,
+    limit: int = 50,
+    sort: str = "updated_at",
+    order: str = "desc",
+    status: str = "",
+    has_testcases: Optional[bool] = None,
+    q: str = "",
+):
+    if sort not in HISTORY_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort必须是{'/'.join(HISTORY_SORT_COLUMNS)}")
+    if order not in {"asc", "desc"}:
+        raise HTTPException(status_code=400, detail="order必须是asc/desc")
+    offset = max(0, offset)
+    limit = max(1, min(500, limit))
+    total, items = _list_design_history_records(
+        offset=offset,
+        limit=limit,
+        sort=sort,
+        descending=order == "desc",
+        status=status.strip() or None,
+        has_testcases=has_testcases,
+        title_contains=q.strip() or None,
+    )
+    return {"items": items, "total": total, "offset": offset, "limit": limit}
 
 
 @app.get("/api/design-history/{record_id}")
@@ -840,12 +1091,42 @@ def get_design_history(record_id: str):
 
 
 @app.get("/api/design-history/{record_id}/document")
-def get_design_history_document(record_id: str):
-    record = _load_design_history_record(record_id)
+async def get_design_history_document(record_id: str, request: Request):
     html_path = _history_document_path(record_id)
-    if not html_path.exists():
-        html_path.write_text(_render_design_document_html(record), encoding="utf-8")
-    return FileResponse(html_path, media_type="text/html", filename=f"{record.get('title', record_id)}-测试设计文档.html")
+    summary = design_history_index.get(record_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="history记录不存在")
+    try:
+        # Wait out a queued render of this record, including follow-ups for updates made meanwhile.
+        fut = design_doc_renderer.pending(record_id)
+        while fut is not None:
+            await asyncio.wrap_future(fut)
+            fut = design_doc_renderer.pending(record_id)
+        meta = read_precompressed_meta(html_path)
+        if meta is None:
+            # Rendered by an older version (no compressed variants yet): render once now.
+            record = await asyncio.to_thread(_load_design_history_record, record_id)
+            fut = design_doc_renderer.submit(record_id, record)
+            if fut is not None:
+                await asyncio.wrap_future(fut)
+            meta = read_precompressed_meta(html_path)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"设计文档生成失败: {exc}")
+    if meta is None:
+        raise HTTPException(status_code=500, detail="设计文档生成失败")
+
+    encoding = pick_encoding(request.headers.get("accept-encoding", ""), meta.get("encodings", []))
+    etag = f'"{meta["etag"]}-{encoding}"' if encoding else f'"{meta["etag"]}"'
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if etag in {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}:
+        return Response(status_code=304, headers=headers)
+    path = html_path
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        path = html_path.with_name(html_path.name + DOC_ENCODINGS[encoding])
+    return FileResponse(path, media_type="text/html", filename=f"{summary.get('title') or record_id}-测试设计文档.html", headers=headers)
 
 
 def _build_effective_rag_context(requirements: List[str], manual_rag_context: str) -> tuple[str, List[Dict[str, Any]]]:
@@ -872,22 +1153,165 @@ def rag_docs():
     return {"docs": rag_store.list_docs()}
 
 
+async def _run_rag_ingest_job(job_id: str):
+    job = rag_ingest_jobs[job_id]
+    filename: str = job["filename"]
+    path: Path = job["path"]
+    loop = asyncio.get_running_loop()
+
+    def progress(phase: str, done: int, total: Optional[int]):
+        _publish_job_event(
+            job,
+            {"type": "progress", "payload": {"job_id": job_id, "phase": phase, "done": done, "total": total}},
+        )
+
+    await _emit_job_event(job, {"type": "job_started", "payload": {"job_id": job_id, "filename": filename}})
+    try:
+        if path.suffix.lower() == ".pdf":
+            total = await loop.run_in_executor(rag_ingest_pool, pdf_page_count, str(path))
+            futures = [
+                loop.run_in_executor(rag_ingest_pool, extract_pdf_pages, str(path), lo, lo + RAG_INGEST_PAGES_PER_TASK)
+                for lo in range(0, total, RAG_INGEST_PAGES_PER_TASK)
+            ]
+            done = 0
+            for fut in asyncio.as_completed(futures):
+                done += len(await fut)
+                progress("extract", done, total)
+            pending = collections.deque(futures)
+            del futures
+
+            def pdf_blocks():
+                # Hand page ranges to the chunker in order, releasing each one once consumed.
+                while pending:
+                    yield from pending.popleft().result()
+
+            blocks = pdf_blocks()
+        else:
+            blocks = iter_text_file(path)
+        # Chunks are produced lazily and written in batches, so only about one batch of text is held at a time.
+        meta = await asyncio.to_thread(
+            rag_store.add_document,
+            filename,
+            iter_chunks(blocks),
+            lambda done, total: loop.call_soon_threadsafe(progress, "store", done, total),
+        )
+        await _set_job_state(job, "completed", result=meta)
+        await _emit_job_event(job, {"type": "completed", "payload": {"job_id": job_id, "uploaded": meta}})
+    except Exception as exc:
+        await _set_job_state(job, "failed", error=f"文档入库失败: {exc}")
+        await _emit_job_event(job, {"type": "error", "payload": {"job_id": job_id, "error": job["error"]}})
+    finally:
+        path.unlink(missing_ok=True)
+        rag_ingest_jobs.pop(job_id, None)
+        event_bus.close(job_id)
+
+
+def _check_rag_upload_type(filename: str):
+    # Reject unsupported types up front instead of failing inside the job.
+    ext = Path(filename).suffix.lower()
+    if ext not in {".pdf", *RAG_TEXT_EXTENSIONS}:
+        raise HTTPException(status_code=400, detail=f"文档入库失败: 暂不支持的文档类型: {ext}（支持 txt/md/csv/json/log/yaml/xml/pdf）")
+
+
+async def _start_rag_ingest_job(filename: str, path: Path) -> Dict[str, Any]:
+    job_id = uuid.uuid4().hex[:12]
+    await _store_write(job_store.create, job_id, "rag_ingest", filename=filename, result=None, error=None)
+    rag_ingest_jobs[job_id] = {
+        "job_id": job_id,
+        "filename": filename,
+        "path": path,
+        "status": "running",
+    }
+    event_bus.open(job_id)
+    rag_ingest_jobs[job_id]["task"] = asyncio.create_task(_run_rag_ingest_job(job_id))
+    return {"job_id": job_id, "filename": filename, "status": "running"}
+
+
+def _spool_base64_upload(filename: str, content_base64: str) -> Path:
+    try:
+        content = base64.b64decode(content_base64)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"base64解析失败: {exc}")
+    if not content:
+        raise HTTPException(status_code=400, detail="文件内容为空")
+    fd, tmp_name = tempfile.mkstemp(prefix="rag-upload-", suffix=Path(filename).suffix.lower())
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return Path(tmp_name)
+
+
 @app.post("/api/rag/upload")
 async def rag_upload(payload: RAGUploadBase64Request):
     filename = (payload.filename or "").strip()
     if not filename:
         raise HTTPException(status_code=400, detail="filename不能为空")
+    _check_rag_upload_type(filename)
+    # Decoding and spooling a large payload is CPU and disk work; keep it off the event loop.
+    tmp_path = await asyncio.to_thread(_spool_base64_upload, filename, payload.content_base64)
+    return await _start_rag_ingest_job(filename, tmp_path)
+
+
+@app.post("/api/rag/upload-stream")
+async def rag_upload_stream(request: Request, filename: str = ""):
+    """Raw-body upload: the file bytes are the request body, spooled to disk as they arrive."""
+    filename = (filename or unquote(request.headers.get("x-filename", ""))).strip()
+    if not filename:
+        raise HTTPException(status_code=400, detail="filename不能为空")
+    _check_rag_upload_type(filename)
+    fd, tmp_name = tempfile.mkstemp(prefix="rag-upload-", suffix=Path(filename).suffix.lower())
+    tmp_path = Path(tmp_name)
+    size = 0
     try:
-        content = base64.b64decode(payload.content_base64)
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=f"base64解析失败: {exc}")
-    if not content:
+        with os.fdopen(fd, "wb") as f:
+            async for block in request.stream():
+                size += len(block)
+                if size > RAG_UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"文件超过上传上限 {RAG_UPLOAD_MAX_BYTES // (1024 * 1024)}MB")
+                f.write(block)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    if not size:
+        tmp_path.unlink(missing_ok=True)
         raise HTTPException(status_code=400, detail="文件内容为空")
-    try:
-        meta = rag_store.ingest_file(filename, content)
-        return {"uploaded": meta}
-    except Exception as exc:
-        raise HTTPException(status_code=400, detail=f"文档入库失败: {exc}")
+    return await _start_rag_ingest_job(filename, tmp_path)
+
+
+@app.get("/api/rag/jobs/{job_id}/state")
+def rag_job_state(job_id: str):
+    job = job_store.get(job_id, "rag_ingest")
+    if not job:
+        raise HTTPException(status_code=404, detail="job不存在")
+    return {
+        "job_id": job_id,
+        "filename": job.get("filename"),
+        "status": job.get("status"),
+        "result": job.get("result"),
+        "error": job.get("error"),
+    }
+
+
+@app.get("/api/rag/jobs/{job_id}/stream")
+async def rag_job_stream(job_id: str, request: Request):
+    job = job_store.get(job_id, "rag_ingest")
+    if not job:
+        raise HTTPException(status_code=404, detail="job不存在")
+    after = _last_event_id(request)
+
+    async def event_generator():
+        init_payload = {
+            "job_id": job_id,
+            "filename": job.get("filename"),
+            "status": job.get("status"),
+            "error": job.get("error"),
+        }
+        if not after:
+            yield sse_frame({"type": "state", "payload": init_payload})
+        replay = 1 if job.get("status") in TERMINAL_STATUSES else 20
+        async for _, _, frame in _iter_job_events(job_id, after, replay=replay):
+            yield frame
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
 @app.post("/api/rag/upload-base64")
@@ -902,7 +1326,7 @@ async def chat(payload: ChatRequest):
     if not message:
         raise HTTPException(status_code=400, detail="message不能为空")
 
-    client = LLMClient()
+    client = LLMClient(use_cache=False)
     if not client.enabled:
         return {"reply": "LLM未配置。请先设置 LLM_API_BASE / LLM_API_KEY / LLM_MODEL。"}
 
@@ -918,7 +1342,7 @@ async def chat(payload: ChatRequest):
         + f"用户最新问题:\n{message}\n\n请直接回答，简洁、准确、可执行。"
     )
     try:
-        reply = client.generate(
+        reply = await client.agenerate(
             system_prompt="You are a helpful website chatbot. Be concise, accurate, and actionable.",
             user_prompt=user_prompt,
             temperature=0.3,
@@ -934,7 +1358,7 @@ async def agentic_coding_chat(payload: AgenticCodingChatRequest):
     if not message:
         raise HTTPException(status_code=400, detail="message不能为空")
 
-    client = LLMClient()
+    client = LLMClient(use_cache=False)
     if not client.enabled:
         return {"reply": "LLM未配置。请先设置 LLM_API_BASE / LLM_API_KEY / LLM_MODEL。"}
 
@@ -958,7 +1382,7 @@ async def agentic_coding_chat(payload: AgenticCodingChatRequest):
         + f"用户最新问题:\n{message}"
     )
     try:
-        reply = client.generate(
+        reply = await client.agenerate(
             system_prompt="You are a senior test automation engineer for agentic coding. Be concrete and code-first.",
             user_prompt=user_prompt,
             temperature=0.2,
@@ -973,7 +1397,7 @@ async def generate(payload: GenerateRequest):
     if not reqs:
         raise HTTPException(status_code=400, detail="requirements不能为空")
 
-    effective_rag_context, rag_hits = _build_effective_rag_context(reqs, payload.rag_context.strip())
+    effective_rag_context, rag_hits = await asyncio.to_thread(_build_effective_rag_context, reqs, payload.rag_context.strip())
     shared = {
         "input_requirements": reqs,
         "rag_context": effective_rag_context,
@@ -983,21 +1407,22 @@ async def generate(payload: GenerateRequest):
         "capabilities": payload.capabilities or DEFAULT_CAPABILITIES,
         "action_vocabulary": payload.action_vocabulary or DEFAULT_ACTION_VOCABULARY,
         "assertion_vocabulary": payload.assertion_vocabulary or DEFAULT_ASSERTION_VOCABULARY,
-        "llm_client": LLMClient(),
+        "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"req-{uuid.uuid4().hex[:8]}"),
         "warnings": [],
         "trace": [],
         "review_feedback": "",
     }
 
-    flow = create_system_test_flow()
+    flow = create_system_test_flow(checkpoint_store)
     try:
-        await flow.run_async(shared)
+        await _run_checkpointed(flow, shared, payload.resume_from)
     except Exception as exc:
         raise HTTPException(
             status_code=500,
             detail={
                 "error": str(exc),
                 "failed_node": shared.get("current_node"),
+                "checkpoint_id": flow.checkpoint_id,
                 "trace": shared.get("trace", []),
                 "warnings": shared.get("warnings", []),
             },
@@ -1040,45 +1465,67 @@ def _collect_open_questions(persona_reviews: Dict[str, Any]) -> List[Dict[str, s
     return out
 
 
-async def _emit_hitl_event(job: Dict[str, Any], ev: Dict[str, Any]):
-    """Broadcast HITL events to internal control queue and all SSE subscribers."""
-    control_q: asyncio.Queue = job["queue"]
-    await control_q.put(ev)
-    job.setdefault("recent_events", []).append(ev)
-    if len(job["recent_events"]) > 80:
-        job["recent_events"] = job["recent_events"][-80:]
+async def _run_checkpointed(flow: Any, shared: Dict[str, Any], resume_from: str = ""):
+    """Runs `flow` with checkpoints, resuming from `resume_from` if that checkpoint still exists."""
+    if resume_from and await asyncio.to_thread(checkpoint_store.load, resume_from) is None:
+        shared.setdefault("warnings", []).append(f"断点 {resume_from} 不存在，已从头执行")
+        resume_from = ""
+    await flow.run_async(shared, resume_from=resume_from or None)
+    await asyncio.to_thread(checkpoint_store.delete, flow.checkpoint_id)
 
-    stale: List[asyncio.Queue] = []
-    for sub_q in job.get("subscribers", []) or []:
-        try:
-            sub_q.put_nowait(ev)
-        except Exception:
-            stale.append(sub_q)
-    if stale:
-        job["subscribers"] = [q for q in (job.get("subscribers", []) or []) if q not in stale]
 
+def _store_job_event(job_id: str, ev: Dict[str, Any]) -> Optional[int]:
+    # Token deltas are only useful live; keep them out of the log.
+    return None if ev.get("type") == "token_delta" else job_store.append_event(job_id, ev)
 
-async def _emit_stage_event(job: Dict[str, Any], ev: Dict[str, Any]):
-    """Broadcast stage events to all subscribers and keep a short replay window."""
-    control_q: asyncio.Queue = job["queue"]
-    await control_q.put(ev)
-    job.setdefault("recent_events", []).append(ev)
-    if len(job["recent_events"]) > 120:
-        job["recent_events"] = job["recent_events"][-120:]
 
-    stale: List[asyncio.Queue] = []
-    for sub_q in job.get("subscribers", []) or []:
-        try:
-            sub_q.put_nowait(ev)
-        except Exception:
-            stale.append(sub_q)
-    if stale:
-        job["subscribers"] = [q for q in (job.get("subscribers", []) or []) if q not in stale]
+def _publish_stored_event(job_id: str, ev: Dict[str, Any], fut: "asyncio.Future[Optional[int]]"):
+    if not fut.cancelled() and fut.exception() is None:
+        event_bus.publish(job_id, ev, fut.result())
+
+
+def _publish_job_event(job: Dict[str, Any], ev: Dict[str, Any]) -> "asyncio.Future[Optional[int]]":
+    """Appends `ev` to the job's stored log on the writer thread, then fans it out on the event bus.
+
+    Call it on the event loop; it is usable as a node event sink. Events reach the bus in the order they
+    were emitted, since every one of them (token deltas included) passes through the single writer.
+    """
+    fut = asyncio.get_running_loop().run_in_executor(job_store_writer, _store_job_event, job["job_id"], ev)
+    fut.add_done_callback(functools.partial(_publish_stored_event, job["job_id"], ev))
+    return fut
+
+
+async def _emit_job_event(job: Dict[str, Any], ev: Dict[str, Any]):
+    """Like _publish_job_event, but returns once the event is stored and published."""
+    await _publish_job_event(job, ev)
+
+
+async def _store_write(fn: Any, *args: Any, **kwargs: Any) -> Any:
+    """Runs a job store write on the writer thread, after every write queued before it."""
+    return await asyncio.get_running_loop().run_in_executor(job_store_writer, functools.partial(fn, *args, **kwargs))
+
+
+async def _set_job_state(job: Dict[str, Any], status: Optional[str] = None, **fields: Any):
+    """Updates the live job and its stored state, which is what other workers see."""
+    if status is not None:
+        job["status"] = status
+    job.update(fields)
+    await _store_write(job_store.update, job["job_id"], status=status, **fields)
+
+
+def _last_event_id(request: Request) -> int:
+    """Resume point of a reconnecting EventSource (Last-Event-ID header, or ?last_event_id= for manual resumes)."""
+    raw = request.headers.get("last-event-id") or request.query_params.get("last_event_id") or ""
+    return int(raw) if raw.strip().isdigit() else 0
+
+
+def _iter_job_events(job_id: str, after: int = 0, replay: Optional[int] = None):
+    """Follows a job's events from this worker's event bus or, failing that, the job store."""
+    return follow_job_events(event_bus, job_store, job_id, after, replay=replay, poll_s=JOB_POLL_S)
 
 
 async def _run_requirement_hitl_job(job_id: str):
     job = requirement_hitl_jobs[job_id]
-    queue: asyncio.Queue = job["queue"]
     reqs: List[str] = job["requirements"]
     rag_context: str = job["rag_context"]
     framework_capability_catalog: str = job["framework_capability_catalog"]
@@ -1087,7 +1534,7 @@ async def _run_requirement_hitl_job(job_id: str):
 
     try:
         for round_no in range(1, 4):
-            effective_rag_context, rag_hits = _build_effective_rag_context(reqs, rag_context)
+            effective_rag_context, rag_hits = await asyncio.to_thread(_build_effective_rag_context, reqs, rag_context)
             shared = {
                 "input_requirements": reqs,
                 "rag_context": effective_rag_context,
@@ -1097,11 +1544,10 @@ async def _run_requirement_hitl_job(job_id: str):
                 "capabilities": DEFAULT_CAPABILITIES,
                 "action_vocabulary": DEFAULT_ACTION_VOCABULARY,
                 "assertion_vocabulary": DEFAULT_ASSERTION_VOCABULARY,
-                "llm_client": LLMClient(),
+                "llm_client": LLMClient(use_cache=not job.get("bypass_cache", False), job_key=f"hitl-{job_id}"),
                 "warnings": [],
                 "trace": [],
                 "review_feedback": job.get("review_feedback", ""),
-                "event_queue": queue,
             }
             flow = create_requirement_analysis_flow()
             await flow.run_async(shared)
@@ -1132,27 +1578,23 @@ async def _run_requirement_hitl_job(job_id: str):
                 "trace": shared.get("trace", []),
                 "rag": {"hits": rag_hits, "context_used": bool(effective_rag_context)},
             }
-            job["last_payload"] = round_payload
-            job["round"] = round_no
-            job["status"] = "round_ready"
-            await _emit_hitl_event(job, {"type": "round_ready", "payload": round_payload})
+            await _set_job_state(job, "round_ready", last_payload=round_payload, round=round_no)
+            await _emit_job_event(job, {"type": "round_ready", "payload": round_payload})
 
             if round_no >= 3:
-                job["status"] = "completed"
-                await _emit_hitl_event(job, {"type": "completed", "payload": round_payload})
+                await _set_job_state(job, "completed")
+                await _emit_job_event(job, {"type": "completed", "payload": round_payload})
                 return
 
-            job["status"] = "waiting_answers"
-            await _emit_hitl_event(
+            await _set_job_state(job, "waiting_answers")
+            await _emit_job_event(
                 job,
                 {
                     "type": "waiting_answers",
                     "payload": {"job_id": job_id, "round": round_no, "open_questions": round_payload["open_questions"]},
                 }
             )
-            await job["answer_event"].wait()
-            job["answer_event"].clear()
-            answers = job.get("pending_answers", {}) or {}
+            answers = await _wait_hitl_answers(job)
             if answers:
                 job["answered_questions"] = _merge_answered_questions(
                     job.get("answered_questions", []),
@@ -1167,28 +1609,44 @@ async def _run_requirement_hitl_job(job_id: str):
             if answer_lines:
                 fb_parts.append("【用户补充回答】" + " | ".join(answer_lines))
             job["review_feedback"] = "\n".join(fb_parts).strip()
-            job["pending_answers"] = {}
 
     except Exception as exc:
-        job["status"] = "failed"
-        job["error"] = str(exc)
-        await _emit_hitl_event(job, {"type": "error", "payload": {"job_id": job_id, "error": str(exc)}})
+        await _set_job_state(job, "failed", error=str(exc))
+        await _emit_job_event(job, {"type": "error", "payload": {"job_id": job_id, "error": str(exc)}})
+    finally:
+        requirement_hitl_jobs.pop(job_id, None)
+        event_bus.close(job_id)
 
 
-async def _wait_hitl_round(job_id: str, timeout_s: int = 180):
-    job = requirement_hitl_jobs.get(job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="job不存在")
-    queue: asyncio.Queue = job["queue"]
-    try:
-        while True:
-            ev = await asyncio.wait_for(queue.get(), timeout=timeout_s)
+async def _wait_hitl_answers(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Waits for /next: set locally through answer_event, or stored as pending_answers by another worker."""
+    while True:
+        try:
+            await asyncio.wait_for(job["answer_event"].wait(), timeout=1.0)
+        except asyncio.TimeoutError:
+            state = await asyncio.to_thread(job_store.get, job["job_id"])
+            if state is None or state.get("pending_answers") is None:
+                continue
+            job["pending_answers"] = state["pending_answers"]
+        job["answer_event"].clear()
+        answers = job.get("pending_answers") or {}
+        await _set_job_state(job, pending_answers=None)
+        return answers
+
+
+async def _wait_hitl_round(job_id: str, after_round: int = 0, timeout_s: int = 180):
+    async def next_round():
+        async for _, ev, _ in _iter_job_events(job_id):
             et = ev.get("type")
-            if et in {"round_ready", "completed"}:
+            if et in {"round_ready", "completed"} and (ev.get("payload", {}) or {}).get("round", 0) > after_round:
                 return ev.get("payload", {})
             if et == "error":
                 msg = ev.get("payload", {}).get("error", "unknown error")
                 raise HTTPException(status_code=500, detail=f"HITL执行失败: {msg}")
+        raise HTTPException(status_code=404, detail="job不存在")
+
+    try:
+        return await asyncio.wait_for(next_round(), timeout=timeout_s)
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="等待HITL结果超时")
 
@@ -1200,8 +1658,6 @@ async def hitl_requirements_start(payload: RequirementHITLStartRequest):
         raise HTTPException(status_code=400, detail="requirements不能为空")
 
     job_id = uuid.uuid4().hex[:12]
-    queue: asyncio.Queue = asyncio.Queue()
-    answer_event = asyncio.Event()
     modes = [m for m in (payload.automation_modes or []) if m]
     auto_lines = []
     if modes:
@@ -1214,6 +1670,7 @@ async def hitl_requirements_start(payload: RequirementHITLStartRequest):
         [x for x in [payload.framework_capability_catalog.strip(), "\n".join(auto_lines).strip()] if x]
     )
 
+    await _store_write(job_store.create, job_id, "hitl", status="starting", round=0, last_payload=None, error="", pending_answers=None)
     requirement_hitl_jobs[job_id] = {
         "job_id": job_id,
         "status": "starting",
@@ -1223,17 +1680,14 @@ async def hitl_requirements_start(payload: RequirementHITLStartRequest):
         "framework_capability_catalog": framework_capability_catalog,
         "product_profile": payload.product_profile or {},
         "test_environments": payload.test_environments or {},
+        "bypass_cache": payload.bypass_cache,
         "review_feedback": "",
         "round_summaries": [],
         "answered_questions": [],
-        "pending_answers": {},
-        "answer_event": answer_event,
-        "queue": queue,
-        "subscribers": [],
-        "recent_events": [],
-        "last_payload": None,
-        "error": "",
+        "pending_answers": None,
+        "answer_event": asyncio.Event(),
     }
+    event_bus.open(job_id)
     requirement_hitl_jobs[job_id]["task"] = asyncio.create_task(_run_requirement_hitl_job(job_id))
     first = await _wait_hitl_round(job_id)
     return first
@@ -1241,22 +1695,28 @@ async def hitl_requirements_start(payload: RequirementHITLStartRequest):
 
 @app.post("/api/hitl/requirements/{job_id}/next")
 async def hitl_requirements_next(job_id: str, payload: RequirementHITLNextRequest):
-    job = requirement_hitl_jobs.get(job_id)
+    job = job_store.get(job_id, "hitl")
     if not job:
         raise HTTPException(status_code=404, detail="job不存在")
     if job.get("status") not in {"waiting_answers", "round_ready"}:
         if job.get("status") == "completed":
             return job.get("last_payload") or {"job_id": job_id, "is_final_round": True}
         raise HTTPException(status_code=409, detail=f"当前状态不允许next: {job.get('status')}")
-    job["pending_answers"] = payload.open_question_answers or {}
-    job["answer_event"].set()
-    nxt = await _wait_hitl_round(job_id)
+    answers = payload.open_question_answers or {}
+    live = requirement_hitl_jobs.get(job_id)
+    if live is not None:
+        live["pending_answers"] = answers
+        live["answer_event"].set()
+    else:
+        # The job runs in another worker, which picks the answers up from the store.
+        await _store_write(job_store.update, job_id, pending_answers=answers)
+    nxt = await _wait_hitl_round(job_id, after_round=job.get("round", 0))
     return nxt
 
 
 @app.get("/api/hitl/requirements/{job_id}/state")
 def hitl_requirements_state(job_id: str):
-    job = requirement_hitl_jobs.get(job_id)
+    job = job_store.get(job_id, "hitl")
     if not job:
         raise HTTPException(status_code=404, detail="job不存在")
     return {
@@ -1269,36 +1729,23 @@ def hitl_requirements_state(job_id: str):
 
 
 @app.get("/api/hitl/requirements/{job_id}/stream")
-async def hitl_requirements_stream(job_id: str):
-    job = requirement_hitl_jobs.get(job_id)
+async def hitl_requirements_stream(job_id: str, request: Request):
+    job = job_store.get(job_id, "hitl")
     if not job:
         raise HTTPException(status_code=404, detail="job不存在")
-
-    sub_q: asyncio.Queue = asyncio.Queue()
-    subscribers = job.setdefault("subscribers", [])
-    subscribers.append(sub_q)
+    after = _last_event_id(request)
 
     async def event_generator():
-        try:
-            init_payload = {
-                "job_id": job_id,
-                "status": job.get("status"),
-                "round": job.get("round", 0),
-                "error": job.get("error", ""),
-            }
-            yield f"data: {json.dumps({'type': 'state', 'payload': init_payload}, ensure_ascii=False)}\n\n"
-
-            for ev in job.get("recent_events", [])[-20:]:
-                yield f"data: {json.dumps(ev, ensure_ascii=False)}\n\n"
-
-            while True:
-                ev = await sub_q.get()
-                yield f"data: {json.dumps(ev, ensure_ascii=False)}\n\n"
-                if ev.get("type") in {"completed", "error"}:
-                    break
-        finally:
-            if sub_q in (job.get("subscribers", []) or []):
-                job["subscribers"] = [q for q in job.get("subscribers", []) if q is not sub_q]
+        init_payload = {
+            "job_id": job_id,
+            "status": job.get("status"),
+            "round": job.get("round", 0),
+            "error": job.get("error", ""),
+        }
+        if not after:
+            yield sse_frame({"type": "state", "payload": init_payload})
+        async for _, _, frame in _iter_job_events(job_id, after, replay=20):
+            yield frame
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -1307,10 +1754,11 @@ async def _run_stage_job(job_id: str):
     job = stage_jobs[job_id]
     stage = job["stage"]
     payload: StageGenerateRequest = job["payload"]
-    queue: asyncio.Queue = job["queue"]
 
-    await _emit_stage_event(job, {"type": "job_started", "payload": {"job_id": job_id, "stage": stage}})
+    await _emit_job_event(job, {"type": "job_started", "payload": {"job_id": job_id, "stage": stage}})
 
+    flow: Any = None
+    shared: Optional[Dict[str, Any]] = None
     try:
         if stage == "design":
             shared = {
@@ -1320,13 +1768,14 @@ async def _run_stage_job(job_id: str):
                 "requirement_review_history": payload.requirement_review_history or {},
                 "product_profile": payload.product_profile or {},
                 "test_environments": payload.test_environments or {},
-                "llm_client": LLMClient(),
+                "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"stage-{job_id}"),
                 "warnings": [],
                 "trace": [],
-                "event_queue": queue,
+                "event_sink": functools.partial(_publish_job_event, job),
+                "event_loop": asyncio.get_running_loop(),
             }
-            flow = create_test_design_flow()
-            await flow.run_async(shared)
+            flow = create_test_design_flow(checkpoint_store)
+            await _run_checkpointed(flow, shared, payload.resume_from)
             history_record = _upsert_design_history_record(
                 record_id=payload.history_record_id or "",
                 requirement_input=payload.requirement_input or [],
@@ -1357,13 +1806,14 @@ async def _run_stage_job(job_id: str):
                 "product_profile": payload.product_profile or {},
                 "test_environments": payload.test_environments or {},
                 "action_vocabulary": payload.action_vocabulary or DEFAULT_ACTION_VOCABULARY,
-                "llm_client": LLMClient(),
+                "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"stage-{job_id}"),
                 "warnings": [],
                 "trace": [],
-                "event_queue": queue,
+                "event_sink": functools.partial(_publish_job_event, job),
+                "event_loop": asyncio.get_running_loop(),
             }
-            flow = create_test_case_flow()
-            await flow.run_async(shared)
+            flow = create_test_case_flow(checkpoint_store)
+            await _run_checkpointed(flow, shared, payload.resume_from)
             history_record = _upsert_design_history_record(
                 record_id=payload.history_record_id or "",
                 requirement_input=payload.requirement_input or [],
@@ -1393,13 +1843,14 @@ async def _run_stage_job(job_id: str):
                 "test_environments": payload.test_environments or {},
                 "capabilities": payload.capabilities or DEFAULT_CAPABILITIES,
                 "assertion_vocabulary": payload.assertion_vocabulary or DEFAULT_ASSERTION_VOCABULARY,
-                "llm_client": LLMClient(),
+                "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"stage-{job_id}"),
                 "warnings": [],
                 "trace": [],
-                "event_queue": queue,
+                "event_sink": functools.partial(_publish_job_event, job),
+                "event_loop": asyncio.get_running_loop(),
             }
-            flow = create_script_flow()
-            await flow.run_async(shared)
+            flow = create_script_flow(checkpoint_store)
+            await _run_checkpointed(flow, shared, payload.resume_from)
             result = {
                 "script_spec": shared.get("script_spec", {}),
                 "test_code_reference": shared.get("test_code_reference", ""),
@@ -1409,25 +1860,27 @@ async def _run_stage_job(job_id: str):
         else:
             raise RuntimeError(f"不支持的stage: {stage}")
 
-        job["status"] = "completed"
-        job["result"] = result
-        await _emit_stage_event(
+        await _set_job_state(job, "completed", result=result)
+        await _emit_job_event(
             job,
             {"type": "completed", "payload": {"job_id": job_id, "stage": stage, "result": result}},
         )
     except Exception as exc:
-        job["status"] = "failed"
         detail = {
             "error": str(exc),
-            "failed_node": (locals().get("shared") or {}).get("current_node"),
-            "trace": (locals().get("shared") or {}).get("trace", []),
-            "warnings": (locals().get("shared") or {}).get("warnings", []),
+            "failed_node": (shared or {}).get("current_node"),
+            "checkpoint_id": flow.checkpoint_id if flow is not None else None,
+            "trace": (shared or {}).get("trace", []),
+            "warnings": (shared or {}).get("warnings", []),
         }
-        job["error"] = detail
-        await _emit_stage_event(
+        await _set_job_state(job, "failed", error=detail)
+        await _emit_job_event(
             job,
             {"type": "error", "payload": {"job_id": job_id, "stage": stage, **detail}},
         )
+    finally:
+        stage_jobs.pop(job_id, None)
+        event_bus.close(job_id)
 
 
 @app.post("/api/stage/{stage}/start")
@@ -1444,25 +1897,21 @@ async def stage_start(stage: str, payload: StageGenerateRequest):
         raise HTTPException(status_code=400, detail="缺少test_case_spec")
 
     job_id = uuid.uuid4().hex[:12]
-    q: asyncio.Queue = asyncio.Queue()
+    await _store_write(job_store.create, job_id, "stage", stage=stage_name, result=None, error=None)
     stage_jobs[job_id] = {
         "job_id": job_id,
         "stage": stage_name,
         "status": "running",
         "payload": payload,
-        "queue": q,
-        "subscribers": [],
-        "recent_events": [],
-        "result": None,
-        "error": None,
     }
+    event_bus.open(job_id)
     stage_jobs[job_id]["task"] = asyncio.create_task(_run_stage_job(job_id))
     return {"job_id": job_id, "stage": stage_name, "status": "running"}
 
 
 @app.get("/api/stage/{job_id}/state")
 def stage_state(job_id: str):
-    job = stage_jobs.get(job_id)
+    job = job_store.get(job_id, "stage")
     if not job:
         raise HTTPException(status_code=404, detail="job不存在")
     return {
@@ -1475,11 +1924,11 @@ def stage_state(job_id: str):
 
 
 @app.get("/api/stage/{job_id}/stream")
-async def stage_stream(job_id: str):
-    job = stage_jobs.get(job_id)
+async def stage_stream(job_id: str, request: Request):
+    job = job_store.get(job_id, "stage")
     if not job:
         raise HTTPException(status_code=404, detail="job不存在")
-    queue: asyncio.Queue = job["queue"]
+    after = _last_event_id(request)
 
     async def event_generator():
         init_payload = {
@@ -1488,15 +1937,10 @@ async def stage_stream(job_id: str):
             "status": job.get("status"),
             "error": job.get("error"),
         }
-        yield f"data: {json.dumps({'type': 'state', 'payload': init_payload}, ensure_ascii=False)}\n\n"
-        for ev in job.get("recent_events", [])[-40:]:
-            yield f"data: {json.dumps(ev, ensure_ascii=False)}\n\n"
-
-        while True:
-            ev = await queue.get()
-            yield f"data: {json.dumps(ev, ensure_ascii=False)}\n\n"
-            if ev.get("type") in {"completed", "error"}:
-                break
+        if not after:
+            yield sse_frame({"type": "state", "payload": init_payload})
+        async for _, _, frame in _iter_job_events(job_id, after, replay=40):
+            yield frame
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -1520,7 +1964,7 @@ async def requirements_analyze(payload: RequirementRoundRequest):
                 fb_parts.append("【用户补充回答】" + " | ".join(answers))
         review_feedback = "\n".join(fb_parts).strip()
 
-    effective_rag_context, rag_hits = _build_effective_rag_context(reqs, payload.rag_context.strip())
+    effective_rag_context, rag_hits = await asyncio.to_thread(_build_effective_rag_context, reqs, payload.rag_context.strip())
 
     shared = {
         "input_requirements": reqs,
@@ -1531,7 +1975,7 @@ async def requirements_analyze(payload: RequirementRoundRequest):
         "capabilities": DEFAULT_CAPABILITIES,
         "action_vocabulary": DEFAULT_ACTION_VOCABULARY,
         "assertion_vocabulary": DEFAULT_ASSERTION_VOCABULARY,
-        "llm_client": LLMClient(),
+        "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"req-{uuid.uuid4().hex[:8]}"),
         "warnings": [],
         "trace": [],
         "review_feedback": review_feedback,
@@ -1575,19 +2019,20 @@ async def design_generate(payload: StageGenerateRequest):
         "requirement_review_history": payload.requirement_review_history or {},
         "product_profile": payload.product_profile or {},
         "test_environments": payload.test_environments or {},
-        "llm_client": LLMClient(),
+        "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"req-{uuid.uuid4().hex[:8]}"),
         "warnings": [],
         "trace": [],
     }
-    flow = create_test_design_flow()
+    flow = create_test_design_flow(checkpoint_store)
     try:
-        await flow.run_async(shared)
+        await _run_checkpointed(flow, shared, payload.resume_from)
     except Exception as exc:
         raise HTTPException(
             status_code=500,
             detail={
                 "error": str(exc),
                 "failed_node": shared.get("current_node"),
+                "checkpoint_id": flow.checkpoint_id,
                 "trace": shared.get("trace", []),
                 "warnings": shared.get("warnings", []),
             },
@@ -1625,19 +2070,20 @@ async def testcases_generate(payload: StageGenerateRequest):
         "product_profile": payload.product_profile or {},
         "test_environments": payload.test_environments or {},
         "action_vocabulary": payload.action_vocabulary or DEFAULT_ACTION_VOCABULARY,
-        "llm_client": LLMClient(),
+        "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"req-{uuid.uuid4().hex[:8]}"),
         "warnings": [],
         "trace": [],
     }
-    flow = create_test_case_flow()
+    flow = create_test_case_flow(checkpoint_store)
     try:
-        await flow.run_async(shared)
+        await _run_checkpointed(flow, shared, payload.resume_from)
     except Exception as exc:
         raise HTTPException(
             status_code=500,
             detail={
                 "error": str(exc),
                 "failed_node": shared.get("current_node"),
+                "checkpoint_id": flow.checkpoint_id,
                 "trace": shared.get("trace", []),
                 "warnings": shared.get("warnings", []),
             },
@@ -1674,19 +2120,20 @@ async def scripts_generate(payload: StageGenerateRequest):
         "test_environments": payload.test_environments or {},
         "capabilities": payload.capabilities or DEFAULT_CAPABILITIES,
         "assertion_vocabulary": payload.assertion_vocabulary or DEFAULT_ASSERTION_VOCABULARY,
-        "llm_client": LLMClient(),
+        "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"req-{uuid.uuid4().hex[:8]}"),
         "warnings": [],
         "trace": [],
     }
-    flow = create_script_flow()
+    flow = create_script_flow(checkpoint_store)
     try:
-        await flow.run_async(shared)
+        await _run_checkpointed(flow, shared, payload.resume_from)
     except Exception as exc:
         raise HTTPException(
             status_code=500,
             detail={
                 "error": str(exc),
                 "failed_node": shared.get("current_node"),
+                "checkpoint_id": flow.checkpoint_id,
                 "trace": shared.get("trace", []),
                 "warnings": shared.get("warnings", []),
             },
@@ -1705,7 +2152,7 @@ async def generate_stream(payload: GenerateRequest):
     if not reqs:
         raise HTTPException(status_code=400, detail="requirements不能为空")
 
-    effective_rag_context, rag_hits = _build_effective_rag_context(reqs, payload.rag_context.strip())
+    effective_rag_context, rag_hits = await asyncio.to_thread(_build_effective_rag_context, reqs, payload.rag_context.strip())
     queue: asyncio.Queue = asyncio.Queue()
     shared = {
         "input_requirements": reqs,
@@ -1716,18 +2163,19 @@ async def generate_stream(payload: GenerateRequest):
         "capabilities": payload.capabilities or DEFAULT_CAPABILITIES,
         "action_vocabulary": payload.action_vocabulary or DEFAULT_ACTION_VOCABULARY,
         "assertion_vocabulary": payload.assertion_vocabulary or DEFAULT_ASSERTION_VOCABULARY,
-        "llm_client": LLMClient(),
+        "llm_client": LLMClient(use_cache=not payload.bypass_cache, job_key=f"req-{uuid.uuid4().hex[:8]}"),
         "warnings": [],
         "trace": [],
         "event_queue": queue,
+        "event_loop": asyncio.get_running_loop(),
         "review_feedback": "",
     }
 
-    flow = create_system_test_flow()
+    flow = create_system_test_flow(checkpoint_store)
 
     async def runner():
         try:
-            await flow.run_async(shared)
+            await _run_checkpointed(flow, shared, payload.resume_from)
         except Exception as exc:
             await queue.put(
                 {
@@ -1735,6 +2183,7 @@ async def generate_stream(payload: GenerateRequest):
                     "payload": {
                         "error": str(exc),
                         "failed_node": shared.get("current_node"),
+                        "checkpoint_id": flow.checkpoint_id,
                         "trace": shared.get("trace", []),
                         "warnings": shared.get("warnings", []),
                     },
@@ -1870,13 +2319,59 @@ def save_prompts(payload: PromptSettingsRequest):
     return {"message": "saved", "count": len(payload.prompts)}
 
 
-@app.post("/api/export/testcases.xlsx")
-def export_testcases_excel(payload: ExportTestCasesRequest):
+def _export_list_to_text(v: Any) -> str:
+    if isinstance(v, list):
+        return "\n".join([str(x) for x in v])
+    if v is None:
+        return ""
+    return str(v)
+
+
+def _export_safe_json(v: Any) -> str:
     try:
-        from openpyxl import Workbook
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"缺少openpyxl依赖: {exc}")
+        return json.dumps(v, ensure_ascii=False)
+    except Exception:
+        return str(v)
+
 
+def _export_json_pieces(v: Any, depth: int = 2) -> Iterator[str]:
+    # Split only the outer containers; leaves go through the C encoder, which iterencode would bypass.
+    if depth and isinstance(v, dict) and v:
+        yield "{"
+        for i, (k, item) in enumerate(v.items()):
+            yield (", " if i else "") + json.dumps(str(k), ensure_ascii=False) + ": "
+            yield from _export_json_pieces(item, depth - 1)
+        yield "}"
+    elif depth and isinstance(v, list) and v:
+        yield "["
+        for i, item in enumerate(v):
+            if i:
+                yield ", "
+            yield from _export_json_pieces(item, depth - 1)
+        yield "]"
+    else:
+        yield _export_safe_json(v)
+
+
+def _export_json_parts(v: Any, limit: int = 32000) -> Iterator[str]:
+    """Encodes `v` incrementally in pieces of at most `limit` characters (one spreadsheet cell each)."""
+    buf: List[str] = []
+    size = 0
+    for piece in _export_json_pieces(v):
+        while piece:
+            take = piece[: limit - size]
+            buf.append(take)
+            size += len(take)
+            piece = piece[len(take):]
+            if size >= limit:
+                yield "".join(buf)
+                buf, size = [], 0
+    if size:
+        yield "".join(buf)
+
+
+def _export_sheets(payload: ExportTestCasesRequest) -> List[tuple[str, str, List[str], Iterator[List[Any]]]]:
+    """(key, sheet name, header, lazy rows) for every export sheet, in workbook order."""
     requirement_input = payload.requirement_input or []
     requirement_spec = payload.requirement_spec or {}
     persona_reviews = payload.persona_reviews or {}
@@ -1885,178 +2380,214 @@ def export_testcases_excel(payload: ExportTestCasesRequest):
     test_case_spec = payload.test_case_spec or {}
     testcases = test_case_spec.get("testcases", [])
 
-    def _list_to_text(v: Any) -> str:
-        if isinstance(v, list):
-            return "\n".join([str(x) for x in v])
-        if v is None:
-            return ""
-        return str(v)
-
-    def _safe_json(v: Any) -> str:
-        try:
-            return json.dumps(v, ensure_ascii=False)
-        except Exception:
-            return str(v)
+    def input_rows():
+        for i, txt in enumerate(requirement_input, start=1):
+            yield [i, txt]
 
-    wb = Workbook()
-
-    ws_input = wb.active
-    ws_input.title = "需求输入"
-    ws_input.append(["index", "requirement_text"])
-    for i, txt in enumerate(requirement_input, start=1):
-        ws_input.append([i, txt])
-
-    ws_req = wb.create_sheet("测试需求稿")
-    ws_req.append(["req_id", "title", "priority", "rat_scope", "persona_sources", "pass_fail", "kpi"])
-    for r in requirement_spec.get("final_requirements", []) if isinstance(requirement_spec, dict) else []:
-        if not isinstance(r, dict):
-            continue
-        ws_req.append(
-            [
+    def requirement_rows():
+        for r in requirement_spec.get("final_requirements", []) if isinstance(requirement_spec, dict) else []:
+            if not isinstance(r, dict):
+                continue
+            yield [
                 r.get("req_id", ""),
                 r.get("title", ""),
                 r.get("priority", ""),
-                _list_to_text(r.get("rat_scope", [])),
-                _list_to_text(r.get("persona_sources", [])),
-                _list_to_text((r.get("acceptance") or {}).get("pass_fail", [])),
-                _list_to_text((r.get("acceptance") or {}).get("kpi", [])),
+                _export_list_to_text(r.get("rat_scope", [])),
+                _export_list_to_text(r.get("persona_sources", [])),
+                _export_list_to_text((r.get("acceptance") or {}).get("pass_fail", [])),
+                _export_list_to_text((r.get("acceptance") or {}).get("kpi", [])),
             ]
-        )
 
-    ws_review = wb.create_sheet("三人评审")
-    ws_review.append(["persona", "req_id", "issues", "open_questions", "rewrite_suggestion", "scores_json"])
-    for persona_key in ["spec", "carrier", "ux"]:
-        revs = ((persona_reviews.get(persona_key) or {}).get("reviews", []) if isinstance(persona_reviews, dict) else [])
-        for item in revs:
-            if not isinstance(item, dict):
-                continue
-            ws_review.append(
-                [
+    def review_rows():
+        for persona_key in ["spec", "carrier", "ux"]:
+            revs = ((persona_reviews.get(persona_key) or {}).get("reviews", []) if isinstance(persona_reviews, dict) else [])
+            for item in revs:
+                if not isinstance(item, dict):
+                    continue
+                yield [
                     persona_key,
                     item.get("req_id", ""),
-                    _list_to_text(item.get("issues", [])),
-                    _list_to_text(item.get("open_questions", [])),
+                    _export_list_to_text(item.get("issues", [])),
+                    _export_list_to_text(item.get("open_questions", [])),
                     item.get("rewrite_suggestion", ""),
-                    _safe_json(item.get("scores", {})),
+                    _export_safe_json(item.get("scores", {})),
                 ]
-            )
 
-    ws_design_obj = wb.create_sheet("测试设计目标")
-    ws_design_obj.append(["objective_id", "linked_reqs", "goal", "success_criteria", "evidence", "priority", "risk_notes"])
-    for o in test_design_spec.get("objectives", []) if isinstance(test_design_spec, dict) else []:
-        if not isinstance(o, dict):
-            continue
-        ws_design_obj.append(
-            [
+    def objective_rows():
+        for o in test_design_spec.get("objectives", []) if isinstance(test_design_spec, dict) else []:
+            if not isinstance(o, dict):
+                continue
+            yield [
                 o.get("objective_id", ""),
-                _list_to_text(o.get("linked_reqs", [])),
+                _export_list_to_text(o.get("linked_reqs", [])),
                 o.get("goal", ""),
-                _list_to_text(o.get("success_criteria", [])),
-                _list_to_text(o.get("evidence", [])),
+                _export_list_to_text(o.get("success_criteria", [])),
+                _export_list_to_text(o.get("evidence", [])),
                 o.get("priority", ""),
                 o.get("risk_notes", ""),
             ]
-        )
 
-    ws_design_matrix = wb.create_sheet("测试设计矩阵")
-    ws_design_matrix.append(["row_id", "req_id", "objective_id", "scenario", "key_configuration", "pass_criteria", "recommended_test_environment", "availability_risk"])
-    for row in test_design_spec.get("integrated_matrix", []) if isinstance(test_design_spec, dict) else []:
-        if not isinstance(row, dict):
-            continue
-        env_text, risk_text = _format_test_environment_cell(row.get("test_environment"))
-        ws_design_matrix.append(
-            [
+    def matrix_rows():
+        for row in test_design_spec.get("integrated_matrix", []) if isinstance(test_design_spec, dict) else []:
+            if not isinstance(row, dict):
+                continue
+            env_text, risk_text = _format_test_environment_cell(row.get("test_environment"))
+            yield [
                 row.get("row_id", ""),
                 row.get("req_id", ""),
                 row.get("objective_id", ""),
                 row.get("scenario", ""),
-                _safe_json(row.get("key_configuration", {})),
-                _list_to_text(row.get("pass_criteria", [])),
+                _export_safe_json(row.get("key_configuration", {})),
+                _export_list_to_text(row.get("pass_criteria", [])),
                 env_text,
                 risk_text,
             ]
-        )
 
-    ws_cases = wb.create_sheet("测试用例")
-    ws_cases.append(
-        [
-            "tc_id",
-            "objective_id",
-            "title",
-            "tags",
-            "preconditions",
-            "expected",
-            "pass_fail",
-            "recommended_test_environment",
-            "availability_risk",
-            "steps_count",
-            "must_capture",
-        ]
-    )
-    for tc in testcases:
-        if not isinstance(tc, dict):
-            continue
-        env_text, risk_text = _format_test_environment_cell(tc.get("test_environment"))
-        ws_cases.append(
-            [
+    def testcase_rows():
+        for tc in testcases:
+            if not isinstance(tc, dict):
+                continue
+            env_text, risk_text = _format_test_environment_cell(tc.get("test_environment"))
+            yield [
                 tc.get("tc_id", ""),
                 tc.get("objective_id", ""),
                 tc.get("title", ""),
                 ", ".join(tc.get("tags", [])),
-                _list_to_text(tc.get("preconditions", [])),
-                _list_to_text(tc.get("expected", [])),
-                _list_to_text(tc.get("pass_fail", [])),
+                _export_list_to_text(tc.get("preconditions", [])),
+                _export_list_to_text(tc.get("expected", [])),
+                _export_list_to_text(tc.get("pass_fail", [])),
                 env_text,
                 risk_text,
                 len(tc.get("steps", [])),
                 ", ".join((tc.get("observability") or {}).get("must_capture", [])),
             ]
-        )
 
-    ws_answers = wb.create_sheet("问题确认记录")
-    ws_answers.append(["source_round", "req_id", "question", "answer"])
-    for item in requirement_review_history.get("answered_questions", []) if isinstance(requirement_review_history, dict) else []:
-        if not isinstance(item, dict):
-            continue
-        ws_answers.append(
-            [
+    def answer_rows():
+        for item in requirement_review_history.get("answered_questions", []) if isinstance(requirement_review_history, dict) else []:
+            if not isinstance(item, dict):
+                continue
+            yield [
                 item.get("source_round", ""),
                 item.get("req_id", ""),
                 item.get("question", ""),
                 item.get("answer", ""),
             ]
-        )
 
-    ws_steps = wb.create_sheet("用例步骤")
-    ws_steps.append(["tc_id", "step_index", "action", "params_json"])
-    for tc in testcases:
-        if not isinstance(tc, dict):
-            continue
-        tc_id = tc.get("tc_id", "")
-        for idx, step in enumerate(tc.get("steps", []), start=1):
-            if not isinstance(step, dict):
+    def step_rows():
+        for tc in testcases:
+            if not isinstance(tc, dict):
                 continue
-            ws_steps.append([tc_id, idx, step.get("action", ""), _safe_json(step.get("params", {}))])
-
-    ws_raw = wb.create_sheet("RawJSON")
-    ws_raw.append(["section", "json"])
-    ws_raw.append(["requirement_spec", _safe_json(requirement_spec)])
-    ws_raw.append(["persona_reviews", _safe_json(persona_reviews)])
-    ws_raw.append(["requirement_review_history", _safe_json(requirement_review_history)])
-    ws_raw.append(["test_design_spec", _safe_json(test_design_spec)])
-    ws_raw.append(["test_case_spec", _safe_json(test_case_spec)])
-
-    stream = BytesIO()
-    wb.save(stream)
-    stream.seek(0)
+            tc_id = tc.get("tc_id", "")
+            for idx, step in enumerate(tc.get("steps", []), start=1):
+                if not isinstance(step, dict):
+                    continue
+                yield [tc_id, idx, step.get("action", ""), _export_safe_json(step.get("params", {}))]
+
+    def raw_rows():
+        # Large specs continue over several rows of the same section (cells hold at most 32767 characters).
+        for section, value in [
+            ("requirement_spec", requirement_spec),
+            ("persona_reviews", persona_reviews),
+            ("requirement_review_history", requirement_review_history),
+            ("test_design_spec", test_design_spec),
+            ("test_case_spec", test_case_spec),
+        ]:
+            for part in _export_json_parts(value):
+                yield [section, part]
+
+    return [
+        ("input", "需求输入", ["index", "requirement_text"], input_rows()),
+        ("requirements", "测试需求稿", ["req_id", "title", "priority", "rat_scope", "persona_sources", "pass_fail", "kpi"], requirement_rows()),
+        ("reviews", "三人评审", ["persona", "req_id", "issues", "open_questions", "rewrite_suggestion", "scores_json"], review_rows()),
+        ("objectives", "测试设计目标", ["objective_id", "linked_reqs", "goal", "success_criteria", "evidence", "priority", "risk_notes"], objective_rows()),
+        (
+            "matrix",
+            "测试设计矩阵",
+            ["row_id", "req_id", "objective_id", "scenario", "key_configuration", "pass_criteria", "recommended_test_environment", "availability_risk"],
+            matrix_rows(),
+        ),
+        (
+            "testcases",
+            "测试用例",
+            [
+                "tc_id",
+                "objective_id",
+                "title",
+                "tags",
+                "preconditions",
+                "expected",
+                "pass_fail",
+                "recommended_test_environment",
+                "availability_risk",
+                "steps_count",
+                "must_capture",
+            ],
+            testcase_rows(),
+        ),
+        ("answers", "问题确认记录", ["source_round", "req_id", "question", "answer"], answer_rows()),
+        ("steps", "用例步骤", ["tc_id", "step_index", "action", "params_json"], step_rows()),
+        ("raw", "RawJSON", ["section", "json"], raw_rows()),
+    ]
+
+
+@app.post("/api/export/testcases.xlsx")
+def export_testcases_excel(payload: ExportTestCasesRequest):
+    # Rows are generated and zipped while the response streams, so memory stays flat for large exports.
+    sheets = [(name, header, rows) for _, name, header, rows in _export_sheets(payload)]
     headers = {"Content-Disposition": "attachment; filename=testcases.xlsx"}
     return StreamingResponse(
-        stream,
+        iter_xlsx(sheets),
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers=headers,
     )
 
 
+@app.post("/api/export/testcases.csv")
+def export_testcases_csv(payload: ExportTestCasesRequest, sheet: str = "testcases"):
+    selected = [item for item in _export_sheets(payload) if item[0] == sheet]
+    if not selected:
+        keys = "/".join(item[0] for item in _export_sheets(payload))
+        raise HTTPException(status_code=400, detail=f"sheet必须是{keys}")
+    _, _, header, rows = selected[0]
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        # BOM so Excel opens the UTF-8 file with the right encoding.
+        buf.write("\ufeff")
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buf.tell() >= 64 * 1024:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue().encode("utf-8")
+
+    headers = {"Content-Disposition": f"attachment; filename=testcases-{sheet}.csv"}
+    return StreamingResponse(generate(), media_type="text/csv; charset=utf-8", headers=headers)
+
+
+@app.post("/api/export/testcases.ndjson")
+def export_testcases_ndjson(payload: ExportTestCasesRequest):
+    testcases = (payload.test_case_spec or {}).get("testcases", []) or []
+
+    def generate():
+        lines: List[str] = []
+        for tc in testcases:
+            if not isinstance(tc, dict):
+                continue
+            lines.append(_export_safe_json(tc) + "\n")
+            if len(lines) >= 200:
+                yield "".join(lines).encode("utf-8")
+                lines = []
+        if lines:
+            yield "".join(lines).encode("utf-8")
+
+    headers = {"Content-Disposition": "attachment; filename=testcases.ndjson"}
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers=headers)
+
+
 def _run_cmd(args: List[str], timeout_s: int = 12) -> Dict[str, Any]:
     try:
         cp = subprocess.run(args, capture_output=True, text=True, timeout=timeout_s)
@@ -2141,6 +2672,20 @@ def devices_serial():
     return _list_serial_ports()
 
 
+@app.get("/api/devices/serial/sessions")
+def devices_serial_sessions():
+    return {"sessions": serial_sessions.stats()}
+
+
+@app.get("/api/devices/serial/urcs")
+def devices_serial_urcs(port: str):
+    """Returns and clears the unsolicited result codes captured on an open port."""
+    session = serial_sessions.get_open(port)
+    if session is None:
+        raise HTTPException(status_code=404, detail="该串口没有打开的会话")
+    return {"port": port, "urcs": session.drain_urcs()}
+
+
 def _adb_exec(device_id: str, shell_args: List[str], timeout_s: int = 15) -> Dict[str, Any]:
     dev = _pick_adb_device(device_id)
     if not dev:
@@ -2148,26 +2693,36 @@ def _adb_exec(device_id: str, shell_args: List[str], timeout_s: int = 15) -> Dic
     return _run_cmd(["adb", "-s", dev, "shell", *shell_args], timeout_s=timeout_s)
 
 
-def _serial_exchange(port: str, baudrate: int, cmd: str, read_timeout: float = 1.2) -> Dict[str, Any]:
+def _serial_exchange(
+    port: str,
+    baudrate: int,
+    cmd: str,
+    *,
+    cmd_id: str = "",
+    spec: Optional[Dict[str, Any]] = None,
+    profile: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     if not port:
         return {"ok": False, "cmd": cmd, "stderr": "at_port为空", "stdout": ""}
+    if spec is None:
+        spec = _load_json_file(at_effective_atspec_path) or _load_json_file(at_spec_path) or ATSPEC_DEFAULT
+    if profile is None:
+        profile = _load_json_file(at_effective_profile_path) or _load_json_file(at_profile_path) or ATPROFILE_DEFAULT
+    commands = spec.get("commands", []) if isinstance(spec.get("commands", []), list) else []
+    command = next((c for c in commands if isinstance(c, dict) and c.get("id") == cmd_id), {}) if cmd_id else {}
+    expect = command.get("expect", {}) if isinstance(command.get("expect", {}), dict) else {}
+    transport = profile.get("transport", {}) if isinstance(profile.get("transport", {}), dict) else {}
     try:
-        import serial  # type: ignore
-    except Exception as exc:
-        return {"ok": False, "cmd": cmd, "stderr": f"pyserial不可用: {exc}", "stdout": ""}
-
-    try:
-        with serial.Serial(port=port, baudrate=baudrate, timeout=read_timeout) as ser:
-            ser.reset_input_buffer()
-            ser.reset_output_buffer()
-            ser.write((cmd.strip() + "\r").encode("utf-8"))
-            time.sleep(0.2)
-            data = ser.read(2048)
-            out = data.decode(errors="ignore")
-            ok = ("OK" in out.upper()) or ("+CREG" in out.upper()) or ("+COPS" in out.upper())
-            return {"ok": ok, "cmd": cmd, "stdout": out[-4000:], "stderr": ""}
+        session = serial_sessions.get(port, baudrate)
     except Exception as exc:
         return {"ok": False, "cmd": cmd, "stdout": "", "stderr": str(exc)}
+    return session.execute(
+        cmd,
+        ResponseFraming.from_atspec(spec),
+        at_command_timeout(profile, cmd_id, command),
+        line_ending=str(transport.get("line_ending_tx") or "\r"),
+        expect_prompt=bool(expect.get("prompt")),
+    )
 
 
 @app.post("/api/automation/debug")
@@ -2297,9 +2852,17 @@ def _render_at_command(template: str, params: Dict[str, Any]) -> str:
     return cmd
 
 
-def _exec_at_command(mode: str, cmd: str, payload: AutomationRequest) -> Dict[str, Any]:
+def _exec_at_command(
+    mode: str,
+    cmd: str,
+    payload: AutomationRequest,
+    *,
+    cmd_id: str = "",
+    spec: Optional[Dict[str, Any]] = None,
+    profile: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     if mode == "at_serial":
-        return _serial_exchange(payload.at_port, payload.baudrate, cmd)
+        return _serial_exchange(payload.at_port, payload.baudrate, cmd, cmd_id=cmd_id, spec=spec, profile=profile)
     if mode == "android_adb":
         # Experimental fallback: log the AT intent and collect telephony snapshot via adb.
         snapshot = _adb_exec(payload.device_id, ["dumpsys", "telephony.registry"], timeout_s=15)
@@ -3124,7 +3687,7 @@ def at_agent_mbt_run(payload: AutomationRequest):
         params = item.get("params", {}) if isinstance(item, dict) else {}
         c = commands.get(cmd_id, {})
         cmd = _render_at_command(c.get("at", ""), params if isinstance(params, dict) else {})
-        res = _exec_at_command(mode, cmd, payload)
+        res = _exec_at_command(mode, cmd, payload, cmd_id=cmd_id, spec=spec, profile=profile)
         steps.append({"phase": "init", "cmd_id": cmd_id, "cmd": cmd, "result": res})
 
     # execute transition plan
@@ -3138,7 +3701,7 @@ def at_agent_mbt_run(payload: AutomationRequest):
             for cid in action.get("cmd_sequence", []):
                 c = commands.get(cid, {})
                 cmd = _render_at_command(c.get("at", ""), {})
-                res = _exec_at_command(mode, cmd, payload)
+                res = _exec_at_command(mode, cmd, payload, cmd_id=cid, spec=spec, profile=profile)
                 cmd_entries.append({"cmd_id": cid, "cmd": cmd, "result": res})
                 if not res.get("ok"):
                     transition_ok = False
@@ -3147,7 +3710,7 @@ def at_agent_mbt_run(payload: AutomationRequest):
             params = action.get("params", {}) if isinstance(action.get("params", {}), dict) else {}
             c = commands.get(cid, {})
             cmd = _render_at_command(c.get("at", ""), params)
-            res = _exec_at_command(mode, cmd, payload)
+            res = _exec_at_command(mode, cmd, payload, cmd_id=cid, spec=spec, profile=profile)
             cmd_entries.append({"cmd_id": cid, "cmd": cmd, "result": res})
             transition_ok = bool(res.get("ok"))
         else:
@@ -3171,11 +3734,17 @@ def at_agent_mbt_run(payload: AutomationRequest):
             }
         )
 
+    urcs: List[Dict[str, Any]] = []
+    if mode == "at_serial":
+        session = serial_sessions.get_open(payload.at_port)
+        urcs = session.drain_urcs() if session is not None else []
+
     return {
         "mode": mode,
         "final_state": current_state,
         "coverage": {"covered": len(coverage_points_hit), "total": len(coverage_points_total), "points": sorted(list(coverage_points_hit))},
         "steps": steps,
+        "urcs": urcs,
     }
 
 
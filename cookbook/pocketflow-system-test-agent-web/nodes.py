@@ -1,9 +1,9 @@
 import asyncio
 import datetime as dt
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from pocketflow import AsyncNode, Node
+from pocketflow import AsyncNode, AsyncParallelBatchNode, AsyncParallelFlow, Node, RunLocal
 from schemas import (
     DEFAULT_ACTION_VOCABULARY,
     DEFAULT_ASSERTION_VOCABULARY,
@@ -21,7 +21,13 @@ from schemas import (
     TEST_OBJECTIVE_REQUIRED_KEYS,
     INTEGRATED_MATRIX_SCHEMA,
 )
-from utils.agent_runner import run_json_agent_strict_with_retry, run_json_agent_with_retry, run_text_agent
+from utils.agent_runner import (
+    arun_json_agent_strict_with_retry,
+    arun_json_agent_with_retry,
+    arun_text_agent,
+    run_json_agent_strict_with_retry,
+    run_json_agent_with_retry,
+)
 from utils.schema_validation import ensure_actions_in_vocabulary, validate_jsonschema, validate_list_of_dict
 
 
@@ -38,15 +44,42 @@ def _set_current_node(shared: Dict[str, Any], node: str):
 
 
 def _emit(shared: Dict[str, Any], event_type: str, payload: Dict[str, Any]):
-    q = shared.get("event_queue")
-    if not q:
-        return
+    sink = shared.get("event_sink")
+    if sink is None:
+        q = shared.get("event_queue")
+        if not q:
+            return
+        sink = q.put_nowait
+    ev = {"type": event_type, "payload": payload}
     try:
-        q.put_nowait({"type": event_type, "payload": payload})
+        loop = shared.get("event_loop")
+        if loop is not None and _running_loop() is not loop:
+            # Sync nodes may run on the flow executor; asyncio.Queue is not thread-safe.
+            loop.call_soon_threadsafe(sink, ev)
+        else:
+            sink(ev)
     except Exception:
         pass
 
 
+def _token_stream(shared: Dict[str, Any], source: str) -> Optional[Callable[[str], None]]:
+    """Forward streamed LLM deltas as token_delta events; None disables streaming when nobody listens."""
+    if not (shared.get("event_sink") or shared.get("event_queue")):
+        return None
+
+    def _on_delta(delta: str):
+        _emit(shared, "token_delta", {"node": source, "delta": delta})
+
+    return _on_delta
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
 def _normalize_available_test_environments(raw: Any) -> Dict[str, Any]:
     if not isinstance(raw, dict):
         raw = {}
@@ -587,6 +620,8 @@ class IntakeNode(Node):
 
 
 class ReqParseNode(Node):
+    _shared = RunLocal()
+
     def prep(self, shared):
         _set_current_node(shared, "ReqParseNode")
         return {
@@ -613,6 +648,7 @@ class ReqParseNode(Node):
             schema=REQUIREMENT_LIST_SCHEMA,
             fallback=fallback,
             warn_tag="ReqParseNode",
+            on_delta=_token_stream(self._shared, "ReqParseNode"),
         )
 
     def _run(self, shared):
@@ -636,17 +672,24 @@ class ReqParseNode(Node):
         return "default"
 
 
-class TriPersonaReviewNode(AsyncNode):
+class PersonaReviewNode(AsyncNode):
+    """One persona's review of the parsed requirements; writes `persona_review_<key>`."""
+
+    _shared = RunLocal()
+
+    def __init__(self, key: str, role: str, template: str):
+        super().__init__()
+        self.key, self.role, self.template = key, role, template
+
     async def prep_async(self, shared):
-        _set_current_node(shared, "TriPersonaReviewNode")
-        return {"requirements": shared["requirements_parsed"]}
+        return shared["requirements_parsed"]
 
-    async def _review_persona(self, shared: Dict[str, Any], template: str, role: str, requirements: List[Dict[str, Any]]):
+    async def exec_async(self, requirements):
         fallback = {
             "reviews": [
                 {
                     "req_id": r["req_id"],
-                    "issues": [f"{role}: 需补充量化验收标准"],
+                    "issues": [f"{self.role}: 需补充量化验收标准"],
                     "rewrite_suggestion": "补充可测量阈值、状态机前置条件与日志证据",
                     "scores": {"correctness_risk": 3, "testability_gap": 3, "ambiguity_level": 3},
                     "must_observe": r.get("observability", {}).get("must_capture", []),
@@ -656,10 +699,9 @@ class TriPersonaReviewNode(AsyncNode):
             ]
         }
 
-        return await asyncio.to_thread(
-            run_json_agent_with_retry,
-            shared=shared,
-            template_name=template,
+        return await arun_json_agent_with_retry(
+            shared=self._shared,
+            template_name=self.template,
             variables={
                 "requirements_json": json.dumps(requirements, ensure_ascii=False),
                 "history_risk_json": json.dumps([], ensure_ascii=False),
@@ -668,28 +710,13 @@ class TriPersonaReviewNode(AsyncNode):
             },
             schema=PERSONA_REVIEW_SCHEMA,
             fallback=fallback,
-            warn_tag=f"TriPersonaReviewNode-{role}",
+            warn_tag=f"TriPersonaReviewNode-{self.role}",
+            on_delta=_token_stream(self._shared, f"TriPersonaReviewNode-{self.role}"),
         )
 
-    async def exec_async(self, prep_res):
-        reqs = prep_res["requirements"]
-        shared = self._shared
-        spec_task = self._review_persona(shared, "review_spec_lawyer.txt", "SpecLawyer", reqs)
-        carrier_task = self._review_persona(shared, "review_carrier.txt", "CarrierReviewer", reqs)
-        ux_task = self._review_persona(shared, "review_ux_advocate.txt", "UXAdvocate", reqs)
-        spec, carrier, ux = await asyncio.gather(spec_task, carrier_task, ux_task)
-        return {"spec": spec, "carrier": carrier, "ux": ux}
-
-    def _run(self, shared):
-        raise RuntimeError("Use AsyncFlow.run_async for TriPersonaReviewNode")
-
     async def post_async(self, shared, prep_res, exec_res):
-        validate_jsonschema(exec_res["spec"], PERSONA_REVIEW_SCHEMA)
-        validate_jsonschema(exec_res["carrier"], PERSONA_REVIEW_SCHEMA)
-        validate_jsonschema(exec_res["ux"], PERSONA_REVIEW_SCHEMA)
-        shared["persona_reviews"] = exec_res
-        _trace(shared, "TriPersonaReviewNode")
-        _emit(shared, "module_result", {"module": "persona_reviews", "data": exec_res})
+        validate_jsonschema(exec_res, PERSONA_REVIEW_SCHEMA)
+        shared[f"persona_review_{self.key}"] = exec_res
         return "default"
 
     async def _run_async(self, shared):
@@ -697,7 +724,34 @@ class TriPersonaReviewNode(AsyncNode):
         return await super()._run_async(shared)
 
 
+class TriPersonaReviewNode(AsyncParallelFlow):
+    """Runs the three persona reviews as parallel branches and joins them into `persona_reviews`."""
+
+    PERSONAS = (
+        ("spec", "SpecLawyer", "review_spec_lawyer.txt"),
+        ("carrier", "CarrierReviewer", "review_carrier.txt"),
+        ("ux", "UXAdvocate", "review_ux_advocate.txt"),
+    )
+
+    def __init__(self):
+        super().__init__([PersonaReviewNode(*persona) for persona in self.PERSONAS], on_conflict="error")
+
+    async def prep_async(self, shared):
+        _set_current_node(shared, "TriPersonaReviewNode")
+        # Branches append to the same warnings list instead of each creating its own.
+        shared.setdefault("warnings", [])
+
+    async def post_async(self, shared, prep_res, exec_res):
+        reviews = {key: shared.pop(f"persona_review_{key}") for key, _, _ in self.PERSONAS}
+        shared["persona_reviews"] = reviews
+        _trace(shared, "TriPersonaReviewNode")
+        _emit(shared, "module_result", {"module": "persona_reviews", "data": reviews})
+        return "default"
+
+
 class SynthesisNode(Node):
+    _shared = RunLocal()
+
     def prep(self, shared):
         _set_current_node(shared, "SynthesisNode")
         return {"requirements": shared["requirements_parsed"], "reviews": shared["persona_reviews"]}
@@ -723,6 +777,7 @@ class SynthesisNode(Node):
             schema=SYNTHESIS_SCHEMA,
             fallback=fallback,
             warn_tag="SynthesisNode",
+            on_delta=_token_stream(self._shared, "SynthesisNode"),
         )
 
     def _run(self, shared):
@@ -741,6 +796,8 @@ class SynthesisNode(Node):
 
 
 class TestDesignNode(Node):
+    _shared = RunLocal()
+
     def prep(self, shared):
         _set_current_node(shared, "TestDesignNode")
         return {
@@ -784,6 +841,7 @@ class TestDesignNode(Node):
             },
             schema=TEST_DESIGN_SCHEMA,
             warn_tag="TestDesignNode",
+            on_delta=_token_stream(self._shared, "TestDesignNode"),
             custom_validator=_custom,
         )
         normalized = _normalize_objectives(data, reqs)
@@ -805,6 +863,13 @@ class TestDesignNode(Node):
             },
             schema=INTEGRATED_MATRIX_SCHEMA,
             warn_tag="IntegratedMatrixNode",
+            on_delta=_token_stream(self._shared, "IntegratedMatrixNode"),
+            stream_items_key="integrated_matrix",
+            on_item=lambda attempt, idx, row: _emit(
+                self._shared,
+                "integrated_matrix_item",
+                {"attempt": attempt + 1, "index": idx, "row": row},
+            ),
             custom_validator=_matrix_custom,
         )
         integrated_rows = _normalize_integrated_rows(
@@ -907,6 +972,8 @@ class TestDesignSupervisorNode(Node):
 
 
 class TestCaseGeneratorNode(Node):
+    _shared = RunLocal()
+
     def prep(self, shared):
         _set_current_node(shared, "TestCaseGeneratorNode")
         return {
@@ -948,6 +1015,7 @@ class TestCaseGeneratorNode(Node):
                 schema=TESTCASE_SCHEMA,
                 fallback=fallback,
                 warn_tag="TestCaseGeneratorNode",
+                on_delta=_token_stream(self._shared, "TestCaseGeneratorNode"),
             )
             return _normalize_testcases(data, [], prep_res.get("test_environments", {}))
 
@@ -980,6 +1048,7 @@ class TestCaseGeneratorNode(Node):
                     },
                     schema=TESTCASE_SCHEMA,
                     warn_tag=f"TestCaseGeneratorNode-Batch{i}",
+                    on_delta=_token_stream(self._shared, f"TestCaseGeneratorNode-Batch{i}"),
                     custom_validator=lambda d: isinstance(d.get("testcases", []), list) or (_ for _ in ()).throw(ValueError("testcases must be list")),
                 )
             except Exception as exc:
@@ -1005,6 +1074,8 @@ class TestCaseGeneratorNode(Node):
 
 
 class TestCaseBatchGenNode(AsyncNode):
+    _shared = RunLocal()
+
     async def prep_async(self, shared):
         _set_current_node(shared, "TestCaseBatchGenNode")
         return {
@@ -1018,7 +1089,9 @@ class TestCaseBatchGenNode(AsyncNode):
             "questions_to_ask": shared["requirement_spec"].get("questions_to_ask", []),
             "assumptions": shared["requirement_spec"].get("assumptions", []),
             "persona_reviews": shared.get("persona_reviews", {}),
-            "supervisor_feedback": shared.get("testcase_supervisor_feedback", ""),
+            "supervisor_feedback": (shared.get("_testcase_batch_feedback") or {}).get(
+                int(self.params.get("batch_index", 0)), shared.get("testcase_supervisor_feedback", "")
+            ),
         }
 
     async def exec_async(self, prep_res):
@@ -1026,9 +1099,20 @@ class TestCaseBatchGenNode(AsyncNode):
         if not chunk:
             return {"testcases": _fallback_testcases_from_objectives(prep_res.get("objectives", []), prep_res.get("test_environments", {}))}
         fallback = {"testcases": _fallback_testcases_from_integrated(chunk, prep_res.get("test_environments", {}))}
+        batch_no = prep_res["batch_index"] + 1
+
+        def _on_testcase(attempt: int, idx: int, item: Any):
+            # Normalise each case as soon as it closes so the UI can render before the batch finishes.
+            norm = _normalize_testcases({"testcases": [item]}, chunk, prep_res.get("test_environments", {}))["testcases"]
+            if norm:
+                _emit(
+                    self._shared,
+                    "testcase_item",
+                    {"batch_index": batch_no, "attempt": attempt + 1, "index": idx, "testcase": norm[0]},
+                )
+
         try:
-            data = await asyncio.to_thread(
-                run_json_agent_strict_with_retry,
+            data = await arun_json_agent_strict_with_retry(
                 shared=self._shared,
                 template_name="test_case_generator.txt",
                 variables={
@@ -1053,6 +1137,9 @@ class TestCaseBatchGenNode(AsyncNode):
                 },
                 schema=TESTCASE_SCHEMA,
                 warn_tag=f"TestCaseBatchGenNode-Batch{prep_res['batch_index'] + 1}",
+                on_delta=_token_stream(self._shared, f"TestCaseBatchGenNode-Batch{prep_res['batch_index'] + 1}"),
+                stream_items_key="testcases",
+                on_item=_on_testcase,
                 custom_validator=lambda d: isinstance(d.get("testcases", []), list)
                 or (_ for _ in ()).throw(ValueError("testcases must be list")),
             )
@@ -1116,6 +1203,8 @@ class TestCaseSupervisorNode(Node):
         return {
             "requirement_spec": shared.get("requirement_spec", {}),
             "test_case_spec": shared.get("test_case_spec", {}),
+            "batch_plan": shared.get("_testcase_batch_plan", []),
+            "batches": shared.get("_testcase_batches", {}),
             "retry_count": int(shared.get("testcase_retry_count", 0)),
             "max_retries": int(shared.get("testcase_max_retries", 2)),
         }
@@ -1126,7 +1215,7 @@ class TestCaseSupervisorNode(Node):
         issues: List[str] = []
         if not isinstance(tcs, list) or not tcs:
             issues.append("testcases为空")
-            return {"approved": False, "issues": issues}
+            return {"approved": False, "issues": issues, "retry_batches": None, "batch_feedback": {}}
 
         req_ids = {r.get("req_id") for r in reqs if isinstance(r, dict) and r.get("req_id")}
         covered = set()
@@ -1152,11 +1241,64 @@ class TestCaseSupervisorNode(Node):
                 if isinstance(tc, dict)
             ]
         )
-        if numeric_req and sum(1 for m in numeric_req if m in pass_text) < max(1, len(numeric_req) // 3):
+        numeric_issue = bool(numeric_req) and sum(1 for m in numeric_req if m in pass_text) < max(1, len(numeric_req) // 3)
+        if numeric_issue:
             issues.append("需求中的数值型验收标准在用例pass_fail中保留不足")
 
         approved = len(issues) == 0
-        return {"approved": approved, "issues": issues}
+        retry_batches, batch_feedback = (
+            (None, {}) if approved else self._deficient_batches(prep_res, reqs, miss, numeric_req, numeric_issue)
+        )
+        return {"approved": approved, "issues": issues, "retry_batches": retry_batches, "batch_feedback": batch_feedback}
+
+    def _deficient_batches(
+        self,
+        prep_res: Dict[str, Any],
+        reqs: List[Dict[str, Any]],
+        missing_req_ids: List[str],
+        numeric_req: List[str],
+        numeric_issue: bool,
+    ) -> tuple[Optional[List[int]], Dict[int, str]]:
+        """Map supervisor issues back to integrated-matrix batches; None means regenerate everything.
+
+        A partial retry is only returned when every issue is pinned to a batch: each missing req_id
+        belongs to some batch, and a numeric pass_fail issue is matched by at least one flagged batch.
+        """
+        plan = prep_res.get("batch_plan") or []
+        batches = prep_res.get("batches") or {}
+        if not plan or not batches:
+            return None, {}
+        numeric_by_req: Dict[str, List[str]] = {}
+        for r in reqs:
+            if isinstance(r, dict) and r.get("req_id"):
+                pf = r.get("acceptance", {}).get("pass_fail", []) if isinstance(r.get("acceptance", {}), dict) else []
+                numeric_by_req[r["req_id"]] = [str(t) for t in pf if str(t) in numeric_req]
+
+        feedback: Dict[int, List[str]] = {}
+        assigned_missing = set()
+        numeric_flagged = False
+        for idx, rows in enumerate(plan):
+            batch_req_ids = [str(row.get("req_id", "")) for row in rows if isinstance(row, dict)]
+            lost_cov = sorted({rid for rid in batch_req_ids if rid in missing_req_ids})
+            if lost_cov:
+                assigned_missing.update(lost_cov)
+                feedback.setdefault(idx, []).append(f"本批用例trace缺少需求覆盖: {', '.join(lost_cov)}")
+            expected = [t for rid in dict.fromkeys(batch_req_ids) for t in numeric_by_req.get(rid, [])]
+            if expected:
+                batch_text = " ".join(
+                    " ".join(tc.get("pass_fail", []) if isinstance(tc.get("pass_fail", []), list) else [str(tc.get("pass_fail", ""))])
+                    for tc in batches.get(idx, [])
+                    if isinstance(tc, dict)
+                )
+                kept = sum(1 for t in expected if t in batch_text)
+                if kept < max(1, len(expected) // 3):
+                    numeric_flagged = True
+                    feedback.setdefault(idx, []).append(f"本批pass_fail需保留数值型验收标准: {'; '.join(expected)}")
+        if not feedback or set(missing_req_ids) - assigned_missing or (numeric_issue and not numeric_flagged):
+            # Issues that cannot be pinned to a batch (e.g. req_ids absent from the matrix) need a full pass;
+            # retrying only the flagged batches would fail the same check again.
+            return None, {}
+        return sorted(feedback), {idx: "；".join(msgs) for idx, msgs in feedback.items()}
 
     def post(self, shared, prep_res, exec_res):
         if exec_res["approved"]:
@@ -1167,45 +1309,69 @@ class TestCaseSupervisorNode(Node):
         retry_count = prep_res["retry_count"] + 1
         shared["testcase_retry_count"] = retry_count
         shared["testcase_supervisor_feedback"] = "；".join(exec_res["issues"])
+        shared["_testcase_retry_batches"] = exec_res.get("retry_batches")
+        shared["_testcase_batch_feedback"] = exec_res.get("batch_feedback") or {}
         shared.setdefault("warnings", []).append(
             f"TestCaseSupervisorNode: 质量审查未通过，第{retry_count}次回流: {' | '.join(exec_res['issues'])}"
         )
         _emit(shared, "module_result", {"module": "test_case_supervisor", "data": exec_res})
         if retry_count <= prep_res["max_retries"]:
+            if exec_res.get("retry_batches") is not None:
+                shared.setdefault("warnings", []).append(
+                    "TestCaseSupervisorNode: 仅重新生成批次 "
+                    + ", ".join(str(i + 1) for i in exec_res["retry_batches"])
+                )
             return "retry"
         shared.setdefault("warnings", []).append("TestCaseSupervisorNode: 达到最大回流次数，继续后续流程")
         return "default"
 
 
-class HarnessMapperNode(Node):
-    def prep(self, shared):
+def _chunked(items: List[Any], chunk_size: int) -> List[List[Any]]:
+    if chunk_size <= 0:
+        chunk_size = len(items) or 1
+    return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)] or [[]]
+
+
+def _fallback_script_plan(testcases: List[Dict[str, Any]]) -> Dict[str, Any]:
+    scripts = []
+    for tc in testcases:
+        scripts.append(
+            {
+                "script_id": f"SC-{tc['tc_id']}",
+                "tc_id": tc["tc_id"],
+                "harness": {"type": "ANDROID_UIA+PY_AT", "version": "v2"},
+                "dependencies": ["adb", "uiautomator2", "pyserial"],
+                "inputs": {"device_id": "adb-serial", "at_port": "/dev/ttyUSB0"},
+                "actions_mapping": [
+                    {"action": s["action"], "impl": "framework_adapter"} for s in tc.get("steps", [])
+                ],
+                "artifacts": {"collect": ["logcat.txt", "modem.log"], "naming": "by_tc_id_timestamp"},
+                "timeouts": {"global_s": 900, "step_s": 60},
+            }
+        )
+    return {"scripts": scripts, "gaps": [], "recommended_framework_extensions": []}
+
+
+class HarnessMapperNode(AsyncParallelBatchNode):
+    """Maps test cases to harness scripts in parallel chunks of `harness_chunk_size` cases."""
+    _shared = RunLocal()
+
+    async def prep_async(self, shared):
         _set_current_node(shared, "HarnessMapperNode")
-        return {"testcases": shared["test_case_spec"].get("testcases", []), "capabilities": shared["capabilities"]}
+        chunks = _chunked(shared["test_case_spec"].get("testcases", []), int(shared.get("harness_chunk_size", 20)))
+        return [
+            {"batch_index": idx, "batch_total": len(chunks), "testcases": chunk, "capabilities": shared["capabilities"]}
+            for idx, chunk in enumerate(chunks)
+        ]
 
-    def exec(self, prep_res):
-        fallback_scripts = []
-        for tc in prep_res["testcases"]:
-            fallback_scripts.append(
-                {
-                    "script_id": f"SC-{tc['tc_id']}",
-                    "tc_id": tc["tc_id"],
-                    "harness": {"type": "ANDROID_UIA+PY_AT", "version": "v2"},
-                    "dependencies": ["adb", "uiautomator2", "pyserial"],
-                    "inputs": {"device_id": "adb-serial", "at_port": "/dev/ttyUSB0"},
-                    "actions_mapping": [
-                        {"action": s["action"], "impl": "framework_adapter"} for s in tc.get("steps", [])
-                    ],
-                    "artifacts": {"collect": ["logcat.txt", "modem.log"], "naming": "by_tc_id_timestamp"},
-                    "timeouts": {"global_s": 900, "step_s": 60},
-                }
-            )
-        fallback = {"scripts": fallback_scripts, "gaps": [], "recommended_framework_extensions": []}
+    async def exec_async(self, prep_res):
+        tag = "HarnessMapperNode" if prep_res["batch_total"] == 1 else f"HarnessMapperNode-Batch{prep_res['batch_index'] + 1}"
 
         def _custom(data: Any):
             if not isinstance(data.get("scripts", []), list):
                 raise ValueError("scripts must be a list")
 
-        data = run_json_agent_with_retry(
+        data = await arun_json_agent_with_retry(
             shared=self._shared,
             template_name="harness_mapper.txt",
             variables={
@@ -1215,32 +1381,48 @@ class HarnessMapperNode(Node):
                 "output_schema": json.dumps(SCRIPT_PLAN_SCHEMA, ensure_ascii=False),
             },
             schema=SCRIPT_PLAN_SCHEMA,
-            fallback=fallback,
-            warn_tag="HarnessMapperNode",
+            fallback=_fallback_script_plan(prep_res["testcases"]),
+            warn_tag=tag,
+            on_delta=_token_stream(self._shared, tag),
             custom_validator=_custom,
         )
-        return _normalize_scripts(data)
+        _emit(
+            self._shared,
+            "module_result",
+            {
+                "module": "script_plan_batch",
+                "data": {
+                    "batch_index": prep_res["batch_index"] + 1,
+                    "batch_total": prep_res["batch_total"],
+                    "count": len(data.get("scripts", []) if isinstance(data.get("scripts", []), list) else []),
+                },
+            },
+        )
+        return data
 
-    def _run(self, shared):
+    async def _run_async(self, shared):
         self._shared = shared
-        return super()._run(shared)
+        return await super()._run_async(shared)
 
-    def post(self, shared, prep_res, exec_res):
-        scripts = exec_res.get("scripts", [])
+    async def post_async(self, shared, prep_res, exec_res):
+        # Batches come back in submission order; merge them before normalising so script ids stay unique.
+        merged: Dict[str, Any] = {"scripts": [], "gaps": [], "recommended_framework_extensions": []}
+        for data in exec_res:
+            for key in merged:
+                value = data.get(key, []) if isinstance(data, dict) else []
+                merged[key].extend(value if isinstance(value, list) else [])
+        for key in ("gaps", "recommended_framework_extensions"):
+            merged[key] = list(dict.fromkeys(str(x) for x in merged[key]))
+        result = _normalize_scripts(merged)
+        scripts = result.get("scripts", [])
         validate_list_of_dict(scripts, SCRIPTSPEC_REQUIRED_KEYS, "scripts")
-        shared["script_spec"] = exec_res
+        shared["script_spec"] = result
         _trace(shared, "HarnessMapperNode")
-        _emit(shared, "module_result", {"module": "script_spec", "data": exec_res})
+        _emit(shared, "module_result", {"module": "script_spec", "data": result})
         return "default"
 
 
-class ScriptWriterNode(Node):
-    def prep(self, shared):
-        _set_current_node(shared, "ScriptWriterNode")
-        return {"script_spec": shared["script_spec"], "assertion_vocabulary": shared["assertion_vocabulary"]}
-
-    def exec(self, prep_res):
-        fallback = """
+SCRIPT_WRITER_FALLBACK = """
 # 测试代码（参考）
 ```python
 import json
@@ -1265,7 +1447,31 @@ if __name__ == "__main__":
 ```
 """.strip()
 
-        return run_text_agent(
+
+class ScriptWriterNode(AsyncParallelBatchNode):
+    """Writes reference test code for `script_chunk_size` scripts per LLM call, all batches in parallel."""
+    _shared = RunLocal()
+
+    async def prep_async(self, shared):
+        _set_current_node(shared, "ScriptWriterNode")
+        spec = shared["script_spec"]
+        chunks = _chunked(spec.get("scripts", []), int(shared.get("script_chunk_size", 10)))
+        if len(chunks) == 1:
+            return [{"batch_index": 0, "batch_total": 1, "script_spec": spec}]
+        # Gaps and framework extensions are spec-wide context, so every batch sees them.
+        return [
+            {"batch_index": idx, "batch_total": len(chunks), "script_spec": {**spec, "scripts": chunk}}
+            for idx, chunk in enumerate(chunks)
+        ]
+
+    async def exec_async(self, prep_res):
+        if prep_res["batch_total"] == 1:
+            tag, fallback = "ScriptWriterNode", SCRIPT_WRITER_FALLBACK
+        else:
+            tag = f"ScriptWriterNode-Batch{prep_res['batch_index'] + 1}"
+            ids = [sc.get("script_id", "") for sc in prep_res["script_spec"].get("scripts", [])]
+            fallback = f"{SCRIPT_WRITER_FALLBACK}\n\n覆盖脚本: {', '.join(ids)}"
+        return await arun_text_agent(
             shared=self._shared,
             template_name="script_writer.txt",
             variables={
@@ -1273,17 +1479,24 @@ if __name__ == "__main__":
                 "code_template": "Python pytest runner with adapters",
             },
             fallback=fallback,
-            warn_tag="ScriptWriterNode",
+            warn_tag=tag,
+            on_delta=_token_stream(self._shared, tag),
         )
 
-    def _run(self, shared):
+    async def _run_async(self, shared):
         self._shared = shared
-        return super()._run(shared)
+        return await super()._run_async(shared)
 
-    def post(self, shared, prep_res, exec_res):
-        shared["test_code_reference"] = exec_res
+    async def post_async(self, shared, prep_res, exec_res):
+        if len(exec_res) == 1:
+            code = exec_res[0]
+        else:
+            code = "\n\n".join(
+                f"## 批次 {p['batch_index'] + 1}/{p['batch_total']}\n\n{text.strip()}" for p, text in zip(prep_res, exec_res)
+            )
+        shared["test_code_reference"] = code
         _trace(shared, "ScriptWriterNode")
-        _emit(shared, "module_result", {"module": "test_code_reference", "data": exec_res})
+        _emit(shared, "module_result", {"module": "test_code_reference", "data": code})
         return "default"
 
 
@@ -130,6 +130,8 @@ const designHistoryCasesBtn = document.getElementById("designHistoryCasesBtn");
 
 const LAST_RESULT_KEY = "pocketflow_last_result_v2";
 const THEME_KEY = "pocketflow_theme";
+const SSE_MAX_RECONNECTS = 5;
+const DESIGN_HISTORY_PAGE_SIZE = 50;
 let promptCache = {};
 let latestStructured = null;
 let botHistory = [];
@@ -141,10 +143,13 @@ let hitlStream = null;
 let hitlStreamJobId = "";
 let activeStageStream = null;
 let activeStageJobId = "";
+// Failed stage runs leave a server-side checkpoint; rerunning with identical inputs resumes from it.
+const stageCheckpoints = {};
 let agenticScriptHistory = [];
 let latestAgenticCode = "";
 let latestDesignDocUrl = "";
 let designHistoryItems = [];
+let designHistoryTotal = 0;
 let selectedDesignHistoryId = "";
 let selectedDesignHistoryRecord = null;
 let stageState = {
@@ -591,6 +596,7 @@ function ensureHitlStream(jobId) {
   hitlStreamJobId = jobId;
   const es = new EventSource(`/api/hitl/requirements/${encodeURIComponent(jobId)}/stream`);
   hitlStream = es;
+  let reconnects = 0;
 
   es.onmessage = (msg) => {
     if (!msg?.data) return;
@@ -600,6 +606,8 @@ function ensureHitlStream(jobId) {
     } catch (_) {}
   };
   es.onerror = async () => {
+    // 浏览器会自动重连并携带 Last-Event-ID，服务端从断点续推事件；多次失败后再放弃
+    if (es.readyState === EventSource.CONNECTING && reconnects++ < SSE_MAX_RECONNECTS) return;
     const currentJob = hitlStreamJobId;
     closeHitlStream();
     if (!currentJob) return;
@@ -637,17 +645,31 @@ function nodeLabel(node) {
 }
 
 async function startStageJobAndWait(stage, payload) {
-  const startResp = await postJson(`/api/stage/${stage}/start`, payload);
+  const inputKey = JSON.stringify(payload);
+  const checkpoint = stageCheckpoints[stage];
+  delete stageCheckpoints[stage];
+  const resumeFrom = checkpoint && checkpoint.inputKey === inputKey ? checkpoint.id : "";
+  const rememberCheckpoint = (id) => {
+    if (id) stageCheckpoints[stage] = { id, inputKey };
+  };
+  const startResp = await postJson(`/api/stage/${stage}/start`, resumeFrom ? { ...payload, resume_from: resumeFrom } : payload);
   const jobId = startResp.job_id;
   if (!jobId) throw new Error("stage job_id为空");
 
   closeStageStream();
   activeStageJobId = jobId;
-  pushSystemBotMessage(`任务已提交到服务端：${stageLabel(stage)}（job=${jobId}）。`);
+  pushSystemBotMessage(
+    resumeFrom
+      ? `任务已提交到服务端：${stageLabel(stage)}（job=${jobId}），从上次失败的节点继续。`
+      : `任务已提交到服务端：${stageLabel(stage)}（job=${jobId}）。`
+  );
 
   return await new Promise((resolve, reject) => {
     const es = new EventSource(`/api/stage/${encodeURIComponent(jobId)}/stream`);
     activeStageStream = es;
+    const streamedChars = {};
+    const streamedItems = {};
+    let reconnects = 0;
 
     es.onmessage = (msg) => {
       if (!msg?.data) return;
@@ -673,6 +695,19 @@ async function startStageJobAndWait(stage, payload) {
         pushSystemBotMessage(`${stageLabel(stage)}执行节点：${n}`);
         return;
       }
+      if (et === "token_delta") {
+        const n = nodeLabel(p.node);
+        streamedChars[n] = (streamedChars[n] || 0) + String(p.delta || "").length;
+        setStatus(`${stageLabel(stage)}生成中：${n}（已接收 ${streamedChars[n]} 字符）`);
+        return;
+      }
+      if (et === "testcase_item" || et === "integrated_matrix_item") {
+        const key = et === "testcase_item" ? `batch${p.batch_index}` : "matrix";
+        streamedItems[key] = (p.index || 0) + 1;
+        const total = Object.values(streamedItems).reduce((a, b) => a + b, 0);
+        setStatus(`${stageLabel(stage)}生成中：已解析 ${total} 条${et === "testcase_item" ? "用例" : "矩阵行"}`);
+        return;
+      }
       if (et === "module_result") {
         if (p.module) pushSystemBotMessage(`${stageLabel(stage)}模块完成：${p.module}`);
         return;
@@ -685,13 +720,18 @@ async function startStageJobAndWait(stage, payload) {
       }
       if (et === "error") {
         const msgText = p.error || "unknown error";
-        pushSystemBotMessage(`${stageLabel(stage)}任务失败：${msgText}`, { actionNeeded: true });
+        rememberCheckpoint(p.checkpoint_id);
+        pushSystemBotMessage(
+          `${stageLabel(stage)}任务失败：${msgText}${p.checkpoint_id ? "（已保存断点，输入不变时重新执行将从失败节点继续）" : ""}`,
+          { actionNeeded: true }
+        );
         closeStageStream();
         reject(new Error(msgText));
       }
     };
 
     es.onerror = async () => {
+      if (es.readyState === EventSource.CONNECTING && reconnects++ < SSE_MAX_RECONNECTS) return;
       closeStageStream();
       try {
         const s = await fetch(`/api/stage/${encodeURIComponent(jobId)}/state`);
@@ -701,6 +741,7 @@ async function startStageJobAndWait(stage, payload) {
             resolve(st.result || {});
             return;
           }
+          rememberCheckpoint(st?.error?.checkpoint_id);
           const err = st?.error?.error || st?.error || "stage stream disconnected";
           reject(new Error(String(err)));
           return;
@@ -1218,7 +1259,24 @@ function renderDesignHistoryList() {
         </div>
       </button>`;
     })
-    .join("")}</div>`;
+    .join("")}${
+    designHistoryTotal > designHistoryItems.length
+      ? `<button class="ui-btn ui-btn-secondary design-history-more" data-history-more="1" type="button">加载更多（${designHistoryItems.length} / ${designHistoryTotal}）</button>`
+      : ""
+  }</div>`;
+}
+
+async function fetchDesignHistoryPage(offset) {
+  const resp = await fetch(`/api/design-history?offset=${offset}&limit=${DESIGN_HISTORY_PAGE_SIZE}`);
+  if (!resp.ok) throw new Error(await resp.text() || "加载历史目录失败");
+  const data = await resp.json();
+  designHistoryTotal = Number(data.total || 0);
+  return Array.isArray(data.items) ? data.items : [];
+}
+
+async function loadMoreDesignHistory() {
+  designHistoryItems = designHistoryItems.concat(await fetchDesignHistoryPage(designHistoryItems.length));
+  renderDesignHistoryList();
 }
 
 function renderDesignHistoryDetail(record) {
@@ -1302,10 +1360,7 @@ function renderDesignHistoryDetail(record) {
 }
 
 async function loadDesignHistory(preferredId = "") {
-  const resp = await fetch("/api/design-history");
-  if (!resp.ok) throw new Error(await resp.text() || "加载历史目录失败");
-  const data = await resp.json();
-  designHistoryItems = Array.isArray(data.items) ? data.items : [];
+  designHistoryItems = await fetchDesignHistoryPage(0);
   renderDesignHistoryList();
   const targetId =
     preferredId ||
@@ -2053,37 +2108,92 @@ async function fetchRagDocs() {
   ragDocsEl.innerHTML = `<ul class="rag-doc-list">${items}</ul>`;
 }
 
+function waitRagIngestJob(jobId, onProgress) {
+  return new Promise((resolve, reject) => {
+    const es = new EventSource(`/api/rag/jobs/${encodeURIComponent(jobId)}/stream`);
+    let settled = false;
+    let reconnects = 0;
+    const finish = (fn, value) => {
+      if (settled) return;
+      settled = true;
+      es.close();
+      fn(value);
+    };
+    es.onmessage = (msg) => {
+      if (!msg?.data) return;
+      let ev = null;
+      try {
+        ev = JSON.parse(msg.data);
+      } catch (_) {
+        return;
+      }
+      const p = ev?.payload || {};
+      if (ev?.type === "progress") onProgress(p);
+      else if (ev?.type === "completed") finish(resolve, p.uploaded || {});
+      else if (ev?.type === "error") finish(reject, new Error(p.error || "unknown error"));
+    };
+    es.onerror = async () => {
+      if (settled) return;
+      if (es.readyState === EventSource.CONNECTING && reconnects++ < SSE_MAX_RECONNECTS) return;
+      try {
+        const s = await fetch(`/api/rag/jobs/${encodeURIComponent(jobId)}/state`);
+        const st = s.ok ? await s.json() : {};
+        if (st.status === "completed") finish(resolve, st.result || {});
+        else if (st.status === "failed") finish(reject, new Error(st.error || "ingest failed"));
+        else finish(reject, new Error("RAG入库进度连接中断"));
+      } catch (e) {
+        finish(reject, e);
+      }
+    };
+  });
+}
+
 async function uploadRagDocs() {
   const files = Array.from(ragFileEl.files || []);
   if (!files.length) throw new Error("请先选择至少一个文件");
   let ok = 0;
   const errors = [];
+  const progress = {};
+  const phaseLabel = { extract: "解析", store: "写入" };
+  const renderProgress = () => {
+    const lines = Object.entries(progress).map(([name, text]) => `${name}: ${text}`);
+    setStatus(`RAG入库中…\n${lines.join("\n")}`);
+  };
+  const waits = [];
   for (const f of files) {
     try {
-      const b64 = await new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onload = () => {
-          const raw = String(reader.result || "");
-          const idx = raw.indexOf("base64,");
-          resolve(idx >= 0 ? raw.slice(idx + 7) : "");
-        };
-        reader.onerror = () => reject(reader.error || new Error("文件读取失败"));
-        reader.readAsDataURL(f);
-      });
-      const resp = await fetch("/api/rag/upload", {
+      // The File is sent as the raw request body, so the browser streams it from disk.
+      const resp = await fetch(`/api/rag/upload-stream?filename=${encodeURIComponent(f.name)}`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ filename: f.name, content_base64: b64 }),
+        headers: { "Content-Type": "application/octet-stream" },
+        body: f,
       });
       if (!resp.ok) {
         errors.push(`${f.name}: ${await resp.text()}`);
         continue;
       }
-      ok += 1;
+      const job = await resp.json();
+      progress[f.name] = "排队中";
+      renderProgress();
+      waits.push(
+        waitRagIngestJob(job.job_id, (p) => {
+          progress[f.name] = `${phaseLabel[p.phase] || p.phase} ${p.done}${p.total ? `/${p.total}` : ""}`;
+          renderProgress();
+        })
+          .then(() => {
+            ok += 1;
+            progress[f.name] = "完成";
+          })
+          .catch((e) => {
+            errors.push(`${f.name}: ${e.message || e}`);
+            progress[f.name] = "失败";
+          })
+      );
     } catch (e) {
       errors.push(`${f.name}: ${e.message || e}`);
     }
   }
+  await Promise.all(waits);
   await fetchRagDocs();
   if (errors.length) {
     setStatus(`RAG上传完成：成功 ${ok}，失败 ${errors.length}\n- ${errors.join("\n- ")}`);
@@ -2949,6 +3059,10 @@ refreshDesignHistoryBtn?.addEventListener("click", async () => {
 });
 
 designHistoryList?.addEventListener("click", (ev) => {
+  if (ev.target.closest("[data-history-more]")) {
+    loadMoreDesignHistory().catch((e) => setStatus(`历史目录加载失败: ${e.message}`));
+    return;
+  }
   const btn = ev.target.closest("[data-record-id]");
   if (!btn) return;
   const recordId = btn.getAttribute("data-record-id");
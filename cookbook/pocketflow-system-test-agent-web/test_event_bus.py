@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils.event_bus import EventBus, follow_job_events
+from utils.job_store import JobStore
+
+
+def _log(n):
+    return {"type": "log", "payload": {"n": n}}
+
+
+class EventBusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JobStore(Path(self.tmp.name) / "jobs.sqlite3")
+        self.addCleanup(self.store._conn.close)
+        self.store.create("j1", "stage")
+
+    def _bus(self, **kwargs):
+        bus = EventBus(**kwargs)
+        bus.open("j1")
+        return bus
+
+    def _emit(self, bus, ev):
+        """Stores then publishes `ev`, like the web app's writer thread does."""
+        if ev["type"] in {"completed", "error"}:
+            self.store.update("j1", status="completed" if ev["type"] == "completed" else "failed")
+        bus.publish("j1", ev, self.store.append_event("j1", ev))
+
+    def _follow(self, bus, after=0, replay=None):
+        async def collect():
+            return [(eid, ev) async for eid, ev, _ in follow_job_events(bus, self.store, "j1", after, replay, poll_s=0.01)]
+
+        return asyncio.run(asyncio.wait_for(collect(), 5))
+
+
+class EventBusTest(EventBusTestCase):
+    def test_ring_replays_events_after_an_id_and_skips_live_only_events(self):
+        bus = self._bus(ring_size=8)
+        for n in range(1, 4):
+            self._emit(bus, _log(n))
+        bus.publish("j1", {"type": "token_delta", "payload": "x"})
+
+        async def subscribe():
+            q, backlog = bus.subscribe("j1", after=1)
+            bus.publish("j1", {"type": "token_delta", "payload": "y"})
+            return [item[0] for item in backlog], q.get_nowait()
+
+        ids, live = asyncio.run(subscribe())
+        self.assertEqual(ids, [2, 3])
+        self.assertEqual(live[0], None)
+        self.assertEqual(live[2], 'data: {"type": "token_delta", "payload": "y"}\n\n')
+        self.assertIsNone(EventBus().subscribe("not-open"))
+
+    def test_slow_subscriber_is_dropped_instead_of_buffering_without_bound(self):
+        bus = self._bus(queue_size=2)
+
+        async def stall():
+            q, _ = bus.subscribe("j1")
+            for n in range(5):
+                bus.publish("j1", _log(n), n + 1)
+            return [q.get_nowait() for _ in range(q.qsize())]
+
+        self.assertEqual(asyncio.run(stall()), [None])
+        self.assertEqual(bus.stats()["subscribers"], 0)
+        self.assertEqual(bus.stats()["dropped_subscribers"], 1)
+
+
+class FollowJobEventsTest(EventBusTestCase):
+    def test_last_event_id_resume_falls_back_to_the_store_when_the_ring_overflowed(self):
+        bus = self._bus(ring_size=3)
+        for n in range(1, 9):
+            self._emit(bus, _log(n))
+        self._emit(bus, {"type": "completed", "payload": {}})
+        # The ring only holds 7..9; 3..6 come from the store
+        self.assertEqual([eid for eid, _ in self._follow(bus, after=2)], list(range(3, 10)))
+        self.assertEqual([eid for eid, _ in self._follow(bus, after=7)], [8, 9])
+
+    def test_fresh_subscriber_gets_only_the_last_replay_events(self):
+        bus = self._bus(ring_size=3)
+        for n in range(1, 6):
+            self._emit(bus, _log(n))
+        self._emit(bus, {"type": "error", "payload": {"error": "boom"}})
+        self.assertEqual([eid for eid, _ in self._follow(bus, replay=2)], [5, 6])
+        self.assertEqual([eid for eid, _ in self._follow(bus, replay=5)], [2, 3, 4, 5, 6])
+
+    def test_dropped_subscriber_continues_from_the_store(self):
+        bus = self._bus(queue_size=2)
+        self._emit(bus, _log(1))
+
+        async def run():
+            seen = []
+
+            async def follow():
+                async for eid, ev, _ in follow_job_events(bus, self.store, "j1", poll_s=0.01):
+                    seen.append(eid)
+                    if eid == 1:
+                        # The subscriber stalls while the job keeps emitting
+                        for n in range(2, 8):
+                            self._emit(bus, _log(n))
+                        bus.publish("j1", {"type": "token_delta", "payload": "lost"})
+                        self._emit(bus, {"type": "completed", "payload": {}})
+
+            await asyncio.wait_for(follow(), 5)
+            return seen
+
+        self.assertEqual(asyncio.run(run()), list(range(1, 9)))
+        self.assertEqual(bus.stats()["dropped_subscribers"], 1)
+        self.assertEqual(bus.stats()["subscribers"], 0)
+
+    def test_job_in_another_worker_is_polled_from_the_store(self):
+        bus = EventBus()
+        for n in range(1, 3):
+            self._emit(bus, _log(n))
+        self.store.update("j1", status="completed")
+        self.assertEqual([eid for eid, _ in self._follow(bus)], [1, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils.job_store import JobStore
+
+
+class JobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = Path(self.tmp.name) / "jobs.sqlite3"
+
+    def _store(self, **kwargs):
+        store = JobStore(self.path, **kwargs)
+        self.addCleanup(store._conn.close)
+        return store
+
+    def _age(self, store, job_id, seconds):
+        store._conn.execute("UPDATE jobs SET updated_at = updated_at - ? WHERE job_id = ?", (seconds, job_id))
+
+    def test_state_and_events_are_shared_between_workers(self):
+        writer, reader = self._store(), self._store()
+        writer.create("j1", "stage", stage="design", result=None)
+        writer.update("j1", status="completed", result={"cases": 3})
+        self.assertEqual([writer.append_event("j1", {"type": "log", "n": n}) for n in range(3)], [1, 2, 3])
+        self.assertEqual(writer.append_event("j2", {"type": "log"}), 1)
+
+        state = reader.get("j1", kind="stage")
+        self.assertEqual((state["status"], state["stage"], state["result"]), ("completed", "design", {"cases": 3}))
+        self.assertIsNone(reader.get("j1", kind="hitl"))
+        self.assertEqual(reader.events("j1", after=1), [(2, {"type": "log", "n": 1}), (3, {"type": "log", "n": 2})])
+
+    def test_event_log_is_capped_per_job(self):
+        store = self._store(max_events=60)
+        store.create("j1", "stage")
+        store.create("j2", "stage")
+        store.append_event("j2", {"type": "log"})
+        for n in range(99):
+            store.append_event("j1", {"type": "log", "n": n})
+        # Trimming is amortised: it runs every 50th event once the log is over the cap
+        self.assertEqual(len(store.events("j1")), 99)
+        store.append_event("j1", {"type": "log", "n": 99})
+        seqs = [seq for seq, _ in store.events("j1")]
+        self.assertEqual((len(seqs), seqs[0], seqs[-1]), (60, 41, 100))
+        self.assertEqual(len(store.events("j2")), 1)
+
+    def test_jobs_untouched_past_ttl_are_evicted_with_their_events(self):
+        store = self._store(ttl_s=10)
+        for job_id in ("old", "busy", "recent"):
+            store.create(job_id, "stage")
+            store.append_event(job_id, {"type": "log"})
+        self._age(store, "old", 11)
+        self._age(store, "busy", 11)
+        self._age(store, "recent", 9)
+        # An event counts as activity
+        store.append_event("busy", {"type": "log"})
+
+        store.create("new", "stage")
+        self.assertIsNone(store.get("old"))
+        self.assertEqual(store.events("old"), [])
+        self.assertEqual([j for j in ("busy", "recent", "new") if store.get(j) is not None], ["busy", "recent", "new"])
+        self.assertEqual(len(store.events("busy")), 2)
+        self.assertEqual(store.stats()["events"], 3)
+
+    def test_single_writer_thread_keeps_emission_order(self):
+        store = self._store()
+        writer = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(writer.shutdown)
+
+        async def emit():
+            # Submitted back to back from the loop without awaiting each write, as the web app does
+            loop = asyncio.get_running_loop()
+            futs = [loop.run_in_executor(writer, functools.partial(store.create, "j1", "stage", status="starting"))]
+            for n in range(40):
+                futs.append(loop.run_in_executor(writer, store.append_event, "j1", {"type": "log", "n": n}))
+                if n == 20:
+                    futs.append(loop.run_in_executor(writer, functools.partial(store.update, "j1", status="running", step=n)))
+            futs.append(loop.run_in_executor(writer, functools.partial(store.update, "j1", status="completed")))
+            return await asyncio.gather(*futs)
+
+        results = asyncio.run(emit())
+        self.assertEqual([r for r in results if r is not None], list(range(1, 41)))
+        self.assertEqual([ev["n"] for _, ev in store.events("j1")], list(range(40)))
+        state = store.get("j1")
+        self.assertEqual((state["status"], state["step"]), ("completed", 20))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils.json_stream import StreamingArrayParser, array_item_schema
+
+CASE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "cases": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["id"],
+                "properties": {"id": {"type": "string"}, "steps": {"type": "array", "items": {"type": "string"}}},
+            },
+        }
+    },
+}
+
+
+def _feed_in_chunks(parser, text, size):
+    out = []
+    for i in range(0, len(text), size):
+        out.extend(parser.feed(text[i : i + size]))
+    return out
+
+
+class StreamingArrayParserTest(unittest.TestCase):
+    def test_any_chunk_split_inside_strings_and_escapes(self):
+        doc = {
+            "cases": [
+                {"id": "TC1", "steps": ['say "hi"', "back\\slash", "brackets ]} in text", "tab\tand é"]},
+                {"id": "TC2", "steps": []},
+            ]
+        }
+        text = "```json\n" + json.dumps(doc, ensure_ascii=False) + "\n```"
+        for size in range(1, 8):
+            seen = []
+            parser = StreamingArrayParser("cases", array_item_schema(CASE_SCHEMA, "cases"), lambda idx, item: seen.append(idx))
+            out = _feed_in_chunks(parser, text, size)
+            self.assertEqual(out, doc["cases"], f"chunk size {size}")
+            self.assertEqual(seen, [0, 1])
+            self.assertTrue(parser.done)
+
+    def test_nested_arrays_and_same_named_inner_key(self):
+        # Only the top-level "cases" array is streamed; an inner "cases" key is part of an element.
+        text = '{"meta": {"cases": [0]}, "cases": [[1, [2, 3]], {"cases": [4]}, []], "tail": [5]}'
+        parser = StreamingArrayParser("cases")
+        self.assertEqual(_feed_in_chunks(parser, text, 3), [[1, [2, 3]], {"cases": [4]}, []])
+        self.assertTrue(parser.done)
+
+    def test_top_level_array(self):
+        parser = StreamingArrayParser(None)
+        self.assertEqual(_feed_in_chunks(parser, 'Here you go: [1, "two", [3], {"four": 4}] done', 2), [1, "two", [3], {"four": 4}])
+        self.assertEqual(parser.feed("[9]"), [])
+
+    def test_item_failing_the_schema_stops_mid_stream(self):
+        seen = []
+        parser = StreamingArrayParser("cases", array_item_schema(CASE_SCHEMA, "cases"), lambda idx, item: seen.append(item))
+        self.assertEqual(parser.feed('{"cases": [{"id": "TC1"}, '), [{"id": "TC1"}])
+        with self.assertRaises(ValueError) as ctx:
+            parser.feed('{"name": "no id"}, {"id": "TC3"}]}')
+        self.assertIn("cases[1]", str(ctx.exception))
+        self.assertEqual(parser.items, [{"id": "TC1"}])
+        self.assertEqual(seen, [{"id": "TC1"}])
+
+    def test_malformed_element_raises(self):
+        parser = StreamingArrayParser("cases")
+        with self.assertRaises(ValueError) as ctx:
+            parser.feed('{"cases": [{"id": "TC1",}]}')
+        self.assertIn("malformed JSON element", str(ctx.exception))
+
+    def test_truncated_stream_keeps_completed_items_only(self):
+        parser = StreamingArrayParser("cases")
+        out = _feed_in_chunks(parser, '{"cases": [{"id": "TC1"}, {"id": "TC2", "steps": ["op', 4)
+        self.assertEqual(out, [{"id": "TC1"}])
+        self.assertEqual(parser.items, [{"id": "TC1"}])
+        self.assertFalse(parser.done)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils.llm_limiter import AdaptiveLimiter
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _limiter(self, **kwargs):
+        return AdaptiveLimiter(clock=self.clock, **kwargs)
+
+    def _start(self, limiter, job_key, tokens=0):
+        task = self.loop.create_task(limiter.aacquire(job_key, tokens))
+        self._settle()
+        return task
+
+    def _settle(self):
+        for _ in range(5):
+            self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_window_halves_once_per_congestion_event_and_grows_back(self):
+        limiter = self._limiter(max_concurrency=8)
+        permits = [limiter.acquire() for _ in range(3)]
+        self.clock.now += 1
+        limiter.release(permits[0], timed_out=True)
+        self.assertEqual(limiter.window, 4.0)
+        # Granted before the cut: the same congestion, not a second halving
+        limiter.release(permits[1], throttled=True)
+        self.assertEqual(limiter.window, 4.0)
+        self.clock.now += 1
+        limiter.release(limiter.acquire(), throttled=True)
+        self.assertEqual(limiter.window, 2.0)
+
+        limiter.release(permits[2])
+        self.assertEqual(limiter.window, 2.5)
+        # Past the default one-second pause after a 429
+        self.clock.now += 1
+        for _ in range(50):
+            limiter.release(limiter.acquire())
+        self.assertEqual(limiter.window, 8.0)
+        self.assertEqual((limiter.stats()["throttled"], limiter.stats()["timeouts"]), (2, 1))
+
+    def test_window_limits_requests_in_flight(self):
+        limiter = self._limiter(max_concurrency=2)
+        first, second = limiter.acquire(), limiter.acquire()
+        waiter = self._start(limiter, "default")
+        self.assertFalse(waiter.done())
+        limiter.release(first)
+        self._settle()
+        self.assertTrue(waiter.done())
+        limiter.release(second)
+        limiter.release(waiter.result())
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_retry_after_pauses_admission(self):
+        limiter = self._limiter(max_concurrency=8)
+        throttled, early, late = limiter.acquire(), limiter.acquire(), limiter.acquire()
+        limiter.release(throttled, throttled=True, retry_after=5)
+        waiter = self._start(limiter, "default")
+        # Releases wake the waiter, but the cooldown still holds
+        self.clock.now += 4
+        limiter.release(early)
+        self._settle()
+        self.assertFalse(waiter.done())
+
+        self.clock.now += 1.5
+        limiter.release(late)
+        self._settle()
+        self.assertTrue(waiter.done())
+        limiter.release(waiter.result())
+
+    def test_fair_share_between_jobs(self):
+        limiter = self._limiter(max_concurrency=2)
+        big, other = limiter.acquire("big"), limiter.acquire("other")
+        # "big" queued first, but already has a request in flight
+        big_next = self._start(limiter, "big")
+        small = self._start(limiter, "small")
+        limiter.release(other)
+        self._settle()
+        self.assertTrue(small.done())
+        self.assertFalse(big_next.done())
+        limiter.release(small.result())
+        self._settle()
+        self.assertTrue(big_next.done())
+        limiter.release(big)
+        limiter.release(big_next.result())
+
+    def test_request_bucket_refills_with_the_clock(self):
+        limiter = self._limiter(rpm=2, max_concurrency=4)
+        first, second = limiter.acquire(), limiter.acquire()
+        waiter = self._start(limiter, "default")
+        limiter.release(first)
+        self._settle()
+        self.assertFalse(waiter.done())
+        # 2 requests/min refill one request every 30s
+        self.clock.now += 30
+        limiter.release(second)
+        self._settle()
+        self.assertTrue(waiter.done())
+
+    def test_blocking_acquire_refused_on_the_loop_thread(self):
+        limiter = self._limiter()
+
+        async def call_blocking():
+            limiter.acquire()
+
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(call_blocking())
+        self.assertEqual(limiter.stats()["waiting"], 0)
+        self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
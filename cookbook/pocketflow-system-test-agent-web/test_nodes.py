@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import nodes
+
+
+def _tc(tc_id, req_id, pass_fail):
+    return {"tc_id": tc_id, "trace": {"req_ids": [req_id]}, "pass_fail": [pass_fail]}
+
+
+class TestCaseSupervisorRetryBatchesTest(unittest.TestCase):
+    def _prep(self, reqs, plan, batches):
+        testcases = [tc for idx in sorted(batches) for tc in batches[idx]]
+        return {
+            "requirement_spec": {"final_requirements": reqs},
+            "test_case_spec": {"testcases": testcases},
+            "batch_plan": plan,
+            "batches": batches,
+            "retry_count": 0,
+            "max_retries": 2,
+        }
+
+    def _req(self, req_id, pass_fail):
+        return {"req_id": req_id, "acceptance": {"pass_fail": [pass_fail]}}
+
+    def test_retries_only_flagged_batch_when_every_issue_maps_to_a_batch(self):
+        prep = self._prep(
+            [self._req("R1", "注册成功"), self._req("R2", "注册成功")],
+            [[{"req_id": "R1"}], [{"req_id": "R2"}]],
+            {0: [_tc("TC1", "R1", "注册成功")], 1: [_tc("TC2", "R1", "注册成功")]},
+        )
+        res = nodes.TestCaseSupervisorNode().exec(prep)
+        self.assertFalse(res["approved"])
+        self.assertEqual(res["retry_batches"], [1])
+        self.assertIn("R2", res["batch_feedback"][1])
+
+    def test_flagged_batch_plus_unmapped_req_id_falls_back_to_full_regeneration(self):
+        # R1 is missing but belongs to batch 0; R3 is missing and appears in no batch of the plan.
+        prep = self._prep(
+            [self._req("R1", "注册成功"), self._req("R2", "注册成功"), self._req("R3", "注册成功")],
+            [[{"req_id": "R1"}], [{"req_id": "R2"}]],
+            {0: [_tc("TC1", "R2", "注册成功")], 1: [_tc("TC2", "R2", "注册成功")]},
+        )
+        res = nodes.TestCaseSupervisorNode().exec(prep)
+        self.assertFalse(res["approved"])
+        self.assertTrue(any("R1" in issue and "R3" in issue for issue in res["issues"]))
+        self.assertIsNone(res["retry_batches"])
+        self.assertEqual(res["batch_feedback"], {})
+
+    def test_numeric_issue_not_tied_to_a_batch_falls_back(self):
+        # Batch 0 is flagged for R1's coverage, but R2's dropped numeric criterion has no batch rows.
+        prep = self._prep(
+            [self._req("R1", "注册成功"), self._req("R2", "注册时延 < 300ms")],
+            [[{"req_id": "R1"}]],
+            {0: [_tc("TC1", "R2", "注册成功")]},
+        )
+        res = nodes.TestCaseSupervisorNode().exec(prep)
+        self.assertFalse(res["approved"])
+        self.assertEqual(len(res["issues"]), 2)
+        self.assertIsNone(res["retry_batches"])
+
+
+if __name__ == "__main__":
+    unittest.main()
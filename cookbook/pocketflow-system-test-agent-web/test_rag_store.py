@@ -0,0 +1,164 @@
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils.rag_store import BM25Index, ChunkSegment, HashingEncoder, SimpleRAGStore, np
+
+DOCS = {
+    "attach.md": ["UE attach procedure sends an ATTACH REQUEST to the MME", "MME answers with ATTACH ACCEPT"],
+    "sms.md": ["AT+CMGS sends a short message after the > prompt", "incoming SMS raises a +CMTI URC"],
+    "power.md": ["AT+CFUN=0 switches the radio off", "AT+CFUN=1 restores full functionality"],
+}
+
+
+def _ingest_all(store, docs=DOCS, batch_size=256):
+    return {name: store.add_document(name, chunks, batch_size=batch_size)["doc_id"] for name, chunks in docs.items()}
+
+
+def _failing_chunks(good, marker):
+    yield from good
+    raise RuntimeError(f"extraction failed after {marker}")
+
+
+class ChunkSegmentTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _segment(self):
+        return ChunkSegment(self.base / "chunks.seg", self.base / "chunks.idx")
+
+    def test_append_get_and_reopen(self):
+        seg = self._segment()
+        self.assertEqual(seg.append(["alpha", "bêta", ""]), 0)
+        self.assertEqual(seg.get(1), "bêta")
+        # Appending after a read remaps the files
+        self.assertEqual(seg.append(["gamma"]), 3)
+        self.assertEqual([seg.get(i) for i in range(4)], ["alpha", "bêta", "", "gamma"])
+        with self.assertRaises(IndexError):
+            seg.get(4)
+        seg.close()
+
+        reopened = self._segment()
+        self.assertEqual(len(reopened), 4)
+        self.assertEqual(reopened.get(3), "gamma")
+        reopened.close()
+
+    def test_torn_index_record_is_trimmed_on_open(self):
+        seg = self._segment()
+        seg.append(["one", "two"])
+        seg.close()
+        with (self.base / "chunks.idx").open("ab") as f:
+            f.write(b"\x01\x02\x03")
+        reopened = self._segment()
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual(reopened.append(["three"]), 2)
+        self.assertEqual(reopened.get(2), "three")
+        reopened.close()
+
+
+class SimpleRAGStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _store(self, mode="keyword"):
+        store = SimpleRAGStore(self.base, mode=mode, encoder=HashingEncoder(dim=64) if mode != "keyword" else None)
+        self.addCleanup(store.segment.close)
+        return store
+
+    def _top(self, store, query, mode=None):
+        hits = store.retrieve(query, top_k=1, mode=mode)
+        return (hits[0]["filename"], hits[0]["text"]) if hits else None
+
+    def test_keyword_ingest_reload_retrieve(self):
+        store = self._store()
+        _ingest_all(store)
+        self.assertEqual(self._top(store, "CMTI URC"), ("sms.md", DOCS["sms.md"][1]))
+        # Each document appended one log line instead of rewriting the index
+        self.assertEqual(len(store.index_log_path.read_text(encoding="utf-8").splitlines()), len(DOCS))
+
+        reloaded = self._store()
+        self.assertEqual(self._top(reloaded, "CMTI URC"), ("sms.md", DOCS["sms.md"][1]))
+        self.assertEqual(self._top(reloaded, "radio off"), ("power.md", DOCS["power.md"][0]))
+
+        # Replaying base + log gives the same index as a rebuild from the chunks
+        rebuilt = BM25Index()
+        for doc_id in reloaded.doc_meta:
+            rebuilt.add_document(doc_id, reloaded._doc_texts(doc_id))
+        self.assertEqual(reloaded.index.to_dict(), rebuilt.to_dict())
+
+    def test_log_is_compacted_into_the_base_file(self):
+        store = self._store()
+        store.INDEX_LOG_COMPACT_AFTER = 2
+        _ingest_all(store)
+
+        reloaded = self._store()
+        reloaded.INDEX_LOG_COMPACT_AFTER = 2
+        reloaded.load_index()
+        self.assertEqual(reloaded.index_log_path.read_text(encoding="utf-8"), "")
+        self.assertTrue(reloaded.index_path.exists())
+
+        again = self._store()
+        self.assertEqual(sorted(again.index.doc_ids), sorted(again.doc_meta))
+        self.assertEqual(self._top(again, "ATTACH ACCEPT"), ("attach.md", DOCS["attach.md"][1]))
+
+    def test_failed_ingest_leaves_no_trace_after_reload(self):
+        store = self._store()
+        _ingest_all(store, {"attach.md": DOCS["attach.md"]})
+        with self.assertRaises(RuntimeError):
+            store.add_document("broken.md", _failing_chunks(["orphan zebra chunk", "another zebra"], "two"), batch_size=1)
+        # The orphan chunks are in the segment but belong to no document
+        self.assertEqual(len(store.segment), 4)
+        self.assertEqual(store.retrieve("zebra"), [])
+        _ingest_all(store, {"sms.md": DOCS["sms.md"]})
+
+        reloaded = self._store()
+        self.assertEqual([d["filename"] for d in reloaded.list_docs()].count("broken.md"), 0)
+        self.assertEqual(reloaded.retrieve("zebra"), [])
+        self.assertEqual(self._top(reloaded, "CMTI URC"), ("sms.md", DOCS["sms.md"][1]))
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_hybrid_ingest_reload_retrieve(self):
+        store = self._store("hybrid")
+        ids = _ingest_all(store)
+        # Embeddings are synced incrementally, one row per segment chunk
+        self.assertEqual(store.dense.rows, len(store.segment))
+
+        reloaded = self._store("hybrid")
+        self.assertEqual(reloaded.dense.rows, len(reloaded.segment))
+        self.assertEqual(reloaded.dense.sync(reloaded.segment), 0)
+        hits = reloaded.retrieve("ATTACH ACCEPT", top_k=3)
+        self.assertEqual(hits[0]["doc_id"], ids["attach.md"])
+        self.assertIn("bm25_score", hits[0])
+        self.assertIn("dense_score", hits[0])
+        self.assertEqual(self._top(reloaded, "CFUN radio", mode="dense")[0], "power.md")
+
+    @unittest.skipIf(np is None, "numpy not installed")
+    def test_dense_hits_skip_orphan_chunks(self):
+        store = self._store("dense")
+        _ingest_all(store, {"attach.md": DOCS["attach.md"]})
+        with self.assertRaises(RuntimeError):
+            store.add_document("broken.md", _failing_chunks(["orphan zebra chunk"], "one"), batch_size=1)
+        # The next ingest embeds the orphan rows too; they must not map onto either document
+        _ingest_all(store, {"sms.md": DOCS["sms.md"]})
+        self.assertEqual(store.dense.rows, len(store.segment))
+
+        reloaded = self._store("dense")
+        texts = [h["text"] for h in reloaded.retrieve("orphan zebra chunk", top_k=10)]
+        self.assertNotIn("orphan zebra chunk", texts)
+        self.assertEqual(sorted(texts), sorted(DOCS["attach.md"] + DOCS["sms.md"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
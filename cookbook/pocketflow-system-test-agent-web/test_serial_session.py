@@ -0,0 +1,172 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from utils.serial_session import ResponseFraming, SerialSessionManager, at_command_timeout
+
+SPEC = {
+    "result_codes": {"final_ok": ["OK"], "final_error": ["ERROR"]},
+    "interaction": {"prompt": {"chars": [">"]}},
+    "capabilities": [{"signals": ["+CMTI:"]}, {"signals": ["+CREG:"]}],
+}
+FRAMING = ResponseFraming.from_atspec(SPEC)
+
+
+class FakeSerial:
+    """Scripted modem: each written command queues its canned reply bytes for the reader thread."""
+
+    def __init__(self, port="COM-TEST", replies=None, echo=False):
+        self.port = port
+        self.replies = replies if replies is not None else {}
+        self.echo = echo
+        self.written = []
+        self.closed = False
+        self.fail = None
+        self._buf = b""
+        self._cond = threading.Condition()
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            return len(self._buf)
+
+    def push(self, data: bytes):
+        with self._cond:
+            self._buf += data
+            self._cond.notify_all()
+
+    def break_port(self, message="device disconnected"):
+        with self._cond:
+            self.fail = OSError(message)
+            self._cond.notify_all()
+
+    def read(self, n=1):
+        with self._cond:
+            self._cond.wait_for(lambda: self._buf or self.fail or self.closed, timeout=0.05)
+            if self.fail is not None:
+                raise self.fail
+            data, self._buf = self._buf[:n], self._buf[n:]
+            return data
+
+    def write(self, data: bytes):
+        self.written.append(data)
+        cmd = data.decode("latin-1").strip()
+        reply = self.replies.get(cmd)
+        if self.echo:
+            self.push(cmd.encode("latin-1") + b"\r\n")
+        if reply is not None:
+            self.push(reply)
+        return len(data)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class SerialSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.ports = []
+
+        def opener(port, baudrate):
+            ser = FakeSerial(port, self.replies)
+            self.ports.append(ser)
+            return ser
+
+        self.replies = {}
+        self.manager = SerialSessionManager(opener)
+        self.addCleanup(self.manager.close_all)
+
+    def _session(self, port="COM-TEST", baudrate=115200):
+        return self.manager.get(port, baudrate)
+
+    def test_response_ends_at_final_result_code(self):
+        self.replies["AT+CSQ"] = b"\r\n+CSQ: 20,99\r\n\r\nOK\r\n"
+        self.replies["AT+CMEE=9"] = b"\r\n+CME ERROR: 50\r\n"
+        session = self._session()
+        res = session.execute("AT+CSQ", FRAMING, 2)
+        self.assertTrue(res["ok"])
+        self.assertEqual((res["stdout"], res["final"], res["stderr"]), ("+CSQ: 20,99\nOK", "OK", ""))
+        self.assertEqual(self.ports[0].written, [b"AT+CSQ\r"])
+
+        res = session.execute("AT+CMEE=9", FRAMING, 2)
+        self.assertFalse(res["ok"])
+        self.assertEqual(res["stderr"], "+CME ERROR: 50")
+
+    def test_echo_is_dropped(self):
+        self.replies["ATI"] = b"Quectel\r\nOK\r\n"
+        session = self._session()
+        self.ports[0].echo = True
+        res = session.execute("ATI", FRAMING, 2)
+        self.assertEqual(res["stdout"], "Quectel\nOK")
+
+    def test_prompt_without_line_ending_completes_the_command(self):
+        self.replies['AT+CMGS="10086"'] = b"\r\n> "
+        session = self._session()
+        res = session.execute('AT+CMGS="10086"', FRAMING, 2, expect_prompt=True)
+        self.assertTrue(res["ok"])
+        self.assertEqual(res["final"], ">")
+
+    def test_urcs_are_buffered_and_kept_out_of_the_response(self):
+        self.replies["AT+CREG?"] = b'\r\n+CMTI: "SM",3\r\n+CREG: 0,1\r\n\r\nOK\r\n'
+        session = self._session()
+        res = session.execute("AT+CREG?", FRAMING, 2)
+        # +CREG: answers the query; +CMTI: is unsolicited
+        self.assertEqual(res["stdout"], "+CREG: 0,1\nOK")
+        self.assertEqual(res["urcs"], ['+CMTI: "SM",3'])
+
+        self.ports[0].push(b"\r\n+CREG: 5\r\n")
+        for _ in range(100):
+            if len(session.urcs) == 2:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual([u["line"] for u in session.drain_urcs()], ['+CMTI: "SM",3', "+CREG: 5"])
+        self.assertEqual(session.drain_urcs(), [])
+
+    def test_missing_final_result_code_times_out(self):
+        session = self._session()
+        res = session.execute("AT+COPS=?", FRAMING, 0.1)
+        self.assertFalse(res["ok"])
+        self.assertIn("超时", res["stderr"])
+        self.assertTrue(session.alive)
+
+    def test_port_error_marks_session_dead_and_manager_reopens(self):
+        self.replies["AT"] = b"\r\nOK\r\n"
+        session = self._session()
+        self.assertIs(self._session(), session)
+        self.ports[0].break_port()
+        session._reader.join(timeout=1)
+        self.assertFalse(session.alive)
+        res = session.execute("AT", FRAMING, 1)
+        self.assertFalse(res["ok"])
+        self.assertEqual(res["stderr"], "device disconnected")
+
+        reopened = self._session()
+        self.assertIsNot(reopened, session)
+        self.assertEqual(len(self.ports), 2)
+        self.assertTrue(reopened.execute("AT", FRAMING, 2)["ok"])
+        # A baudrate change also reopens the port
+        self.assertIsNot(self._session(baudrate=9600), reopened)
+        self.assertTrue(self.ports[1].closed)
+
+
+class AtCommandTimeoutTest(unittest.TestCase):
+    PROFILE = {"defaults": {"timeouts": {"default_sec": 3, "network_register_sec": 180, "sms_send_sec": 60}}}
+
+    def test_timeout_key_selection(self):
+        self.assertEqual(at_command_timeout(self.PROFILE, "cmd.creg"), 180)
+        self.assertEqual(at_command_timeout(self.PROFILE, "sms.cmgs"), 60)
+        self.assertEqual(at_command_timeout(self.PROFILE, "cmd.csq"), 3)
+        # The ATSPEC command's own timeout_key wins over the built-in mapping
+        self.assertEqual(at_command_timeout(self.PROFILE, "cmd.csq", {"timeout_key": "network_register_sec"}), 180)
+        # Keys missing from the profile fall back to default_sec, then to 3s
+        self.assertEqual(at_command_timeout(self.PROFILE, "cmd.cgact"), 3)
+        self.assertEqual(at_command_timeout({}, "cmd.creg"), 3.0)
+        self.assertEqual(at_command_timeout({"defaults": {"timeouts": {"default_sec": "soon"}}}), 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
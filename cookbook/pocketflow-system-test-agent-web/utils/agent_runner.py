@@ -1,21 +1,67 @@
+import asyncio
 import json
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Generator, Optional, Tuple
 
+from utils.json_stream import StreamingArrayParser, array_item_schema
 from utils.prompt_loader import render_prompt
 from utils.schema_validation import validate_jsonschema
 
 
-def run_json_agent_with_retry(
+def _attempt_delta(
+    schema: Dict[str, Any],
+    attempt: int,
+    on_delta: Optional[Callable[[str], None]],
+    stream_items_key: Optional[str],
+    on_item: Optional[Callable[[int, int, Any], None]],
+) -> Optional[Callable[[str], None]]:
+    """Per-attempt delta callback; with stream_items_key, also parse and validate array items as they close."""
+    if not stream_items_key:
+        return on_delta
+    parser = StreamingArrayParser(
+        stream_items_key,
+        item_schema=array_item_schema(schema, stream_items_key),
+        on_item=(lambda idx, item: on_item(attempt, idx, item)) if on_item else None,
+    )
+    if on_delta is None:
+        return parser.feed
+
+    def _delta(chunk: str):
+        on_delta(chunk)
+        parser.feed(chunk)
+
+    return _delta
+
+
+JSON_SYSTEM_PROMPT = "Return strictly valid JSON only."
+TEXT_SYSTEM_PROMPT = "Return practical content only."
+
+# What an agent loop asks its driver to do: ("call", user prompt, on_delta for this attempt) is sent
+# back the LLM result; ("evict", user prompt) drops that prompt's cached response.
+AgentRequest = Tuple[Any, ...]
+AgentSteps = Generator[AgentRequest, Any, Any]
+
+
+def _json_agent_steps(
     *,
     shared: Dict[str, Any],
     template_name: str,
     variables: Dict[str, Any],
     schema: Dict[str, Any],
-    fallback: Any,
     warn_tag: str,
-    max_retries: int = 2,
-    custom_validator: Optional[Callable[[Any], None]] = None,
-) -> Any:
+    max_retries: int,
+    custom_validator: Optional[Callable[[Any], None]],
+    on_delta: Optional[Callable[[str], None]],
+    stream_items_key: Optional[str],
+    on_item: Optional[Callable[[int, int, Any], None]],
+    strict: bool,
+    fallback: Any = None,
+) -> AgentSteps:
+    """Prompt/validate/retry loop shared by the sync and async JSON runners.
+
+    Yields each LLM call and cache eviction; the driver sends back the parsed JSON or throws the call's
+    exception in.
+    Returns the validated data, or the fallback (raises when strict) once retries are exhausted.
+    """
     client = shared["llm_client"]
     schema_text = json.dumps(schema, ensure_ascii=False)
     last_error = None
@@ -33,22 +79,114 @@ def run_json_agent_with_retry(
             continue
 
         if not client.enabled:
+            if strict:
+                raise RuntimeError(f"{warn_tag}: LLM未配置，无法执行严格生成")
             shared.setdefault("warnings", []).append(f"{warn_tag}: LLM未配置，使用降级结果")
             return fallback
 
         try:
-            data = client.generate_json("Return strictly valid JSON only.", prompt)
+            data = yield "call", prompt, _attempt_delta(schema, attempt, on_delta, stream_items_key, on_item)
             validate_jsonschema(data, schema)
             if custom_validator:
                 custom_validator(data)
             return data
         except Exception as exc:
             last_error = exc
+            yield "evict", prompt
 
+    if strict:
+        raise RuntimeError(f"{warn_tag}: LLM严格生成失败: {last_error}")
     shared.setdefault("warnings", []).append(f"{warn_tag}: JSON schema校验失败，使用降级结果: {last_error}")
     return fallback
 
 
+def _text_agent_steps(
+    *,
+    shared: Dict[str, Any],
+    template_name: str,
+    variables: Dict[str, Any],
+    fallback: str,
+    warn_tag: str,
+    on_delta: Optional[Callable[[str], None]],
+) -> AgentSteps:
+    if not shared["llm_client"].enabled:
+        shared.setdefault("warnings", []).append(f"{warn_tag}: LLM未配置，使用降级结果")
+        return fallback
+    try:
+        prompt = render_prompt(template_name, variables)
+        return (yield "call", prompt, on_delta)
+    except Exception as exc:
+        shared.setdefault("warnings", []).append(f"{warn_tag}: LLM调用失败，使用降级结果: {exc}")
+        return fallback
+
+
+def _drive(
+    steps: AgentSteps,
+    call: Callable[[str, Optional[Callable[[str], None]]], Any],
+    evict: Optional[Callable[[str], None]] = None,
+) -> Any:
+    try:
+        request = next(steps)
+        while True:
+            try:
+                result = call(*request[1:]) if request[0] == "call" else evict(request[1])
+            except Exception as exc:
+                request = steps.throw(exc)
+            else:
+                request = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+async def _adrive(
+    steps: AgentSteps,
+    call: Callable[[str, Optional[Callable[[str], None]]], Awaitable[Any]],
+    evict: Optional[Callable[[str], None]] = None,
+) -> Any:
+    try:
+        request = next(steps)
+        while True:
+            try:
+                if request[0] == "call":
+                    result = await call(*request[1:])
+                else:
+                    # Eviction is a SQLite write; keep it off the event loop.
+                    result = await asyncio.to_thread(evict, request[1])
+            except Exception as exc:
+                request = steps.throw(exc)
+            else:
+                request = steps.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_json_agent_with_retry(
+    *,
+    shared: Dict[str, Any],
+    template_name: str,
+    variables: Dict[str, Any],
+    schema: Dict[str, Any],
+    fallback: Any,
+    warn_tag: str,
+    max_retries: int = 2,
+    custom_validator: Optional[Callable[[Any], None]] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    stream_items_key: Optional[str] = None,
+    on_item: Optional[Callable[[int, int, Any], None]] = None,
+) -> Any:
+    client = shared["llm_client"]
+    steps = _json_agent_steps(
+        shared=shared, template_name=template_name, variables=variables, schema=schema, warn_tag=warn_tag,
+        max_retries=max_retries, custom_validator=custom_validator, on_delta=on_delta,
+        stream_items_key=stream_items_key, on_item=on_item, strict=False, fallback=fallback,
+    )
+    return _drive(
+        steps,
+        lambda prompt, delta: client.generate_json(JSON_SYSTEM_PROMPT, prompt, on_delta=delta),
+        lambda prompt: client.evict(JSON_SYSTEM_PROMPT, prompt),
+    )
+
+
 def run_json_agent_strict_with_retry(
     *,
     shared: Dict[str, Any],
@@ -58,35 +196,76 @@ def run_json_agent_strict_with_retry(
     warn_tag: str,
     max_retries: int = 2,
     custom_validator: Optional[Callable[[Any], None]] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    stream_items_key: Optional[str] = None,
+    on_item: Optional[Callable[[int, int, Any], None]] = None,
 ) -> Any:
     client = shared["llm_client"]
-    schema_text = json.dumps(schema, ensure_ascii=False)
-    last_error = None
+    steps = _json_agent_steps(
+        shared=shared, template_name=template_name, variables=variables, schema=schema, warn_tag=warn_tag,
+        max_retries=max_retries, custom_validator=custom_validator, on_delta=on_delta,
+        stream_items_key=stream_items_key, on_item=on_item, strict=True,
+    )
+    return _drive(
+        steps,
+        lambda prompt, delta: client.generate_json(JSON_SYSTEM_PROMPT, prompt, on_delta=delta),
+        lambda prompt: client.evict(JSON_SYSTEM_PROMPT, prompt),
+    )
 
-    for _ in range(max_retries + 1):
-        run_vars = dict(variables)
-        run_vars.setdefault("output_schema", schema_text)
-        if last_error:
-            run_vars["last_error"] = str(last_error)
-        try:
-            prompt = render_prompt(template_name, run_vars)
-        except Exception as exc:
-            last_error = exc
-            continue
 
-        if not client.enabled:
-            raise RuntimeError(f"{warn_tag}: LLM未配置，无法执行严格生成")
+async def arun_json_agent_with_retry(
+    *,
+    shared: Dict[str, Any],
+    template_name: str,
+    variables: Dict[str, Any],
+    schema: Dict[str, Any],
+    fallback: Any,
+    warn_tag: str,
+    max_retries: int = 2,
+    custom_validator: Optional[Callable[[Any], None]] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    stream_items_key: Optional[str] = None,
+    on_item: Optional[Callable[[int, int, Any], None]] = None,
+) -> Any:
+    """Async twin of run_json_agent_with_retry on the pooled LLMClient.agenerate_json transport."""
+    client = shared["llm_client"]
+    steps = _json_agent_steps(
+        shared=shared, template_name=template_name, variables=variables, schema=schema, warn_tag=warn_tag,
+        max_retries=max_retries, custom_validator=custom_validator, on_delta=on_delta,
+        stream_items_key=stream_items_key, on_item=on_item, strict=False, fallback=fallback,
+    )
+    return await _adrive(
+        steps,
+        lambda prompt, delta: client.agenerate_json(JSON_SYSTEM_PROMPT, prompt, on_delta=delta),
+        lambda prompt: client.evict(JSON_SYSTEM_PROMPT, prompt),
+    )
 
-        try:
-            data = client.generate_json("Return strictly valid JSON only.", prompt)
-            validate_jsonschema(data, schema)
-            if custom_validator:
-                custom_validator(data)
-            return data
-        except Exception as exc:
-            last_error = exc
 
-    raise RuntimeError(f"{warn_tag}: LLM严格生成失败: {last_error}")
+async def arun_json_agent_strict_with_retry(
+    *,
+    shared: Dict[str, Any],
+    template_name: str,
+    variables: Dict[str, Any],
+    schema: Dict[str, Any],
+    warn_tag: str,
+    max_retries: int = 2,
+    custom_validator: Optional[Callable[[Any], None]] = None,
+    on_delta: Optional[Callable[[str], None]] = None,
+    stream_items_key: Optional[str] = None,
+    on_item: Optional[Callable[[int, int, Any], None]] = None,
+) -> Any:
+    """Async twin of run_json_agent_strict_with_retry."""
+    client = shared["llm_client"]
+    steps = _json_agent_steps(
+        shared=shared, template_name=template_name, variables=variables, schema=schema, warn_tag=warn_tag,
+        max_retries=max_retries, custom_validator=custom_validator, on_delta=on_delta,
+        stream_items_key=stream_items_key, on_item=on_item, strict=True,
+    )
+    return await _adrive(
+        steps,
+        lambda prompt, delta: client.agenerate_json(JSON_SYSTEM_PROMPT, prompt, on_delta=delta),
+        lambda prompt: client.evict(JSON_SYSTEM_PROMPT, prompt),
+    )
 
 
 def run_text_agent(
@@ -96,14 +275,27 @@ def run_text_agent(
     variables: Dict[str, Any],
     fallback: str,
     warn_tag: str,
+    on_delta: Optional[Callable[[str], None]] = None,
 ) -> str:
     client = shared["llm_client"]
-    if not client.enabled:
-        shared.setdefault("warnings", []).append(f"{warn_tag}: LLM未配置，使用降级结果")
-        return fallback
-    try:
-        prompt = render_prompt(template_name, variables)
-        return client.generate("Return practical content only.", prompt)
-    except Exception as exc:
-        shared.setdefault("warnings", []).append(f"{warn_tag}: LLM调用失败，使用降级结果: {exc}")
-        return fallback
+    steps = _text_agent_steps(
+        shared=shared, template_name=template_name, variables=variables, fallback=fallback, warn_tag=warn_tag, on_delta=on_delta
+    )
+    return _drive(steps, lambda prompt, delta: client.generate(TEXT_SYSTEM_PROMPT, prompt, on_delta=delta))
+
+
+async def arun_text_agent(
+    *,
+    shared: Dict[str, Any],
+    template_name: str,
+    variables: Dict[str, Any],
+    fallback: str,
+    warn_tag: str,
+    on_delta: Optional[Callable[[str], None]] = None,
+) -> str:
+    """Async twin of run_text_agent for nodes that fan out LLM calls on the event loop."""
+    client = shared["llm_client"]
+    steps = _text_agent_steps(
+        shared=shared, template_name=template_name, variables=variables, fallback=fallback, warn_tag=warn_tag, on_delta=on_delta
+    )
+    return await _adrive(steps, lambda prompt, delta: client.agenerate(TEXT_SYSTEM_PROMPT, prompt, on_delta=delta))
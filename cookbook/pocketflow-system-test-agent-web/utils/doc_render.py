@@ -0,0 +1,152 @@
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+class SectionCache:
+    """LRU of rendered HTML sections keyed by (section name, hash of the section's inputs)."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[tuple, str]" = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, name: str, render: Callable[..., str], *inputs: Any) -> str:
+        digest = hashlib.sha1(json.dumps(inputs, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        key = (name, digest)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+        out = render(*inputs)
+        with self._lock:
+            self._entries[key] = out
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Content-Encoding -> file suffix of the pre-compressed variant.
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_precompressed(path: Path, text: str) -> Dict[str, Any]:
+    """Writes `text` plus .gz (and .br when brotli is installed) variants and a .meta.json holding the ETag."""
+    data = text.encode("utf-8")
+    meta = {"etag": hashlib.sha1(data).hexdigest()[:20], "encodings": ["gzip"]}
+    _write_atomic(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=6, mtime=0))
+    if brotli is not None:
+        _write_atomic(path.with_name(path.name + ".br"), brotli.compress(data, quality=5))
+        meta["encodings"].insert(0, "br")
+    _write_atomic(path, data)
+    # The meta file goes last: once it names an ETag, every variant for that ETag is on disk.
+    _write_atomic(path.with_name(path.name + ".meta.json"), json.dumps(meta).encode("utf-8"))
+    return meta
+
+
+def invalidate_precompressed(path: Path) -> None:
+    """Removes the .meta.json of `path`, so readers treat the document as not rendered yet."""
+    path.with_name(path.name + ".meta.json").unlink(missing_ok=True)
+
+
+def read_precompressed_meta(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.with_name(path.name + ".meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def pick_encoding(accept_encoding: str, available: List[str]) -> Optional[str]:
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        if params.replace(" ", "").lower() not in {"q=0", "q=0.0", "q=0.00", "q=0.000"}:
+            accepted.add(name.strip().lower())
+    for enc in available:
+        if enc in accepted:
+            return enc
+    return None
+
+
+# Marks a queued render whose input was dropped by shutdown().
+_DROPPED = object()
+
+
+class CoalescingRenderer:
+    """Runs `render(key, item)` on one background thread, keeping only the newest item per key.
+
+    Submitting while a render for the same key is queued replaces its input; submitting while one is
+    running queues a follow-up. `pending(key)` returns the future to wait on, or None when up to date.
+    Once `shutdown()` starts, new submissions and renders that have not started yet are dropped.
+    """
+
+    def __init__(self, render: Callable[[str, Any], None]):
+        self._render = render
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="doc-render")
+        self._lock = threading.Lock()
+        self._items: Dict[str, Any] = {}
+        self._futures: Dict[str, Future] = {}
+        self._closed = False
+
+    def submit(self, key: str, item: Any) -> Optional[Future]:
+        """Returns the future of the queued render, or None if the renderer is shut down and `item` was dropped."""
+        with self._lock:
+            if self._closed:
+                return None
+            self._items[key] = item
+            fut = self._futures.get(key)
+            if fut is None:
+                fut = self._futures[key] = self._executor.submit(self._run, key)
+            return fut
+
+    def pending(self, key: str) -> Optional[Future]:
+        with self._lock:
+            return self._futures.get(key)
+
+    def _run(self, key: str) -> None:
+        with self._lock:
+            item = self._items.pop(key, _DROPPED)
+        try:
+            if item is not _DROPPED:
+                self._render(key, item)
+        finally:
+            with self._lock:
+                if key in self._items and not self._closed:
+                    self._futures[key] = self._executor.submit(self._run, key)
+                else:
+                    del self._futures[key]
+
+    def shutdown(self) -> List[str]:
+        """Waits for the render in progress and returns the keys whose queued renders were dropped."""
+        with self._lock:
+            self._closed = True
+            dropped = list(self._items)
+            self._items.clear()
+        self._executor.shutdown(wait=True)
+        return dropped
@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import json
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from utils.job_store import TERMINAL_STATUSES, JobStore
+
+# (event id or None for live-only events, event, SSE frame)
+BusItem = Tuple[Optional[int], Dict[str, Any], str]
+
+TERMINAL_EVENT_TYPES = {"completed", "error"}
+
+
+def sse_frame(ev: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}data: {json.dumps(ev, ensure_ascii=False)}\n\n"
+
+
+class _Topic:
+    __slots__ = ("ring", "subscribers")
+
+    def __init__(self, ring_size: int):
+        self.ring: Deque[BusItem] = collections.deque(maxlen=ring_size)
+        self.subscribers: Set[asyncio.Queue] = set()
+
+
+class EventBus:
+    """In-process pub/sub for job events, used from the event loop thread.
+
+    Each event is serialised to an SSE frame once and the same frame is handed to every subscriber.
+    Events with an id are kept in a fixed-size ring per topic so late or reconnecting subscribers can
+    replay what they missed; events without an id (token deltas) are delivered live only.
+    A subscriber that falls queue_size items behind is dropped: its queue is emptied and left holding
+    a single None, after which the subscriber has to catch up from the job store.
+    """
+
+    def __init__(self, ring_size: int = 256, queue_size: int = 1024):
+        self.ring_size = ring_size
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._topics: Dict[str, _Topic] = {}
+
+    def open(self, topic: str) -> None:
+        self._topics.setdefault(topic, _Topic(self.ring_size))
+
+    def close(self, topic: str) -> None:
+        """Forget a finished topic; current subscribers keep what was already queued."""
+        self._topics.pop(topic, None)
+
+    def publish(self, topic: str, ev: Dict[str, Any], event_id: Optional[int] = None) -> None:
+        t = self._topics.get(topic)
+        if t is None:
+            return
+        item: BusItem = (event_id, ev, sse_frame(ev, event_id))
+        if event_id is not None:
+            t.ring.append(item)
+        for q in list(t.subscribers):
+            try:
+                q.put_nowait(item)
+            except asyncio.QueueFull:
+                self._drop(t, q)
+
+    def _drop(self, t: _Topic, q: asyncio.Queue) -> None:
+        t.subscribers.discard(q)
+        while not q.empty():
+            q.get_nowait()
+        q.put_nowait(None)
+        self.dropped += 1
+
+    def subscribe(self, topic: str, after: int = 0) -> Optional[Tuple[asyncio.Queue, List[BusItem]]]:
+        """Returns (queue of new items, ring items with id > after), or None if the topic is not open here."""
+        t = self._topics.get(topic)
+        if t is None:
+            return None
+        q: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        t.subscribers.add(q)
+        return q, [item for item in t.ring if item[0] > after]
+
+    def unsubscribe(self, topic: str, q: asyncio.Queue) -> None:
+        t = self._topics.get(topic)
+        if t is not None:
+            t.subscribers.discard(q)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(t.subscribers) for t in self._topics.values()),
+            "ring_size": self.ring_size,
+            "queue_size": self.queue_size,
+            "dropped_subscribers": self.dropped,
+        }
+
+
+def _stored_items(store: JobStore, job_id: str, after: int, before: Optional[int] = None) -> List[BusItem]:
+    return [(seq, ev, sse_frame(ev, seq)) for seq, ev in store.events(job_id, after) if before is None or seq < before]
+
+
+async def follow_job_events(
+    bus: EventBus,
+    store: JobStore,
+    job_id: str,
+    after: int = 0,
+    replay: Optional[int] = None,
+    poll_s: float = 0.5,
+) -> AsyncIterator[BusItem]:
+    """Yields (event id, event, SSE frame) for events after `after`, then new ones until a terminal event.
+
+    A fresh subscriber (after=0) gets only the last `replay` stored events. Jobs running in this worker
+    are followed on the bus, whose ring serves the replay unless it no longer reaches back far enough;
+    jobs running in another worker, and subscribers the bus dropped for falling behind, poll the store.
+    """
+    sub = bus.subscribe(job_id, after)
+    try:
+        if sub is not None:
+            backlog = sub[1]
+            wanted = replay if after == 0 and replay is not None else None
+            if (not backlog or backlog[0][0] > after + 1) and (wanted is None or len(backlog) < wanted):
+                before = backlog[0][0] if backlog else None
+                backlog = await asyncio.to_thread(_stored_items, store, job_id, after, before) + backlog
+        else:
+            backlog = await asyncio.to_thread(_stored_items, store, job_id, after)
+        last = backlog[-1][0] if backlog else after
+        if after == 0 and replay is not None:
+            backlog = backlog[-replay:]
+        for item in backlog:
+            yield item
+            if item[1].get("type") in TERMINAL_EVENT_TYPES:
+                return
+        while True:
+            if sub is not None:
+                item = await sub[0].get()
+                if item is None:
+                    sub = None  # dropped by the bus; catch up from the store
+                    continue
+                if item[0] is not None:
+                    if item[0] <= last:
+                        continue
+                    last = item[0]
+                yield item
+                if item[1].get("type") in TERMINAL_EVENT_TYPES:
+                    return
+                continue
+            # Read the status first: terminal status is stored before the terminal event is appended.
+            state = await asyncio.to_thread(store.get, job_id)
+            rows = await asyncio.to_thread(_stored_items, store, job_id, last)
+            for item in rows:
+                last = item[0]
+                yield item
+                if item[1].get("type") in TERMINAL_EVENT_TYPES:
+                    return
+            if not rows:
+                if state is None or state["status"] in TERMINAL_STATUSES:
+                    return
+                await asyncio.sleep(poll_s)
+    finally:
+        if sub is not None:
+            bus.unsubscribe(job_id, sub[0])
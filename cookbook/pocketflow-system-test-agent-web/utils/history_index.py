@@ -0,0 +1,118 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+SORT_COLUMNS = ("updated_at", "created_at", "title", "testcase_count")
+
+_COLUMNS = (
+    "record_id",
+    "title",
+    "status",
+    "created_at",
+    "updated_at",
+    "requirement_count",
+    "objective_count",
+    "matrix_row_count",
+    "testcase_count",
+    "has_testcases",
+)
+
+
+class DesignHistoryIndex:
+    """Precomputed design-history summaries in SQLite, so listing never opens the record files.
+
+    Rows are written next to each record.json; `query` pages, sorts and filters on indexed columns.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS designs ("
+            "record_id TEXT PRIMARY KEY, title TEXT NOT NULL, status TEXT NOT NULL, "
+            "created_at TEXT NOT NULL, updated_at TEXT NOT NULL, requirement_count INTEGER NOT NULL, "
+            "objective_count INTEGER NOT NULL, matrix_row_count INTEGER NOT NULL, "
+            "testcase_count INTEGER NOT NULL, has_testcases INTEGER NOT NULL)"
+        )
+        for col in SORT_COLUMNS:
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_designs_{col} ON designs({col}, record_id)")
+
+    def upsert(self, summary: Dict[str, Any]) -> None:
+        self.upsert_many([summary])
+
+    def upsert_many(self, summaries: Iterable[Dict[str, Any]]) -> int:
+        rows = [tuple(int(s[c]) if c == "has_testcases" else s[c] for c in _COLUMNS) for s in summaries]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO designs({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})", rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def remove(self, record_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM designs WHERE record_id = ?", (record_id,))
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_COLUMNS)} FROM designs WHERE record_id = ?", (record_id,)).fetchone()
+        if row is None:
+            return None
+        item = dict(zip(_COLUMNS, row))
+        item["has_testcases"] = bool(item["has_testcases"])
+        return item
+
+    def record_ids(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT record_id FROM designs").fetchall()]
+
+    def query(
+        self,
+        *,
+        offset: int = 0,
+        limit: int = 50,
+        sort: str = "updated_at",
+        descending: bool = True,
+        status: Optional[str] = None,
+        has_testcases: Optional[bool] = None,
+        title_contains: Optional[str] = None,
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """Returns (total matching rows, one page of summaries)."""
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_COLUMNS)}")
+        where: List[str] = []
+        args: List[Any] = []
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        if has_testcases is not None:
+            where.append("has_testcases = ?")
+            args.append(int(has_testcases))
+        if title_contains:
+            where.append("title LIKE ? ESCAPE '\\'")
+            args.append("%" + title_contains.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        direction = "DESC" if descending else "ASC"
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM designs{clause}", args).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM designs{clause} "
+                f"ORDER BY {sort} {direction}, record_id {direction} LIMIT ? OFFSET ?",
+                (*args, max(0, int(limit)), max(0, int(offset))),
+            ).fetchall()
+        items = []
+        for row in rows:
+            item = dict(zip(_COLUMNS, row))
+            item["has_testcases"] = bool(item["has_testcases"])
+            items.append(item)
+        return total, items
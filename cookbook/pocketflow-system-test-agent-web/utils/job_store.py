@@ -0,0 +1,156 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+TERMINAL_STATUSES = {"completed", "failed"}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobStore:
+    """Job status, results and event logs in a local SQLite file shared by every uvicorn worker.
+
+    Each job row holds its public state as JSON plus the worker that runs it; events are numbered
+    per job so readers can tail the log from any worker. Jobs untouched for ttl_s seconds are
+    evicted together with their events, and at most max_events events are kept per job.
+    """
+
+    def __init__(self, path: Path, ttl_s: float = 24 * 3600, max_events: int = 500):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.max_events = max_events
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, data TEXT NOT NULL, "
+            "owner TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs(updated_at)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (job_id, seq))"
+        )
+
+    def create(self, job_id: str, kind: str, status: str = "running", **data: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs(job_id, kind, status, data, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, status, json.dumps(data, ensure_ascii=False), self.owner, now, now),
+            )
+            self._evict(now)
+
+    def get(self, job_id: str, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, status, data, owner, created_at, updated_at FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None or (kind is not None and row[0] != kind):
+            return None
+        return {
+            **json.loads(row[2]),
+            "job_id": job_id,
+            "kind": row[0],
+            "status": row[1],
+            "owner": row[3],
+            "created_at": row[4],
+            "updated_at": row[5],
+        }
+
+    def update(self, job_id: str, status: Optional[str] = None, **data: Any) -> None:
+        """Set status and merge `data` into the job's stored state."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT status, data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is not None:
+                    merged = {**json.loads(row[1]), **data}
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE job_id = ?",
+                        (status or row[0], json.dumps(merged, ensure_ascii=False), time.time(), job_id),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def append_event(self, job_id: str, event: Dict[str, Any]) -> int:
+        """Append `event` to the job's log and return its sequence number (1, 2, ...)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO job_events(job_id, seq, event, created_at) VALUES (?, ?, ?, ?)",
+                    (job_id, seq, json.dumps(event, ensure_ascii=False), now),
+                )
+                self._conn.execute("UPDATE jobs SET updated_at = ? WHERE job_id = ?", (now, job_id))
+                if seq > self.max_events and seq % 50 == 0:
+                    self._conn.execute("DELETE FROM job_events WHERE job_id = ? AND seq <= ?", (job_id, seq - self.max_events))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return seq
+
+    def events(self, job_id: str, after: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def fail_orphans(self, error: str) -> int:
+        """Mark unfinished jobs whose worker process on this host is gone as failed."""
+        host = self.owner.rsplit(":", 1)[0]
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, owner FROM jobs WHERE status NOT IN (?, ?)", tuple(sorted(TERMINAL_STATUSES))
+            ).fetchall()
+        orphans = []
+        for job_id, owner in rows:
+            owner_host, _, pid = owner.rpartition(":")
+            if owner != self.owner and owner_host == host and pid.isdigit() and not _pid_alive(int(pid)):
+                orphans.append(job_id)
+        for job_id in orphans:
+            self.update(job_id, status="failed", error=error)
+            self.append_event(job_id, {"type": "error", "payload": {"job_id": job_id, "error": error}})
+        return len(orphans)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_s <= 0:
+            return
+        cutoff = now - self.ttl_s
+        self._conn.execute(
+            "DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE updated_at < ?)", (cutoff,)
+        )
+        self._conn.execute("DELETE FROM jobs WHERE updated_at < ?", (cutoff,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            events = self._conn.execute("SELECT COUNT(*) FROM job_events").fetchone()[0]
+        return {"jobs": counts, "events": events, "ttl_s": self.ttl_s, "owner": self.owner}
@@ -0,0 +1,119 @@
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.schema_validation import validate_jsonschema
+
+
+def array_item_schema(schema: Dict[str, Any], key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Sub-schema for the elements of `schema[key]` (or of the top-level array when key is None)."""
+    node = schema if key is None else (schema.get("properties", {}) or {}).get(key, {})
+    items = node.get("items") if isinstance(node, dict) else None
+    return items if isinstance(items, dict) else None
+
+
+class StreamingArrayParser:
+    """Incrementally scan streamed LLM text and yield elements of one JSON array as they close.
+
+    Targets `{"<key>": [ ... ]}` at the top level of the first JSON object, or the top-level
+    array itself when key is None. Text before the first bracket (```json fences, prose) is
+    skipped. Each completed element is json-decoded and validated against item_schema; a
+    malformed or invalid element raises ValueError so the caller can abort the generation.
+    """
+
+    def __init__(
+        self,
+        key: Optional[str],
+        item_schema: Optional[Dict[str, Any]] = None,
+        on_item: Optional[Callable[[int, Any], None]] = None,
+    ):
+        self.key = key
+        self.item_schema = item_schema
+        self.on_item = on_item
+        self.items: List[Any] = []
+        self.done = False
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_str = False
+        self._esc = False
+        self._str_start = 0
+        self._last_str = ""
+        self._cur_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk and return the elements completed by it."""
+        if self.done or not chunk:
+            return []
+        self._text += chunk
+        completed: List[Any] = []
+        text = self._text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._stack and self._stack[-1] == "{":
+                        self._last_str = text[self._str_start + 1 : i]
+                continue
+            if not self._stack and c not in "{[":
+                continue
+
+            at_array = self._array_depth is not None and len(self._stack) == self._array_depth
+            if at_array and self._item_start is None and c not in " \t\r\n,]":
+                self._item_start = i
+
+            if c == '"':
+                self._in_str = True
+                self._str_start = i
+            elif c in "{[":
+                self._stack.append(c)
+                if c == "[" and self._array_depth is None and self._is_target_array():
+                    self._array_depth = len(self._stack)
+            elif c in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._array_depth is None:
+                    continue
+                if len(self._stack) == self._array_depth and self._item_start is not None:
+                    completed.append(self._finish_item(text[self._item_start : i + 1]))
+                elif len(self._stack) == self._array_depth - 1:
+                    if self._item_start is not None:
+                        completed.append(self._finish_item(text[self._item_start : i]))
+                    self.done = True
+                    self._pos = i + 1
+                    return completed
+            elif c == "," and at_array and self._item_start is not None:
+                completed.append(self._finish_item(text[self._item_start : i]))
+            elif c == ":" and self._stack[-1] == "{":
+                self._cur_key = self._last_str
+        self._pos = len(text)
+        return completed
+
+    def _is_target_array(self) -> bool:
+        if self.key is None:
+            return len(self._stack) == 1
+        return len(self._stack) == 2 and self._stack[0] == "{" and self._cur_key == self.key
+
+    def _finish_item(self, raw: str) -> Any:
+        self._item_start = None
+        idx = len(self.items)
+        label = f"{self.key or '$'}[{idx}]"
+        try:
+            item = json.loads(raw.strip())
+        except Exception as exc:
+            raise ValueError(f"{label}: malformed JSON element: {exc}") from exc
+        if self.item_schema is not None:
+            try:
+                validate_jsonschema(item, self.item_schema)
+            except ValueError as exc:
+                raise ValueError(f"{label}: {exc}") from exc
+        self.items.append(item)
+        if self.on_item is not None:
+            self.on_item(idx, item)
+        return item
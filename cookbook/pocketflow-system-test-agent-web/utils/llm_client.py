@@ -1,34 +1,81 @@
+import asyncio
+import importlib.util
 import json
 import os
 import re
+import threading
 import urllib.error
 import urllib.request
+import weakref
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from utils.llm_cache import LLMResponseCache, cache_key, get_default_cache
+from utils.llm_limiter import AdaptiveLimiter, Permit, estimate_tokens, get_default_limiter
+
+try:
+    import httpx  # type: ignore
+except Exception:  # pragma: no cover
+    httpx = None
+
+
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+_REQUEST_TIMEOUT_S = 120
+# HTTP statuses that mean "slow down" rather than "this request is wrong".
+_THROTTLE_STATUSES = {429, 503}
+
+# Called with each streamed content delta as it arrives from /chat/completions.
+DeltaCallback = Callable[[str], None]
+
+# Transports are process-wide so every LLMClient() instance reuses the same keep-alive pool.
+_sync_http: Optional[Any] = None
+_sync_http_lock = threading.Lock()
+# Async transports are per event loop and keyed by (api_base, max_concurrency), so a client asking
+# for a different limit gets its own pool and semaphore instead of inheriting the first caller's.
+_async_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, int], Tuple[Any, asyncio.Semaphore]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class LLMRequestError(RuntimeError):
+    """Transport-level LLM failure, carrying what the limiter needs to back off."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None, timed_out: bool = False):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.timed_out = timed_out
 
 
 class LLMClient:
-    def __init__(self):
+    def __init__(self, max_concurrency: Optional[int] = None, use_cache: bool = True, job_key: str = "default"):
         _load_local_env()
         self.api_base = os.getenv("LLM_API_BASE", "").rstrip("/")
         self.api_key = os.getenv("LLM_API_KEY", "")
         self.model = os.getenv("LLM_MODEL", "")
+        self.max_concurrency = max(1, int(max_concurrency or os.getenv("LLM_MAX_CONCURRENCY", "16")))
+        self.use_cache = use_cache
+        self.cache: Optional[LLMResponseCache] = get_default_cache()
+        # All clients share one limiter; job_key groups a job's requests for fair scheduling.
+        self.limiter: AdaptiveLimiter = get_default_limiter()
+        self.job_key = job_key
+        self.completion_token_estimate = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "1024"))
 
     @property
     def enabled(self) -> bool:
         return bool(self.api_base and self.api_key and self.model)
 
-    def generate(
+    def _payload(
         self,
         system_prompt: str,
         user_prompt: str,
-        temperature: float = 0.2,
-        max_tokens: Optional[int] = None,
-    ) -> str:
+        temperature: float,
+        max_tokens: Optional[int],
+        stream: bool = False,
+    ) -> Dict[str, Any]:
         if not self.enabled:
             raise RuntimeError("LLM config is missing. Set LLM_API_BASE, LLM_API_KEY, LLM_MODEL.")
-
-        payload = {
+        payload: Dict[str, Any] = {
             "model": self.model,
             "messages": [
                 {"role": "system", "content": system_prompt},
@@ -38,35 +85,342 @@ class LLMClient:
         }
         if max_tokens is not None:
             payload["max_tokens"] = max_tokens
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+    def _cache_key(
+        self, system_prompt: str, user_prompt: str, temperature: float, max_tokens: Optional[int], use_cache: Optional[bool]
+    ) -> Optional[str]:
+        if not self.enabled:
+            raise RuntimeError("LLM config is missing. Set LLM_API_BASE, LLM_API_KEY, LLM_MODEL.")
+        if self.cache is None or not (self.use_cache if use_cache is None else use_cache):
+            return None
+        return cache_key(self.model, system_prompt, user_prompt, temperature, max_tokens)
+
+    def _cached(self, key: Optional[str], on_delta: Optional[DeltaCallback]) -> Optional[str]:
+        if key is None:
+            return None
+        text = self.cache.get(key)
+        if text is not None and on_delta is not None:
+            on_delta(text)
+        return text
+
+    async def _acached(self, key: Optional[str], on_delta: Optional[DeltaCallback]) -> Optional[str]:
+        # The cache is SQLite on disk; keep its I/O off the event loop, but call on_delta on it.
+        if key is None:
+            return None
+        text = await asyncio.to_thread(self.cache.get, key)
+        if text is not None and on_delta is not None:
+            on_delta(text)
+        return text
+
+    def evict(self, system_prompt: str, user_prompt: str, temperature: float = 0.2, max_tokens: Optional[int] = None):
+        """Drop a cached response, e.g. after it failed parsing or schema validation."""
+        if self.cache is not None and self.enabled:
+            self.cache.delete(cache_key(self.model, system_prompt, user_prompt, temperature, max_tokens))
+
+    def _reserve_tokens(self, system_prompt: str, user_prompt: str, max_tokens: Optional[int]) -> int:
+        return estimate_tokens(system_prompt, user_prompt) + (max_tokens or self.completion_token_estimate)
 
+    def _release(self, permit: Permit, system_prompt: str, user_prompt: str, text: Optional[str], exc: Optional[BaseException]):
+        if isinstance(exc, LLMRequestError):
+            self.limiter.release(
+                permit,
+                throttled=exc.status in _THROTTLE_STATUSES,
+                timed_out=exc.timed_out,
+                retry_after=exc.retry_after,
+            )
+        elif exc is not None:
+            self.limiter.release(permit)
+        else:
+            self.limiter.release(permit, tokens_used=estimate_tokens(system_prompt, user_prompt, text or ""))
+
+    def generate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.2,
+        max_tokens: Optional[int] = None,
+        on_delta: Optional[DeltaCallback] = None,
+        use_cache: Optional[bool] = None,
+    ) -> str:
+        """Return the completion text. With on_delta, stream it and report each delta as it arrives.
+
+        Responses are served from and stored in the response cache unless use_cache (or the
+        client-level default) disables it for this request.
+        """
+        key = self._cache_key(system_prompt, user_prompt, temperature, max_tokens, use_cache)
+        text = self._cached(key, on_delta)
+        if text is None:
+            text = self._generate_uncached(system_prompt, user_prompt, temperature, max_tokens, on_delta)
+            if key is not None:
+                self.cache.set(key, text)
+        return text
+
+    def _generate_uncached(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        on_delta: Optional[DeltaCallback],
+    ) -> str:
+        permit = self.limiter.acquire(self.job_key, self._reserve_tokens(system_prompt, user_prompt, max_tokens))
+        try:
+            text = self._send(system_prompt, user_prompt, temperature, max_tokens, on_delta)
+        except BaseException as exc:
+            self._release(permit, system_prompt, user_prompt, None, exc)
+            raise
+        self._release(permit, system_prompt, user_prompt, text, None)
+        return text
+
+    def _send(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        on_delta: Optional[DeltaCallback],
+    ) -> str:
+        stream = on_delta is not None
+        payload = self._payload(system_prompt, user_prompt, temperature, max_tokens, stream=stream)
         url = f"{self.api_base}/chat/completions"
+        if httpx is not None:
+            try:
+                if stream:
+                    with _get_sync_http().stream("POST", url, json=payload, headers=self._headers()) as resp:
+                        if resp.status_code >= 400:
+                            resp.read()
+                            _raise_http_error(resp.status_code, resp.text, resp.headers)
+                        return _collect_stream(resp.iter_lines(), on_delta)
+                resp = _get_sync_http().post(url, json=payload, headers=self._headers())
+            except RuntimeError:
+                raise
+            except Exception as exc:
+                raise LLMRequestError(f"LLM request failed: {exc}", timed_out=_is_timeout(exc)) from exc
+            return _content_from_response(resp.status_code, resp.text, resp.headers)
+
         req = urllib.request.Request(
             url=url,
             data=json.dumps(payload).encode("utf-8"),
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {self.api_key}",
-            },
+            headers=self._headers(),
             method="POST",
         )
-
         try:
-            with urllib.request.urlopen(req, timeout=120) as resp:
-                body = json.loads(resp.read().decode("utf-8"))
+            with urllib.request.urlopen(req, timeout=_REQUEST_TIMEOUT_S) as resp:
+                if stream:
+                    return _collect_stream((line.decode("utf-8", errors="ignore") for line in resp), on_delta)
+                return _content_from_response(resp.status, resp.read().decode("utf-8"))
         except urllib.error.HTTPError as exc:
             details = exc.read().decode("utf-8", errors="ignore")
-            raise RuntimeError(f"LLM HTTP error: {exc.code} {details}") from exc
+            _raise_http_error(exc.code, details, exc.headers, cause=exc)
+        except RuntimeError:
+            raise
         except Exception as exc:
-            raise RuntimeError(f"LLM request failed: {exc}") from exc
+            raise LLMRequestError(f"LLM request failed: {exc}", timed_out=_is_timeout(exc)) from exc
 
+    def generate_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_delta: Optional[DeltaCallback] = None,
+        use_cache: Optional[bool] = None,
+    ) -> Any:
+        text = self.generate(system_prompt, user_prompt, on_delta=on_delta, use_cache=use_cache)
+        try:
+            return parse_json_from_llm(text)
+        except ValueError:
+            self.evict(system_prompt, user_prompt)
+            raise
+
+    async def agenerate(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float = 0.2,
+        max_tokens: Optional[int] = None,
+        on_delta: Optional[DeltaCallback] = None,
+        use_cache: Optional[bool] = None,
+    ) -> str:
+        key = self._cache_key(system_prompt, user_prompt, temperature, max_tokens, use_cache)
+        text = await self._acached(key, on_delta)
+        if text is None:
+            text = await self._agenerate_uncached(system_prompt, user_prompt, temperature, max_tokens, on_delta)
+            if key is not None:
+                await asyncio.to_thread(self.cache.set, key, text)
+        return text
+
+    async def _agenerate_uncached(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        on_delta: Optional[DeltaCallback],
+    ) -> str:
+        client, sem = _get_async_transport(self.api_base, self.max_concurrency)
+        permit = await self.limiter.aacquire(self.job_key, self._reserve_tokens(system_prompt, user_prompt, max_tokens))
+        try:
+            async with sem:
+                if client is None:
+                    # No httpx installed: fall back to the blocking transport on a worker thread.
+                    text = await asyncio.to_thread(self._send, system_prompt, user_prompt, temperature, max_tokens, on_delta)
+                else:
+                    text = await self._asend(client, system_prompt, user_prompt, temperature, max_tokens, on_delta)
+        except BaseException as exc:
+            self._release(permit, system_prompt, user_prompt, None, exc)
+            raise
+        self._release(permit, system_prompt, user_prompt, text, None)
+        return text
+
+    async def _asend(
+        self,
+        client: Any,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        on_delta: Optional[DeltaCallback],
+    ) -> str:
+        stream = on_delta is not None
+        payload = self._payload(system_prompt, user_prompt, temperature, max_tokens, stream=stream)
+        url = f"{self.api_base}/chat/completions"
         try:
-            return body["choices"][0]["message"]["content"].strip()
+            if stream:
+                async with client.stream("POST", url, json=payload, headers=self._headers()) as resp:
+                    if resp.status_code >= 400:
+                        await resp.aread()
+                        _raise_http_error(resp.status_code, resp.text, resp.headers)
+                    parts = []
+                    async for line in resp.aiter_lines():
+                        delta = _parse_stream_line(line)
+                        if delta:
+                            parts.append(delta)
+                            on_delta(delta)
+                    return "".join(parts).strip()
+            resp = await client.post(url, json=payload, headers=self._headers())
+        except RuntimeError:
+            raise
         except Exception as exc:
-            raise RuntimeError(f"LLM response parse failed: {body}") from exc
+            raise LLMRequestError(f"LLM request failed: {exc}", timed_out=_is_timeout(exc)) from exc
+        return _content_from_response(resp.status_code, resp.text, resp.headers)
+
+    async def agenerate_json(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        on_delta: Optional[DeltaCallback] = None,
+        use_cache: Optional[bool] = None,
+    ) -> Any:
+        text = await self.agenerate(system_prompt, user_prompt, on_delta=on_delta, use_cache=use_cache)
+        try:
+            return parse_json_from_llm(text)
+        except ValueError:
+            await asyncio.to_thread(self.evict, system_prompt, user_prompt)
+            raise
+
+
+def _raise_http_error(status: int, text: str, headers: Any = None, cause: Optional[BaseException] = None):
+    retry_after = None
+    try:
+        retry_after = float((headers or {}).get("Retry-After"))
+    except (TypeError, ValueError):
+        pass
+    raise LLMRequestError(f"LLM HTTP error: {status} {text}", status=status, retry_after=retry_after) from cause
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    if httpx is not None and isinstance(exc, httpx.TimeoutException):
+        return True
+    reason = getattr(exc, "reason", None)
+    return isinstance(exc, TimeoutError) or isinstance(reason, TimeoutError)
+
+
+def _content_from_response(status: int, text: str, headers: Any = None) -> str:
+    if status >= 400:
+        _raise_http_error(status, text, headers)
+    try:
+        body = json.loads(text)
+    except Exception as exc:
+        raise RuntimeError(f"LLM response parse failed: {text[:500]}") from exc
+    try:
+        return body["choices"][0]["message"]["content"].strip()
+    except Exception as exc:
+        raise RuntimeError(f"LLM response parse failed: {body}") from exc
+
+
+def _parse_stream_line(line: str) -> str:
+    """Extract the content delta from one server-sent event line of a streamed completion."""
+    raw = (line or "").strip()
+    if not raw.startswith("data:"):
+        return ""
+    data = raw[5:].strip()
+    if not data or data == "[DONE]":
+        return ""
+    try:
+        choice = json.loads(data)["choices"][0]
+    except Exception:
+        return ""
+    return (choice.get("delta") or {}).get("content") or ""
+
+
+def _collect_stream(lines: Iterable[str], on_delta: DeltaCallback) -> str:
+    parts = []
+    for line in lines:
+        delta = _parse_stream_line(line)
+        if delta:
+            parts.append(delta)
+            on_delta(delta)
+    return "".join(parts).strip()
+
+
+def _pool_limits(max_concurrency: int) -> Any:
+    return httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+
+
+def _get_sync_http() -> Any:
+    global _sync_http
+    with _sync_http_lock:
+        if _sync_http is None:
+            size = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "16")))
+            _sync_http = httpx.Client(timeout=_REQUEST_TIMEOUT_S, limits=_pool_limits(size), http2=_HTTP2_AVAILABLE)
+        return _sync_http
+
+
+def _get_async_transport(api_base: str, max_concurrency: int) -> Tuple[Any, asyncio.Semaphore]:
+    """Return the (client, semaphore) pair for this endpoint and limit on the running loop, creating it on first use."""
+    per_loop = _async_transports.setdefault(asyncio.get_running_loop(), {})
+    entry = per_loop.get((api_base, max_concurrency))
+    if entry is None:
+        client = None
+        if httpx is not None:
+            client = httpx.AsyncClient(
+                timeout=_REQUEST_TIMEOUT_S,
+                limits=_pool_limits(max_concurrency),
+                http2=_HTTP2_AVAILABLE,
+            )
+        entry = (client, asyncio.Semaphore(max_concurrency))
+        per_loop[(api_base, max_concurrency)] = entry
+    return entry
+
 
-    def generate_json(self, system_prompt: str, user_prompt: str) -> Any:
-        text = self.generate(system_prompt, user_prompt)
-        return parse_json_from_llm(text)
+async def aclose_transports() -> None:
+    global _sync_http
+    per_loop = _async_transports.pop(asyncio.get_running_loop(), None) or {}
+    for client, _ in per_loop.values():
+        if client is not None:
+            await client.aclose()
+    with _sync_http_lock:
+        if _sync_http is not None:
+            _sync_http.close()
+            _sync_http = None
 
 
 def parse_json_from_llm(text: str) -> Any:
@@ -0,0 +1,248 @@
+import asyncio
+import itertools
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+
+class _TokenBucket:
+    """Refills `per_minute` units per minute up to a one-minute burst; the level may go negative."""
+
+    def __init__(self, per_minute: float, now: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, n: float, now: float) -> float:
+        self._refill(now)
+        need = min(n, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        self.level -= n
+
+
+class Permit:
+    __slots__ = ("job_key", "tokens", "granted_at")
+
+    def __init__(self, job_key: str, tokens: int, granted_at: float):
+        self.job_key = job_key
+        self.tokens = tokens
+        self.granted_at = granted_at
+
+
+class _Waiter:
+    __slots__ = ("seq", "job_key", "tokens", "event", "loop")
+
+    def __init__(self, seq: int, job_key: str, tokens: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.seq = seq
+        self.job_key = job_key
+        self.tokens = tokens
+        self.loop = loop
+        self.event: Any = asyncio.Event() if loop is not None else threading.Event()
+
+    def wake(self) -> None:
+        if self.loop is None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # loop already closed
+
+
+class AdaptiveLimiter:
+    """Process-wide admission control for LLM requests, usable from threads and event loops.
+
+    A request is admitted when all of these hold:
+    - the requests/min and tokens/min buckets have room (0 disables a bucket),
+    - fewer than `window` requests are in flight, where the window grows by ~1 per window of
+      successes and halves on a 429 or timeout (AIMD), with a cooldown honouring Retry-After,
+    - its job is the waiting job with the fewest requests in flight (FIFO within a job), so
+      one large stage job cannot starve the others.
+
+    `clock` is the monotonic time source for the buckets and cooldowns (injectable for tests).
+    """
+
+    def __init__(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_concurrency: int = 16,
+        min_concurrency: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.clock = clock
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.window = float(self.max_concurrency)
+        self._requests = _TokenBucket(rpm, clock()) if rpm > 0 else None
+        self._tokens = _TokenBucket(tpm, clock()) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._waiters: List[_Waiter] = []
+        self._job_in_flight: Counter = Counter()
+        self.in_flight = 0
+        self._cooldown_until = 0.0
+        self._last_decrease = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.timeouts = 0
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        if not self._waiters:
+            return None
+        return min(self._waiters, key=lambda w: (self._job_in_flight[w.job_key], w.seq))
+
+    def _try_grant(self, waiter: _Waiter) -> Any:
+        """Admit waiter (returns a Permit) or return how long to sleep before re-checking."""
+        if self._next_waiter() is not waiter:
+            return math.inf
+        now = self.clock()
+        if now < self._cooldown_until:
+            return self._cooldown_until - now
+        if self.in_flight >= max(self.min_concurrency, int(self.window)):
+            return math.inf
+        delay = 0.0
+        if self._requests is not None:
+            delay = max(delay, self._requests.delay(1, now))
+        if self._tokens is not None:
+            delay = max(delay, self._tokens.delay(waiter.tokens, now))
+        if delay > 0:
+            return delay
+        if self._requests is not None:
+            self._requests.take(1)
+        if self._tokens is not None:
+            self._tokens.take(waiter.tokens)
+        self._waiters.remove(waiter)
+        self.in_flight += 1
+        self._job_in_flight[waiter.job_key] += 1
+        self.granted += 1
+        return Permit(waiter.job_key, waiter.tokens, now)
+
+    def _wake_all(self) -> None:
+        for w in self._waiters:
+            w.wake()
+
+    def acquire(self, job_key: str = "default", tokens: int = 0) -> Permit:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # Blocking here would stall the loop, and with it the async holders that must release permits.
+            raise RuntimeError("AdaptiveLimiter.acquire() called on a running event loop; use aacquire() or a worker thread")
+        waiter = _Waiter(next(self._seq), job_key, tokens, None)
+        with self._lock:
+            self._waiters.append(waiter)
+        try:
+            while True:
+                with self._lock:
+                    waiter.event.clear()
+                    res = self._try_grant(waiter)
+                    if isinstance(res, Permit):
+                        self._wake_all()
+                        return res
+                waiter.event.wait(min(res, 1.0))
+        finally:
+            self._discard(waiter)
+
+    async def aacquire(self, job_key: str = "default", tokens: int = 0) -> Permit:
+        waiter = _Waiter(next(self._seq), job_key, tokens, asyncio.get_running_loop())
+        with self._lock:
+            self._waiters.append(waiter)
+        try:
+            while True:
+                with self._lock:
+                    waiter.event.clear()
+                    res = self._try_grant(waiter)
+                    if isinstance(res, Permit):
+                        self._wake_all()
+                        return res
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=min(res, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._discard(waiter)
+
+    def _discard(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._wake_all()
+
+    def release(
+        self,
+        permit: Permit,
+        *,
+        throttled: bool = False,
+        timed_out: bool = False,
+        retry_after: Optional[float] = None,
+        tokens_used: Optional[int] = None,
+    ) -> None:
+        now = self.clock()
+        with self._lock:
+            self.in_flight -= 1
+            self._job_in_flight[permit.job_key] -= 1
+            if self._job_in_flight[permit.job_key] <= 0:
+                del self._job_in_flight[permit.job_key]
+            if throttled or timed_out:
+                self.throttled += int(throttled)
+                self.timeouts += int(timed_out)
+                # Requests already in flight when the window was cut report the same congestion; count it once.
+                if permit.granted_at >= self._last_decrease:
+                    self.window = max(float(self.min_concurrency), self.window / 2)
+                    self._last_decrease = now
+                if throttled:
+                    self._cooldown_until = max(self._cooldown_until, now + (retry_after or 1.0))
+            else:
+                self.window = min(float(self.max_concurrency), self.window + 1.0 / self.window)
+            if self._tokens is not None and tokens_used is not None:
+                self._tokens.take(tokens_used - permit.tokens)
+            self._wake_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "window": round(self.window, 2),
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "jobs_in_flight": dict(self._job_in_flight),
+                "rpm": self._requests.capacity if self._requests else 0,
+                "tpm": self._tokens.capacity if self._tokens else 0,
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "timeouts": self.timeouts,
+            }
+
+
+_default_limiter: Optional[AdaptiveLimiter] = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> AdaptiveLimiter:
+    """Process-wide limiter configured from LLM_RPM, LLM_TPM and LLM_MAX_CONCURRENCY."""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = AdaptiveLimiter(
+                rpm=float(os.getenv("LLM_RPM", "0") or 0),
+                tpm=float(os.getenv("LLM_TPM", "0") or 0),
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+                min_concurrency=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+            )
+        return _default_limiter
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token count (about 3 characters per token for mixed Chinese/English prompts)."""
+    return sum(len(t or "") for t in texts) // 3 + 1
@@ -1,9 +1,25 @@
+import bisect
+import codecs
+import heapq
+import itertools
 import json
+import math
+import mmap
+import os
 import re
+import struct
+import threading
 import uuid
+import zlib
+from collections import Counter
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    np = None
 
 
 def _now_iso() -> str:
@@ -14,128 +30,664 @@ def _tokenize(text: str) -> List[str]:
     return re.findall(r"[a-zA-Z0-9_]+|[\u4e00-\u9fff]+", (text or "").lower())
 
 
+TEXT_EXTENSIONS = {".txt", ".md", ".csv", ".json", ".log", ".yaml", ".yml", ".xml"}
+
+
+def _read_bytes(source: Union[bytes, str, Path]) -> bytes:
+    return source if isinstance(source, (bytes, bytearray)) else Path(source).read_bytes()
+
+
+def _pdf_reader(source: Union[bytes, str, Path]):
+    try:
+        from pypdf import PdfReader  # type: ignore
+    except Exception as exc:
+        raise ValueError(f"PDF解析依赖缺失（pypdf）: {exc}")
+    if isinstance(source, (bytes, bytearray)):
+        from io import BytesIO
+
+        return PdfReader(BytesIO(source))
+    return PdfReader(str(source))
+
+
+def pdf_page_count(source: Union[bytes, str, Path]) -> int:
+    return len(_pdf_reader(source).pages)
+
+
+def extract_pdf_pages(source: Union[bytes, str, Path], start: int, end: int) -> List[str]:
+    """Text of pages [start, end); module-level so a process pool can run page ranges in parallel."""
+    pages = _pdf_reader(source).pages
+    return [(pages[i].extract_text() or "") for i in range(start, min(end, len(pages)))]
+
+
+def extract_text(filename: str, source: Union[bytes, str, Path]) -> str:
+    """Plain text of an uploaded document, given its bytes or a path to them."""
+    ext = Path(filename).suffix.lower()
+    if ext in TEXT_EXTENSIONS:
+        return _read_bytes(source).decode("utf-8", errors="ignore")
+    if ext == ".pdf":
+        return "\n".join(extract_pdf_pages(source, 0, pdf_page_count(source)))
+    raise ValueError(f"暂不支持的文档类型: {ext}（支持 txt/md/csv/json/log/yaml/xml/pdf）")
+
+
+def iter_text_file(path: Union[str, Path], block_size: int = 1 << 20) -> Iterator[str]:
+    """Decode a UTF-8 file block by block, so callers never hold the whole text."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield decoder.decode(block)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_chunks(blocks: Iterable[str], chunk_size: int = 1000, overlap: int = 120) -> Iterator[str]:
+    """Streaming chunk_text: whitespace-normalize text blocks and yield overlapping windows.
+
+    Produces exactly the chunks chunk_text would for the concatenated blocks while only
+    buffering about one chunk of text.
+    """
+    step = max(chunk_size - overlap, 1)
+    buf = ""
+    for block in blocks:
+        normalized = re.sub(r"\s+", " ", block or "")
+        if not buf:
+            normalized = normalized.lstrip()
+        elif buf.endswith(" ") and normalized.startswith(" "):
+            normalized = normalized[1:]
+        buf += normalized
+        # A trailing space may still be stripped at end of input, so it cannot decide whether more text follows.
+        while len(buf) - buf.endswith(" ") > chunk_size:
+            yield buf[:chunk_size]
+            buf = buf[step:]
+    buf = buf.rstrip()
+    if buf:
+        yield buf
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 120) -> List[str]:
+    return list(iter_chunks([text], chunk_size, overlap))
+
+
+class BM25Index:
+    """Inverted index over chunks with BM25 scoring.
+
+    Chunks are addressed by a dense integer id; `chunks[i]` is (doc_id, chunk position in doc),
+    `lengths[i]` its token count, and `postings[term]` a list of [chunk id, term frequency].
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.chunks: List[Tuple[str, int]] = []
+        self.lengths: List[int] = []
+        self.total_length = 0
+        self.postings: Dict[str, List[List[int]]] = {}
+
+    def add_document(self, doc_id: str, texts: List[str]) -> None:
+        self.add_chunks(doc_id, texts)
+        self.doc_ids.append(doc_id)
+
+    def add_chunks(self, doc_id: str, texts: List[str], start: int = 0, delta: Optional[Dict[str, Any]] = None) -> None:
+        """Index texts as positions start, start+1, ... of doc_id (finish with doc_ids.append).
+
+        With `delta` (from `new_delta`), also records the added chunks there for `apply_delta`.
+        """
+        for pos, text in enumerate(texts, start=start):
+            tf = Counter(_tokenize(text))
+            cid = len(self.chunks)
+            self.chunks.append((doc_id, pos))
+            length = sum(tf.values())
+            self.lengths.append(length)
+            self.total_length += length
+            for term, n in tf.items():
+                self.postings.setdefault(term, []).append([cid, n])
+                if delta is not None:
+                    delta["postings"].setdefault(term, []).append([pos, n])
+            if delta is not None:
+                delta["lengths"].append(length)
+
+    @staticmethod
+    def new_delta(doc_id: str) -> Dict[str, Any]:
+        """One document's postings with chunk positions relative to the document, as stored in the index log."""
+        return {"doc_id": doc_id, "lengths": [], "postings": {}}
+
+    def apply_delta(self, delta: Dict[str, Any]) -> None:
+        doc_id = str(delta["doc_id"])
+        base = len(self.chunks)
+        lengths = [int(x) for x in delta.get("lengths", [])]
+        self.chunks.extend((doc_id, pos) for pos in range(len(lengths)))
+        self.lengths.extend(lengths)
+        self.total_length += sum(lengths)
+        for term, plist in delta.get("postings", {}).items():
+            self.postings.setdefault(term, []).extend([base + pos, n] for pos, n in plist)
+        self.doc_ids.append(doc_id)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        n_chunks = len(self.chunks)
+        if not n_chunks:
+            return []
+        avg_len = self.total_length / n_chunks or 1.0
+        k1, b = self.k1, self.b
+        scores: Dict[int, float] = {}
+        for term in set(_tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            df = len(plist)
+            idf = math.log(1.0 + (n_chunks - df + 0.5) / (df + 0.5))
+            for cid, tf in plist:
+                norm = k1 * (1.0 - b + b * self.lengths[cid] / avg_len)
+                scores[cid] = scores.get(cid, 0.0) + idf * tf * (k1 + 1.0) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda kv: kv[1])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": 1,
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "chunks": self.chunks,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BM25Index":
+        index = cls(k1=float(data.get("k1", 1.2)), b=float(data.get("b", 0.75)))
+        index.doc_ids = list(data.get("doc_ids", []))
+        index.chunks = [(str(d), int(p)) for d, p in data.get("chunks", [])]
+        index.lengths = [int(x) for x in data.get("lengths", [])]
+        index.total_length = sum(index.lengths)
+        index.postings = data.get("postings", {})
+        return index
+
+
+class ChunkSegment:
+    """Append-only chunk text storage: one UTF-8 segment file plus a fixed-width offset index.
+
+    Record i of the `.idx` file is (offset, length) into the `.seg` file. Both files are
+    memory-mapped on first read, so opening a store costs nothing and only hit chunks are
+    decoded.
+    """
+
+    _REC = struct.Struct("<QI")
+
+    def __init__(self, seg_path: Path, idx_path: Path):
+        self.seg_path = Path(seg_path)
+        self.idx_path = Path(idx_path)
+        self.seg_path.touch(exist_ok=True)
+        self.idx_path.touch(exist_ok=True)
+        self._lock = threading.Lock()
+        self._seg_map: Optional[mmap.mmap] = None
+        self._idx_map: Optional[mmap.mmap] = None
+        self._trim_partial_record()
+
+    def _trim_partial_record(self) -> None:
+        size = self.idx_path.stat().st_size
+        if size % self._REC.size:
+            with self.idx_path.open("r+b") as f:
+                f.truncate(size - size % self._REC.size)
+
+    def __len__(self) -> int:
+        return self.idx_path.stat().st_size // self._REC.size
+
+    def append(self, texts: List[str]) -> int:
+        """Append chunk texts and return the id of the first one."""
+        with self._lock:
+            self._close_maps()
+            first = len(self)
+            records = []
+            with self.seg_path.open("ab") as seg:
+                offset = seg.tell()
+                for text in texts:
+                    data = text.encode("utf-8")
+                    seg.write(data)
+                    records.append(self._REC.pack(offset, len(data)))
+                    offset += len(data)
+                seg.flush()
+                os.fsync(seg.fileno())
+            # The index is written after the data, so a crash never leaves a record pointing past the segment end.
+            with self.idx_path.open("ab") as idx:
+                idx.write(b"".join(records))
+                idx.flush()
+                os.fsync(idx.fileno())
+            return first
+
+    def get(self, chunk_no: int) -> str:
+        with self._lock:
+            if self._idx_map is None or self._seg_map is None:
+                self._open_maps()
+            idx_map, seg_map = self._idx_map, self._seg_map
+            if idx_map is None or seg_map is None or (chunk_no + 1) * self._REC.size > len(idx_map):
+                raise IndexError(chunk_no)
+            offset, length = self._REC.unpack_from(idx_map, chunk_no * self._REC.size)
+            return seg_map[offset : offset + length].decode("utf-8", errors="ignore")
+
+    def _open_maps(self) -> None:
+        for attr, path in (("_seg_map", self.seg_path), ("_idx_map", self.idx_path)):
+            if path.stat().st_size == 0:
+                continue
+            with path.open("rb") as f:
+                setattr(self, attr, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _close_maps(self) -> None:
+        for attr in ("_seg_map", "_idx_map"):
+            m = getattr(self, attr)
+            if m is not None:
+                m.close()
+                setattr(self, attr, None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_maps()
+
+
+class HashingEncoder:
+    """Offline text encoder: signed feature hashing of words and character n-grams.
+
+    Character n-grams let paraphrases that share word stems ("re-establishment" vs
+    "reestablish") land close together without a model download.
+    """
+
+    def __init__(self, dim: int = 512, ngram: Tuple[int, int] = (3, 4)):
+        self.dim = dim
+        self.ngram = ngram
+        self.name = f"hashing-v1-{dim}"
+
+    def _features(self, text: str) -> Counter:
+        feats: Counter = Counter()
+        lo, hi = self.ngram
+        for tok in _tokenize(text):
+            feats["w:" + tok] += 1
+            padded = f"<{tok}>"
+            for n in range(lo, hi + 1):
+                for i in range(len(padded) - n + 1):
+                    feats[padded[i : i + n]] += 1
+        return feats
+
+    def encode(self, texts: List[str]) -> "np.ndarray":
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vec = out[row]
+            for feat, n in self._features(text).items():
+                h = zlib.crc32(feat.encode("utf-8"))
+                vec[h % self.dim] += (1.0 + math.log(n)) * (1.0 if h & 0x80000000 else -1.0)
+            norm = float(np.linalg.norm(vec))
+            if norm > 0:
+                vec /= norm
+        return out
+
+
+class SentenceTransformerEncoder:
+    """Local sentence-transformers model (path or cached name); needs the optional package."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer  # type: ignore
+
+        self.model = SentenceTransformer(model_name)
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.name = f"st:{model_name}"
+
+    def encode(self, texts: List[str]) -> "np.ndarray":
+        vecs = self.model.encode(texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vecs, dtype=np.float32)
+
+
+def load_encoder(spec: str = ""):
+    """Build an encoder from a spec: `hashing[:dim]` (default) or `sentence-transformers:<model>`."""
+    kind, _, arg = (spec or "hashing").partition(":")
+    if kind == "sentence-transformers":
+        return SentenceTransformerEncoder(arg)
+    if kind == "hashing":
+        return HashingEncoder(dim=int(arg or 512))
+    raise ValueError(f"未知的向量编码器: {spec}")
+
+
+class DenseIndex:
+    """Chunk embeddings as a contiguous float32 matrix on disk, row i = segment chunk i.
+
+    The matrix is memory-mapped for scoring, so a query is one matrix-vector product.
+    `sync` only embeds rows the matrix does not have yet; switching encoders re-embeds
+    everything.
+    """
+
+    def __init__(self, matrix_path: Path, meta_path: Path, encoder):
+        self.matrix_path = Path(matrix_path)
+        self.meta_path = Path(meta_path)
+        self.encoder = encoder
+        self._lock = threading.Lock()
+        self._matrix = None
+        self.rows = 0
+        meta: Dict[str, Any] = {}
+        if self.meta_path.exists():
+            try:
+                meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            except Exception:
+                meta = {}
+        row_bytes = encoder.dim * 4
+        on_disk = self.matrix_path.stat().st_size // row_bytes if self.matrix_path.exists() else 0
+        if meta.get("encoder") == encoder.name and int(meta.get("dim", 0)) == encoder.dim:
+            self.rows = min(int(meta.get("rows", 0)), on_disk)
+        with self.matrix_path.open("a+b") as f:
+            f.truncate(self.rows * row_bytes)
+
+    def sync(self, segment: "ChunkSegment", batch_size: int = 256) -> int:
+        """Embed the segment chunks past the last stored row; returns the number embedded."""
+        with self._lock:
+            total = len(segment)
+            start = self.rows
+            if start >= total:
+                return 0
+            self._matrix = None
+            with self.matrix_path.open("ab") as f:
+                for lo in range(start, total, batch_size):
+                    hi = min(lo + batch_size, total)
+                    vecs = self.encoder.encode([segment.get(i) for i in range(lo, hi)])
+                    f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+                    self.rows = hi
+                f.flush()
+                os.fsync(f.fileno())
+            self._save_meta()
+            return total - start
+
+    def _save_meta(self) -> None:
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(
+            json.dumps({"encoder": self.encoder.name, "dim": self.encoder.dim, "rows": self.rows}),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.meta_path)
+
+    def search(self, query: str, top_n: int) -> List[Tuple[int, float]]:
+        with self._lock:
+            if not self.rows:
+                return []
+            if self._matrix is None:
+                self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(self.rows, self.encoder.dim))
+            matrix = self._matrix
+        q = self.encoder.encode([query])[0]
+        scores = matrix @ q
+        n = min(top_n, scores.shape[0])
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
 class SimpleRAGStore:
-    def __init__(self, base_dir: Path):
+    RETRIEVAL_MODES = ("keyword", "dense", "hybrid")
+
+    def __init__(self, base_dir: Path, mode: Optional[str] = None, encoder=None):
         self.base_dir = Path(base_dir)
         self.docs_dir = self.base_dir / "docs"
         self.manifest_path = self.base_dir / "manifest.json"
+        self.index_path = self.base_dir / "bm25_index.json"
+        # Documents added since the last full index write, one JSON line each; folded in on load.
+        self.index_log_path = self.base_dir / "bm25_index.log"
         self.base_dir.mkdir(parents=True, exist_ok=True)
         self.docs_dir.mkdir(parents=True, exist_ok=True)
         self.manifest: Dict[str, Any] = {"docs": []}
-        self.docs_cache: Dict[str, Dict[str, Any]] = {}
+        self.doc_meta: Dict[str, Dict[str, Any]] = {}
+        self.segment = ChunkSegment(self.base_dir / "chunks.seg", self.base_dir / "chunks.idx")
+        self._index: Optional[BM25Index] = None
+        self._write_lock = threading.RLock()
         self._load()
 
+        self.mode = (mode or os.getenv("RAG_RETRIEVAL_MODE", "keyword")).strip().lower()
+        if self.mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"未知的检索模式: {self.mode}（支持 {'/'.join(self.RETRIEVAL_MODES)}）")
+        self.dense: Optional[DenseIndex] = None
+        if self.mode != "keyword":
+            if np is None:
+                # Dense scoring needs NumPy; degrade to keyword ranking rather than failing startup.
+                self.mode = "keyword"
+            else:
+                self.dense = DenseIndex(
+                    self.base_dir / "embeddings.f32",
+                    self.base_dir / "embeddings.json",
+                    encoder or load_encoder(os.getenv("RAG_ENCODER", "hashing")),
+                )
+                self.dense.sync(self.segment)
+
     def _load(self) -> None:
         if self.manifest_path.exists():
             try:
                 self.manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
             except Exception:
                 self.manifest = {"docs": []}
+        migrated = False
+        docs = []
         for meta in self.manifest.get("docs", []):
             doc_id = meta.get("doc_id")
             if not doc_id:
                 continue
-            p = self.docs_dir / f"{doc_id}.json"
-            if not p.exists():
-                continue
-            try:
-                self.docs_cache[doc_id] = json.loads(p.read_text(encoding="utf-8"))
-            except Exception:
-                continue
+            if "first_chunk" not in meta:
+                if not self._migrate_legacy_doc(meta):
+                    continue
+                migrated = True
+            docs.append(meta)
+            self.doc_meta[doc_id] = meta
+        self.manifest["docs"] = docs
+        if migrated:
+            self._save_manifest()
+
+    def _migrate_legacy_doc(self, meta: Dict[str, Any]) -> bool:
+        # Earlier versions stored each document as docs/<doc_id>.json; move its chunks into the segment.
+        p = self.docs_dir / f"{meta['doc_id']}.json"
+        if not p.exists():
+            return False
+        try:
+            payload = json.loads(p.read_text(encoding="utf-8"))
+        except Exception:
+            return False
+        texts = [ch.get("text", "") for ch in payload.get("chunks", [])]
+        meta["first_chunk"] = self.segment.append(texts)
+        meta["chunk_count"] = len(texts)
+        return True
+
+    # Fold the index log into bm25_index.json once it holds this many documents.
+    INDEX_LOG_COMPACT_AFTER = 64
+
+    @property
+    def index(self) -> BM25Index:
+        """BM25 index, loaded on first use; servers call `load_index` from a worker thread at startup."""
+        if self._index is None:
+            with self._write_lock:
+                if self._index is None:
+                    self._index = self._load_index()
+        return self._index
+
+    def load_index(self) -> None:
+        self.index
+
+    def _read_index_log(self) -> List[Dict[str, Any]]:
+        deltas = []
+        try:
+            with self.index_log_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        deltas.append(json.loads(line))
+                    except ValueError:
+                        break  # torn last line from a crash mid-append
+        except FileNotFoundError:
+            pass
+        return deltas
+
+    def _load_index(self) -> BM25Index:
+        try:
+            index = BM25Index.from_dict(json.loads(self.index_path.read_text(encoding="utf-8"))) if self.index_path.exists() else BM25Index()
+            deltas = self._read_index_log()
+            # Skip documents already in the base file (a compaction crashed before emptying the log)
+            # or missing from the manifest (an ingest crashed before publishing it).
+            known = set(index.doc_ids)
+            for delta in deltas:
+                if delta.get("doc_id") not in known and delta.get("doc_id") in self.doc_meta:
+                    index.apply_delta(delta)
+            if set(index.doc_ids) == set(self.doc_meta):
+                if len(deltas) >= self.INDEX_LOG_COMPACT_AFTER:
+                    self._save_index(index)
+                return index
+        except Exception:
+            pass
+        # Missing, unreadable or out of sync with the manifest: rebuild from the chunk segment.
+        index = BM25Index()
+        for doc_id in self.doc_meta:
+            index.add_document(doc_id, self._doc_texts(doc_id))
+        self._save_index(index)
+        return index
+
+    def _save_index(self, index: BM25Index) -> None:
+        """Write the full index and empty the log; only used for rebuilds and compaction."""
+        tmp = self.index_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(index.to_dict(), ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.index_path)
+        with self.index_log_path.open("w", encoding="utf-8"):
+            pass
+
+    def _append_index_log(self, delta: Dict[str, Any]) -> None:
+        with self.index_log_path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(delta, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _doc_texts(self, doc_id: str) -> List[str]:
+        meta = self.doc_meta[doc_id]
+        first = int(meta["first_chunk"])
+        return [self.segment.get(first + pos) for pos in range(int(meta.get("chunk_count", 0)))]
+
+    def chunk_text(self, doc_id: str, pos: int) -> str:
+        return self.segment.get(int(self.doc_meta[doc_id]["first_chunk"]) + pos)
 
     def _save_manifest(self) -> None:
-        self.manifest_path.write_text(
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(
             json.dumps(self.manifest, ensure_ascii=False, indent=2),
             encoding="utf-8",
         )
+        os.replace(tmp, self.manifest_path)
 
     def _extract_text(self, filename: str, content: bytes) -> str:
-        ext = Path(filename).suffix.lower()
-        if ext in {".txt", ".md", ".csv", ".json", ".log", ".yaml", ".yml", ".xml"}:
-            return content.decode("utf-8", errors="ignore")
-        if ext == ".pdf":
-            try:
-                from pypdf import PdfReader  # type: ignore
-            except Exception as exc:
-                raise ValueError(f"PDF解析依赖缺失（pypdf）: {exc}")
-            from io import BytesIO
-
-            reader = PdfReader(BytesIO(content))
-            return "\n".join([(p.extract_text() or "") for p in reader.pages])
-        raise ValueError(f"暂不支持的文档类型: {ext}（支持 txt/md/csv/json/log/yaml/xml/pdf）")
+        return extract_text(filename, content)
 
     def _chunk(self, text: str, chunk_size: int = 1000, overlap: int = 120) -> List[str]:
-        normalized = re.sub(r"\s+", " ", text or "").strip()
-        if not normalized:
-            return []
-        chunks: List[str] = []
-        i = 0
-        n = len(normalized)
-        while i < n:
-            j = min(i + chunk_size, n)
-            chunks.append(normalized[i:j])
-            if j >= n:
-                break
-            i = max(j - overlap, i + 1)
-        return chunks
+        return chunk_text(text, chunk_size, overlap)
 
     def ingest_file(self, filename: str, content: bytes) -> Dict[str, Any]:
-        text = self._extract_text(filename, content)
-        chunks = self._chunk(text)
-        if not chunks:
-            raise ValueError("文档无可用文本内容")
-
-        doc_id = f"DOC-{uuid.uuid4().hex[:12]}"
-        payload = {
-            "doc_id": doc_id,
-            "filename": filename,
-            "created_at": _now_iso(),
-            "chunks": [{"chunk_id": f"{doc_id}-C{i+1:03d}", "text": c} for i, c in enumerate(chunks)],
-        }
-        (self.docs_dir / f"{doc_id}.json").write_text(
-            json.dumps(payload, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
-        meta = {
-            "doc_id": doc_id,
-            "filename": filename,
-            "created_at": payload["created_at"],
-            "chunk_count": len(chunks),
-        }
-        self.manifest.setdefault("docs", []).append(meta)
-        self.docs_cache[doc_id] = payload
-        self._save_manifest()
-        return meta
+        return self.add_document(filename, self._chunk(self._extract_text(filename, content)))
+
+    def add_document(
+        self,
+        filename: str,
+        chunks: Iterable[str],
+        on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        batch_size: int = 256,
+    ) -> Dict[str, Any]:
+        """Store already-extracted chunks (a list or a lazy iterator) as a new document.
+
+        Chunks are appended to the segment and indexed in batches (on_progress(done, total)
+        after each; total is None for iterators); the index log and manifest are only published
+        once every chunk is on disk. Writers are serialized so each document occupies a
+        contiguous run of the segment.
+        """
+        total = len(chunks) if isinstance(chunks, list) else None
+        it = iter(chunks)
+        with self._write_lock:
+            index = self.index
+            doc_id = f"DOC-{uuid.uuid4().hex[:12]}"
+            delta = BM25Index.new_delta(doc_id)
+            first_chunk = len(self.segment)
+            done = 0
+            try:
+                while True:
+                    batch = list(itertools.islice(it, batch_size))
+                    if not batch:
+                        break
+                    self.segment.append(batch)
+                    index.add_chunks(doc_id, batch, start=done, delta=delta)
+                    done += len(batch)
+                    if on_progress is not None:
+                        on_progress(done, total)
+                if not done:
+                    raise ValueError("文档无可用文本内容")
+            except BaseException:
+                # Drop the half-indexed document; the last saved index is reloaded on next use.
+                self._index = None
+                raise
+            index.doc_ids.append(doc_id)
+            meta = {
+                "doc_id": doc_id,
+                "filename": filename,
+                "created_at": _now_iso(),
+                "chunk_count": done,
+                "first_chunk": first_chunk,
+            }
+            # Only this document's postings are written; the full index is rewritten on compaction.
+            self._append_index_log(delta)
+            if self.dense is not None:
+                self.dense.sync(self.segment)
+            self.manifest.setdefault("docs", []).append(meta)
+            self.doc_meta[doc_id] = meta
+            self._save_manifest()
+            return meta
 
     def list_docs(self) -> List[Dict[str, Any]]:
         docs = self.manifest.get("docs", [])
         return sorted(docs, key=lambda x: x.get("created_at", ""), reverse=True)
 
-    def retrieve(self, query: str, top_k: int = 6) -> List[Dict[str, Any]]:
-        q_terms = set(_tokenize(query))
-        if not q_terms:
+    def _dense_hits(self, query: str, top_n: int) -> List[Tuple[Tuple[str, int], float]]:
+        if self.dense is None:
             return []
+        # Map segment chunk numbers back to (doc_id, position) via the sorted document start offsets.
+        starts = sorted((int(m["first_chunk"]), doc_id) for doc_id, m in list(self.doc_meta.items()))
+        hits = []
+        for chunk_no, score in self.dense.search(query, top_n):
+            i = bisect.bisect_right(starts, (chunk_no, "\uffff")) - 1
+            if i < 0:
+                continue
+            first, doc_id = starts[i]
+            if chunk_no - first < int(self.doc_meta[doc_id].get("chunk_count", 0)):
+                hits.append(((doc_id, chunk_no - first), score))
+        return hits
+
+    def _keyword_hits(self, query: str, top_n: int) -> List[Tuple[Tuple[str, int], float]]:
+        index = self.index
+        return [(index.chunks[cid], score) for cid, score in index.search(query, top_n)]
+
+    def retrieve(self, query: str, top_k: int = 6, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        top_k = max(1, top_k)
+        mode = (mode or self.mode) if self.dense is not None else "keyword"
+        if mode == "keyword":
+            ranked = [(loc, score, {"bm25_score": score}) for loc, score in self._keyword_hits(query, top_k)]
+        elif mode == "dense":
+            ranked = [(loc, score, {"dense_score": score}) for loc, score in self._dense_hits(query, top_k)]
+        else:
+            # Reciprocal rank fusion over deeper candidate lists from both retrievers.
+            depth = max(top_k * 4, 50)
+            fused: Dict[Tuple[str, int], Dict[str, float]] = {}
+            for name, hits in (("bm25_score", self._keyword_hits(query, depth)), ("dense_score", self._dense_hits(query, depth))):
+                for rank, (loc, score) in enumerate(hits):
+                    entry = fused.setdefault(loc, {"rrf": 0.0})
+                    entry["rrf"] += 1.0 / (60 + rank + 1)
+                    entry[name] = score
+            best = heapq.nlargest(top_k, fused.items(), key=lambda kv: kv[1]["rrf"])
+            ranked = [(loc, parts.pop("rrf"), parts) for loc, parts in best]
+
         hits: List[Dict[str, Any]] = []
-        for meta in self.list_docs():
-            doc = self.docs_cache.get(meta["doc_id"])
-            if not doc:
+        for (doc_id, pos), score, parts in ranked:
+            meta = self.doc_meta.get(doc_id)
+            if not meta:
                 continue
-            for ch in doc.get("chunks", []):
-                terms = set(_tokenize(ch.get("text", "")))
-                if not terms:
-                    continue
-                overlap = q_terms & terms
-                if not overlap:
-                    continue
-                score = len(overlap) / max(1, len(q_terms))
-                hits.append(
-                    {
-                        "doc_id": meta["doc_id"],
-                        "filename": meta.get("filename", ""),
-                        "chunk_id": ch.get("chunk_id"),
-                        "score": round(score, 4),
-                        "text": ch.get("text", ""),
-                    }
-                )
-        hits.sort(key=lambda x: x["score"], reverse=True)
-        return hits[: max(1, top_k)]
+            hits.append(
+                {
+                    "doc_id": doc_id,
+                    "filename": meta.get("filename", ""),
+                    "chunk_id": f"{doc_id}-C{pos+1:03d}",
+                    "score": round(score, 4),
+                    **{k: round(v, 4) for k, v in parts.items()},
+                    "text": self.chunk_text(doc_id, pos),
+                }
+            )
+        return hits
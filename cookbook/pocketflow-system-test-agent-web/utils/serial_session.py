@@ -0,0 +1,285 @@
+import collections
+import re
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    import serial  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    serial = None
+
+_LINE_SPLIT = re.compile(r"\r\n|\n|\r")
+
+
+class ResponseFraming:
+    """Final result codes and URC prefixes taken from an ATSPEC document.
+
+    A response ends at the first line that is a final OK/ERROR or starts with a +CME/+CMS ERROR prefix;
+    lines starting with a capability signal (e.g. "+CMTI:") are unsolicited unless the command itself
+    asked for that prefix (AT+CREG? answers with "+CREG:").
+    """
+
+    def __init__(
+        self,
+        final_ok: List[str],
+        final_error: List[str],
+        error_prefixes: List[str],
+        urc_prefixes: List[str],
+        prompt_chars: List[str],
+    ):
+        self.final_ok = set(final_ok)
+        self.final_error = set(final_error)
+        self.error_prefixes = tuple(p for p in error_prefixes if p)
+        self.urc_prefixes = tuple(p for p in urc_prefixes if p)
+        self.prompt_chars = set(prompt_chars)
+
+    @classmethod
+    def from_atspec(cls, spec: Dict[str, Any]) -> "ResponseFraming":
+        rc = spec.get("result_codes", {}) if isinstance(spec.get("result_codes"), dict) else {}
+        interaction = spec.get("interaction", {}) if isinstance(spec.get("interaction"), dict) else {}
+        prompt = interaction.get("prompt", {}) if isinstance(interaction.get("prompt"), dict) else {}
+        urcs: List[str] = []
+        for cap in spec.get("capabilities", []) if isinstance(spec.get("capabilities"), list) else []:
+            signals = cap.get("signals", []) if isinstance(cap, dict) else []
+            for s in signals if isinstance(signals, list) else []:
+                if s and str(s) not in urcs:
+                    urcs.append(str(s))
+        return cls(
+            final_ok=[str(x) for x in rc.get("final_ok", ["OK"])],
+            final_error=[str(x) for x in rc.get("final_error", ["ERROR"])],
+            error_prefixes=[str(rc.get("final_cme_error_prefix", "+CME ERROR:")), str(rc.get("final_cms_error_prefix", "+CMS ERROR:"))],
+            urc_prefixes=urcs,
+            prompt_chars=[str(x) for x in prompt.get("chars", [">"])],
+        )
+
+    def final(self, line: str) -> Optional[Tuple[str, bool]]:
+        """Returns (final line, ok) when `line` terminates a response."""
+        if line in self.final_ok:
+            return line, True
+        if line in self.final_error or line.startswith(self.error_prefixes):
+            return line, False
+        return None
+
+    def is_urc(self, line: str, cmd: str) -> bool:
+        upper = cmd.upper()
+        return any(line.startswith(p) and p.rstrip(":") not in upper for p in self.urc_prefixes)
+
+
+# ATPROFILE defaults.timeouts key for commands that wait on the network rather than on the modem.
+AT_COMMAND_TIMEOUT_KEYS = {
+    "cmd.creg": "network_register_sec",
+    "cmd.cgatt": "network_register_sec",
+    "cmd.cgact": "pdp_activate_sec",
+    "sms.cmgs": "sms_send_sec",
+}
+
+
+def at_command_timeout(profile: Dict[str, Any], cmd_id: str = "", command: Optional[Dict[str, Any]] = None) -> float:
+    """Seconds to wait for a command's final result code: the ATSPEC command's timeout_key, else the mapping above."""
+    defaults = profile.get("defaults", {}) if isinstance(profile.get("defaults", {}), dict) else {}
+    timeouts = defaults.get("timeouts", {}) if isinstance(defaults.get("timeouts", {}), dict) else {}
+    key = (command or {}).get("timeout_key") or AT_COMMAND_TIMEOUT_KEYS.get(cmd_id, "default_sec")
+    try:
+        return float(timeouts.get(key) or timeouts.get("default_sec") or 3)
+    except (TypeError, ValueError):
+        return 3.0
+
+
+class _Pending:
+    __slots__ = ("cmd", "framing", "expect_prompt", "lines", "urcs", "final", "ok")
+
+    def __init__(self, cmd: str, framing: ResponseFraming, expect_prompt: bool):
+        self.cmd = cmd
+        self.framing = framing
+        self.expect_prompt = expect_prompt
+        self.lines: List[str] = []
+        self.urcs: List[str] = []
+        self.final: Optional[str] = None
+        self.ok = False
+
+
+class SerialSession:
+    """One open modem port with a background reader thread.
+
+    The reader splits incoming bytes into lines and hands them to the command in flight, which returns
+    as soon as its final result code arrives; everything else is kept in a bounded URC buffer.
+    Commands on one session are serialised.
+    """
+
+    def __init__(self, ser: Any, *, encoding: str = "latin-1", max_urcs: int = 500):
+        self._ser = ser
+        self.encoding = encoding
+        self.urcs: Deque[Tuple[float, str]] = collections.deque(maxlen=max_urcs)
+        self.commands = 0
+        self.error: Optional[str] = None
+        self._closed = False
+        self._buf = ""
+        self._pending: Optional[_Pending] = None
+        self._cmd_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._reader = threading.Thread(target=self._read_loop, name=f"serial-reader-{getattr(ser, 'port', '')}", daemon=True)
+        self._reader.start()
+
+    @property
+    def alive(self) -> bool:
+        return not self._closed and self.error is None
+
+    def _read_loop(self) -> None:
+        while not self._closed:
+            try:
+                data = self._ser.read(getattr(self._ser, "in_waiting", 0) or 1)
+            except Exception as exc:
+                with self._cond:
+                    if not self._closed:
+                        self.error = str(exc)
+                    self._cond.notify_all()
+                return
+            if data:
+                self._feed(data.decode(self.encoding, errors="replace"))
+
+    def _feed(self, text: str) -> None:
+        with self._cond:
+            parts = _LINE_SPLIT.split(self._buf + text)
+            self._buf = parts.pop()
+            for line in parts:
+                if line.strip():
+                    self._on_line(line.strip())
+            pending = self._pending
+            # "> " after AT+CMGS has no line ending, so it is matched on the partial line.
+            if pending is not None and pending.expect_prompt and self._buf.strip() in pending.framing.prompt_chars:
+                pending.final, pending.ok = self._buf.strip(), True
+                self._buf = ""
+            if pending is not None and pending.final is not None:
+                self._cond.notify_all()
+
+    def _on_line(self, line: str) -> None:
+        pending = self._pending
+        if pending is None or pending.final is not None or pending.framing.is_urc(line, pending.cmd):
+            self.urcs.append((time.time(), line))
+            if pending is not None and pending.final is None:
+                pending.urcs.append(line)
+            return
+        if not pending.lines and line == pending.cmd:
+            return  # echo (ATE1)
+        pending.lines.append(line)
+        final = pending.framing.final(line)
+        if final is not None:
+            pending.final, pending.ok = final
+
+    def execute(
+        self,
+        cmd: str,
+        framing: ResponseFraming,
+        timeout_s: float,
+        *,
+        line_ending: str = "\r",
+        expect_prompt: bool = False,
+    ) -> Dict[str, Any]:
+        cmd = cmd.strip()
+        with self._cmd_lock:
+            started = time.monotonic()
+            pending = _Pending(cmd, framing, expect_prompt)
+            with self._cond:
+                if not self.alive:
+                    return {"ok": False, "cmd": cmd, "stdout": "", "stderr": self.error or "串口会话已关闭", "final": None, "urcs": []}
+                self._pending = pending
+            try:
+                self._ser.write((cmd + line_ending).encode(self.encoding, errors="replace"))
+            except Exception as exc:
+                with self._cond:
+                    self._pending = None
+                    self.error = str(exc)
+                return {"ok": False, "cmd": cmd, "stdout": "", "stderr": str(exc), "final": None, "urcs": []}
+            with self._cond:
+                self._cond.wait_for(lambda: pending.final is not None or self.error is not None, timeout=timeout_s)
+                self._pending = None
+                self.commands += 1
+            elapsed_ms = int((time.monotonic() - started) * 1000)
+        if pending.final is not None:
+            stderr = "" if pending.ok else pending.final
+        else:
+            stderr = self.error or f"等待最终结果码超时({timeout_s:g}s)"
+        return {
+            "ok": pending.ok,
+            "cmd": cmd,
+            "stdout": "\n".join(pending.lines),
+            "stderr": stderr,
+            "final": pending.final,
+            "urcs": pending.urcs,
+            "elapsed_ms": elapsed_ms,
+        }
+
+    def drain_urcs(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            out = [{"ts": ts, "line": line} for ts, line in self.urcs]
+            self.urcs.clear()
+        return out
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        try:
+            self._ser.close()
+        except Exception:
+            pass
+        if self._reader is not threading.current_thread():
+            self._reader.join(timeout=1.0)
+
+
+def open_serial_port(port: str, baudrate: int) -> Any:
+    if serial is None:
+        raise RuntimeError("pyserial不可用: 请安装 pyserial")
+    # A short read timeout only bounds how quickly the reader notices close(); responses are framed by result codes.
+    return serial.Serial(port=port, baudrate=baudrate, timeout=0.05, write_timeout=5)
+
+
+class SerialSessionManager:
+    """Keeps one long-lived SerialSession per port, reopening it after a port error or baudrate change."""
+
+    def __init__(self, opener: Callable[[str, int], Any] = open_serial_port, *, encoding: str = "latin-1"):
+        self._opener = opener
+        self.encoding = encoding
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Tuple[int, SerialSession]] = {}
+
+    def get(self, port: str, baudrate: int) -> SerialSession:
+        with self._lock:
+            entry = self._sessions.get(port)
+            if entry is not None and entry[0] == baudrate and entry[1].alive:
+                return entry[1]
+            if entry is not None:
+                entry[1].close()
+                del self._sessions[port]
+            session = SerialSession(self._opener(port, baudrate), encoding=self.encoding)
+            self._sessions[port] = (baudrate, session)
+            return session
+
+    def get_open(self, port: str) -> Optional[SerialSession]:
+        with self._lock:
+            entry = self._sessions.get(port)
+        return entry[1] if entry is not None else None
+
+    def close(self, port: str) -> bool:
+        with self._lock:
+            entry = self._sessions.pop(port, None)
+        if entry is None:
+            return False
+        entry[1].close()
+        return True
+
+    def close_all(self) -> None:
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+        for _, session in entries:
+            session.close()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = list(self._sessions.items())
+        return [
+            {"port": port, "baudrate": baud, "alive": s.alive, "commands": s.commands, "buffered_urcs": len(s.urcs), "error": s.error}
+            for port, (baud, s) in items
+        ]
@@ -0,0 +1,137 @@
+import math
+import re
+import zipfile
+from typing import Any, Iterable, Iterator, List, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+# Excel rejects XML-illegal control characters and truncates cells past this length.
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+MAX_CELL_CHARS = 32767
+
+Sheet = Tuple[str, Sequence[str], Iterable[Sequence[Any]]]
+
+_CONTENT_TYPES_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object; zipfile then streams entries with data descriptors."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self.size = 0
+        self._pos = 0
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        self.size = 0
+        return out
+
+
+def _column(idx: int) -> str:
+    name = ""
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+
+def _cell(ref: str, value: Any) -> str:
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = _ILLEGAL_XML.sub("", str(value))[:MAX_CELL_CHARS]
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _row_xml(row_no: int, values: Sequence[Any]) -> str:
+    cells = "".join(_cell(f"{_column(i)}{row_no}", v) for i, v in enumerate(values, start=1))
+    return f'<row r="{row_no}">{cells}</row>'
+
+
+def iter_xlsx(sheets: Iterable[Sheet], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yields an .xlsx file in chunks while rows are being produced.
+
+    Each sheet is (name, header, rows), where rows may be a lazy iterable; only about `chunk_size`
+    bytes of compressed output are held at a time. Strings are written inline, so no shared-string
+    table has to be kept in memory.
+    """
+    sink = _ChunkSink()
+    names: List[str] = []
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        for name, header, rows in sheets:
+            names.append(name)
+            with zf.open(f"xl/worksheets/sheet{len(names)}.xml", "w") as entry:
+                entry.write(_SHEET_HEAD.encode("utf-8"))
+                entry.write(_row_xml(1, header).encode("utf-8"))
+                for row_no, row in enumerate(rows, start=2):
+                    entry.write(_row_xml(row_no, row).encode("utf-8"))
+                    if sink.size >= chunk_size:
+                        yield sink.drain()
+                entry.write(_SHEET_TAIL.encode("utf-8"))
+            if sink.size:
+                yield sink.drain()
+        sheets_xml = "".join(
+            f'<sheet name="{escape(n[:31], {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, n in enumerate(names, start=1)
+        )
+        zf.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f"<sheets>{sheets_xml}</sheets></workbook>",
+        )
+        rels = "".join(
+            f'<Relationship Id="rId{i}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, len(names) + 1)
+        )
+        zf.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">{rels}</Relationships>',
+        )
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(names) + 1)
+        )
+        zf.writestr("[Content_Types].xml", f"{_CONTENT_TYPES_HEAD}{overrides}</Types>")
+    yield sink.drain()
@@ -1,11 +1,38 @@
-import asyncio, warnings, copy, time
+import asyncio, warnings, contextvars, copy, time, json, os, re, uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_run_ctx=contextvars.ContextVar("pocketflow_run",default=None)
+_ckpt_ctx=contextvars.ContextVar("pocketflow_checkpoint",default=None)
+_graph_version=[0]
+
+class RunLocal:
+    def __set_name__(self,owner,name): self.name=name
+    def __get__(self,obj,owner=None):
+        if obj is None: return self
+        ctx=_run_ctx.get(); e=ctx.get(id(obj)) if ctx is not None else None
+        if e is not None and e[0] is obj and self.name in e[1]: return e[1][self.name]
+        try: return obj.__dict__[self.name]
+        except KeyError: raise AttributeError(self.name) from None
+    def __set__(self,obj,value):
+        ctx=_run_ctx.get()
+        if ctx is None or self.name not in obj.__dict__: obj.__dict__[self.name]=value
+        if ctx is None: return
+        e=ctx.get(id(obj))  # holds obj, so its id can't be reused by another object during the run
+        if e is None or e[0] is not obj: e=ctx[id(obj)]=(obj,{})
+        e[1][self.name]=value
+
+def _done(ctx,curr,node):
+    if curr is not node: ctx.pop(id(curr),None)
+
+def _fresh(n): return copy.copy(n) if n is not None and n.copy_on_run else n
 
 class BaseNode:
+    params,actions,copy_on_run=RunLocal(),None,True
     def __init__(self): self.params,self.successors={},{}
     def set_params(self,params): self.params=params
     def next(self,node,action="default"):
         if action in self.successors: warnings.warn(f"Overwriting successor for action '{action}'")
-        self.successors[action]=node; return node
+        self.successors[action]=node; _graph_version[0]+=1; return node
     def prep(self,shared): pass
     def exec(self,prep_res): pass
     def post(self,shared,prep_res,exec_res): pass
@@ -24,6 +51,7 @@ class _ConditionalTransition:
     def __rshift__(self,tgt): return self.src.next(tgt,self.action)
 
 class Node(BaseNode):
+    cur_retry=RunLocal()
     def __init__(self,max_retries=1,wait=0): super().__init__(); self.max_retries,self.wait=max_retries,wait
     def exec_fallback(self,prep_res,exc): raise exc
     def _exec(self,prep_res):
@@ -36,16 +64,67 @@ class Node(BaseNode):
 class BatchNode(Node):
     def _exec(self,items): return [super(BatchNode,self)._exec(i) for i in (items or [])]
 
+class StreamBatchNode(BatchNode):
+    def post_item(self,shared,item,exec_res): pass
+    def _run(self,shared):
+        p,n=self.prep(shared),0
+        for i in (p or []): self.post_item(shared,i,super(BatchNode,self)._exec(i)); n+=1
+        return self.post(shared,p,n)
+
+def _next_index(curr,edges,action):
+    i=edges.get(action or "default")
+    if i is None and edges: warnings.warn(f"Flow ends: '{action}' not found in {list(curr.successors)}")
+    return i
+
 class Flow(BaseNode):
+    _compiled=None
     def __init__(self,start=None): super().__init__(); self.start_node=start
     def start(self,start): self.start_node=start; return start
     def get_next_node(self,curr,action):
         nxt=curr.successors.get(action or "default")
         if not nxt and curr.successors: warnings.warn(f"Flow ends: '{action}' not found in {list(curr.successors)}")
         return nxt
+    def compile(self,validate=True,strict=False):
+        nodes,idx=[],{}
+        for n in ([self.start_node] if self.start_node else []):
+            if id(n) not in idx: idx[id(n)]=len(nodes); nodes.append(n)
+        for n in nodes:
+            for s in n.successors.values():
+                if id(s) not in idx: idx[id(s)]=len(nodes); nodes.append(s)
+        table=[{a:idx[id(s)] for a,s in n.successors.items()} for n in nodes]
+        if validate: self._validate(nodes,table,strict)
+        self._compiled=(_graph_version[0],self.start_node,nodes,table); return self
+    def _validate(self,nodes,table,strict):
+        problems,seen,stack=[],{0} if nodes else set(),[0] if nodes else []
+        for n in nodes:
+            if n.actions is None or not n.successors: continue
+            missing,unused=[a for a in n.actions if a not in n.successors],[a for a in n.successors if a not in n.actions]
+            if missing: problems.append(f"{type(n).__name__} can return {missing} but has no successor for them")
+            if unused: problems.append(f"{type(n).__name__} has successors for {unused} that it never returns")
+        while stack:
+            i=stack.pop(); n=nodes[i]
+            for a,j in table[i].items():
+                if (n.actions is None or a in n.actions) and j not in seen: seen.add(j); stack.append(j)
+        unreachable=[type(nodes[i]).__name__ for i in range(len(nodes)) if i not in seen]
+        if unreachable: problems.append(f"Unreachable from start: {unreachable}")
+        if strict and problems: raise ValueError("; ".join(problems))
+        for m in problems: warnings.warn(m)
+    def _plan(self):
+        if type(self).get_next_node is not Flow.get_next_node: return None
+        c=self._compiled
+        if c is None or c[0]!=_graph_version[0] or c[1] is not self.start_node: c=self.compile(validate=False)._compiled
+        return c
     def _orch(self,shared,params=None):
-        curr,p,last_action =copy.copy(self.start_node),(params or {**self.params}),None
-        while curr: curr.set_params(p); last_action=curr._run(shared); curr=copy.copy(self.get_next_node(curr,last_action))
+        p,plan,last_action=(params or {**self.params}),self._plan(),None
+        ctx={}; tok=_run_ctx.set(ctx)
+        try:
+            if plan:
+                nodes,table=plan[2],plan[3]; i=0 if nodes else None
+                while i is not None: curr=_fresh(nodes[i]); curr.set_params(p); last_action=curr._run(shared); _done(ctx,curr,nodes[i]); i=_next_index(curr,table[i],last_action)
+            else:
+                node=self.start_node; curr=_fresh(node)
+                while curr: curr.set_params(p); last_action=curr._run(shared); nxt=self.get_next_node(curr,last_action); _done(ctx,curr,node); node=nxt; curr=_fresh(nxt)
+        finally: _run_ctx.reset(tok)
         return last_action
     def _run(self,shared): p=self.prep(shared); o=self._orch(shared); return self.post(shared,p,o)
     def post(self,shared,prep_res,exec_res): return exec_res
@@ -76,15 +155,136 @@ class AsyncNode(Node):
 class AsyncBatchNode(AsyncNode,BatchNode):
     async def _exec(self,items): return [await super(AsyncBatchNode,self)._exec(i) for i in items]
 
+async def _aiter(items):
+    if hasattr(items,"__aiter__"):
+        async for i in items: yield i
+    else:
+        for i in (items or []): yield i
+
+class AsyncStreamBatchNode(AsyncNode,StreamBatchNode):
+    async def post_item_async(self,shared,item,exec_res): pass
+    async def _run_async(self,shared):
+        p,n=await self.prep_async(shared),0
+        async for i in _aiter(p): await self.post_item_async(shared,i,await self._exec(i)); n+=1
+        return await self.post_async(shared,p,n)
+
+async def _gather(coros,limit=None,return_exceptions=False):
+    res,pending,it={},{},enumerate(coros)
+    def fill():
+        for i,c in it:
+            pending[asyncio.ensure_future(c)]=i
+            if limit and len(pending)>=limit: break
+    fill()
+    try:
+        while pending:
+            done,_=await asyncio.wait(pending,return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                i,e=pending.pop(t),t.exception()
+                if e is not None and not return_exceptions: raise e
+                res[i]=e if e is not None else t.result()
+            fill()
+    finally:
+        for t in pending: t.cancel()
+        if pending: await asyncio.wait(pending)
+    return [res[i] for i in range(len(res))]
+
 class AsyncParallelBatchNode(AsyncNode,BatchNode):
-    async def _exec(self,items): return await asyncio.gather(*(super(AsyncParallelBatchNode,self)._exec(i) for i in items))
+    max_concurrency,return_exceptions=None,False
+    def __init__(self,max_retries=1,wait=0,max_concurrency=None,return_exceptions=None):
+        super().__init__(max_retries,wait)
+        if max_concurrency is not None: self.max_concurrency=max_concurrency
+        if return_exceptions is not None: self.return_exceptions=return_exceptions
+    async def _exec(self,items): return await _gather((super(AsyncParallelBatchNode,self)._exec(i) for i in (items or [])),self.max_concurrency,self.return_exceptions)
+
+def _plain(v):
+    if v is None or isinstance(v,(str,int,float,bool)): return True
+    if isinstance(v,(list,tuple)): return all(_plain(x) for x in v)
+    if isinstance(v,dict): return all((k is None or isinstance(k,(str,int,float,bool))) and _plain(x) for k,x in v.items())
+    return False
+
+def _encode(v):
+    if isinstance(v,dict): return {k:_encode(x) for k,x in v.items()} if all(isinstance(k,str) for k in v) else {"__items__":[[k,_encode(x)] for k,x in v.items()]}
+    return [_encode(x) for x in v] if isinstance(v,(list,tuple)) else v
+
+def _decode(d): return {k:x for k,x in d["__items__"]} if len(d)==1 and "__items__" in d else d
+def _dumps(state): return json.dumps(_encode(state),ensure_ascii=False)
+
+class FileCheckpointStore:
+    def __init__(self,path): self.path=str(path); os.makedirs(self.path,exist_ok=True)
+    def _file(self,checkpoint_id):
+        if not re.fullmatch(r"[A-Za-z0-9_.-]+",str(checkpoint_id)) or str(checkpoint_id).startswith("."): raise ValueError(f"Invalid checkpoint id '{checkpoint_id}'")
+        return os.path.join(self.path,f"{checkpoint_id}.json")
+    def save(self,checkpoint_id,state): self.save_text(checkpoint_id,_dumps(state))
+    def save_text(self,checkpoint_id,text):
+        f=self._file(checkpoint_id); tmp=f"{f}.tmp"
+        with open(tmp,"w",encoding="utf-8") as fh: fh.write(text)
+        os.replace(tmp,f)
+    def load(self,checkpoint_id):
+        try:
+            with open(self._file(checkpoint_id),encoding="utf-8") as fh: return json.load(fh,object_hook=_decode)
+        except FileNotFoundError: return None
+    def delete(self,checkpoint_id):
+        try: os.remove(self._file(checkpoint_id))
+        except FileNotFoundError: pass
 
 class AsyncFlow(Flow,AsyncNode):
-    async def _orch_async(self,shared,params=None):
-        curr,p,last_action =copy.copy(self.start_node),(params or {**self.params}),None
-        while curr: curr.set_params(p); last_action=await curr._run_async(shared) if isinstance(curr,AsyncNode) else curr._run(shared); curr=copy.copy(self.get_next_node(curr,last_action))
+    checkpoint_id,_pool,_pool_users=None,None,0
+    def __init__(self,start=None,executor=None,max_workers=None,checkpoint_store=None,checkpoint_exclude=()):
+        super().__init__(start); self.executor,self.max_workers=executor,max_workers
+        self.checkpoint_store,self.checkpoint_exclude=checkpoint_store,set(checkpoint_exclude)
+    def _acquire_pool(self):
+        if self.executor is None and self.max_workers:
+            if self._pool is None: self._pool=ThreadPoolExecutor(self.max_workers,thread_name_prefix="pocketflow")
+            self._pool_users+=1
+    def _release_pool(self):
+        if self.executor is None and self._pool is not None:
+            self._pool_users-=1
+            if self._pool_users==0: self._pool.shutdown(wait=False); self._pool=None
+    def _get_executor(self): return self.executor or self._pool
+    async def run_async(self,shared,resume_from=None,checkpoint_id=None):
+        st=None
+        if resume_from is not None:
+            if self.checkpoint_store is None: raise ValueError("resume_from requires a checkpoint_store")
+            st=self.checkpoint_store.load(resume_from)
+            if st is None: raise KeyError(f"Checkpoint '{resume_from}' not found")
+            shared.update((k,v) for k,v in st["shared"].items() if _plain(shared.get(k)))
+        cid=(resume_from or checkpoint_id or uuid.uuid4().hex) if self.checkpoint_store is not None else None
+        self.checkpoint_id=cid  # id of the latest run; concurrent runs keep their own in _ckpt_ctx
+        tok=_ckpt_ctx.set((self,cid,st)); self._acquire_pool()
+        try: return await super().run_async(shared)
+        finally: _ckpt_ctx.reset(tok); self._release_pool()
+    async def _checkpoint(self,cid,shared,params,nodes,i,last_action):
+        st={"node":i,"node_name":type(nodes[i]).__name__ if i is not None else None,"last_action":last_action,"params":params,
+            "shared":{k:v for k,v in shared.items() if k not in self.checkpoint_exclude and _plain(v)}}
+        text,save_text=_dumps(st),getattr(self.checkpoint_store,"save_text",None)  # serialized on the loop, before later nodes can mutate shared
+        args=(save_text,cid,text) if save_text else (self.checkpoint_store.save,cid,json.loads(text,object_hook=_decode))
+        await asyncio.get_running_loop().run_in_executor(self._get_executor(),*args)
+    async def _run_node_async(self,curr,shared):
+        if isinstance(curr,AsyncNode): return await curr._run_async(shared)
+        ex=self._get_executor()
+        if ex is None: return curr._run(shared)
+        return await asyncio.get_running_loop().run_in_executor(ex,contextvars.copy_context().run,curr._run,shared)
+    async def _orch_async(self,shared,params=None,checkpoint=False):
+        p,plan,last_action=(params or {**self.params}),self._plan(),None
+        c=_ckpt_ctx.get() if checkpoint else None
+        cid,resume=c[1:] if c is not None and c[0] is self else (None,None)
+        if cid is not None and not plan: raise ValueError("Checkpointing requires the default get_next_node")
+        ctx={}; tok=_run_ctx.set(ctx); self._acquire_pool()
+        try:
+            if plan:
+                nodes,table=plan[2],plan[3]; i=0 if nodes else None
+                if resume:
+                    i,last_action,p=resume["node"],resume["last_action"],resume["params"]
+                    if i is not None and (i>=len(nodes) or type(nodes[i]).__name__!=resume["node_name"]): raise ValueError(f"Checkpoint '{cid}' does not match this flow")
+                while i is not None:
+                    curr=_fresh(nodes[i]); curr.set_params(p); last_action=await self._run_node_async(curr,shared); _done(ctx,curr,nodes[i]); i=_next_index(curr,table[i],last_action)
+                    if cid is not None: await self._checkpoint(cid,shared,p,nodes,i,last_action)
+            else:
+                node=self.start_node; curr=_fresh(node)
+                while curr: curr.set_params(p); last_action=await self._run_node_async(curr,shared); nxt=self.get_next_node(curr,last_action); _done(ctx,curr,node); node=nxt; curr=_fresh(nxt)
+        finally: _run_ctx.reset(tok); self._release_pool()
         return last_action
-    async def _run_async(self,shared): p=await self.prep_async(shared); o=await self._orch_async(shared); return await self.post_async(shared,p,o)
+    async def _run_async(self,shared): p=await self.prep_async(shared); o=await self._orch_async(shared,checkpoint=True); return await self.post_async(shared,p,o)
     async def post_async(self,shared,prep_res,exec_res): return exec_res
 
 class AsyncBatchFlow(AsyncFlow,BatchFlow):
@@ -94,7 +294,44 @@ class AsyncBatchFlow(AsyncFlow,BatchFlow):
         return await self.post_async(shared,pr,None)
 
 class AsyncParallelBatchFlow(AsyncFlow,BatchFlow):
-    async def _run_async(self,shared): 
+    max_concurrency,return_exceptions=None,False
+    def __init__(self,start=None,max_concurrency=None,return_exceptions=None,**kwargs):
+        super().__init__(start,**kwargs)
+        if max_concurrency is not None: self.max_concurrency=max_concurrency
+        if return_exceptions is not None: self.return_exceptions=return_exceptions
+    async def _run_async(self,shared):
         pr=await self.prep_async(shared) or []
-        await asyncio.gather(*(self._orch_async(shared,{**self.params,**bp}) for bp in pr))
-        return await self.post_async(shared,pr,None)
\ No newline at end of file
+        rs=await _gather((self._orch_async(shared,{**self.params,**bp}) for bp in pr),self.max_concurrency,self.return_exceptions)
+        return await self.post_async(shared,pr,rs if self.return_exceptions else None)
+
+_DELETED=object()
+
+class AsyncParallelFlow(AsyncNode):
+    max_concurrency,return_exceptions,on_conflict=None,False,"last"
+    def __init__(self,branches=(),executor=None,max_concurrency=None,return_exceptions=None,on_conflict=None):
+        super().__init__(); self.branches,self.executor=list(branches),executor
+        if max_concurrency is not None: self.max_concurrency=max_concurrency
+        if return_exceptions is not None: self.return_exceptions=return_exceptions
+        if on_conflict is not None: self.on_conflict=on_conflict
+    async def _run_branch(self,branch,view):
+        branch=_fresh(branch); branch.set_params({**self.params})
+        if isinstance(branch,AsyncNode): return await branch._run_async(view)
+        return await asyncio.get_running_loop().run_in_executor(self.executor,contextvars.copy_context().run,branch._run,view)
+    def _merge(self,shared,views):
+        base,writes,owner={**shared},{},{}
+        for i,v in views:
+            changes={k:x for k,x in v.items() if k not in base or x is not base[k]}
+            changes.update((k,_DELETED) for k in base if k not in v)
+            for k,x in changes.items():
+                if k in owner:
+                    if self.on_conflict=="error": raise ValueError(f"Branches {owner[k]} and {i} both wrote shared['{k}']")
+                    if self.on_conflict=="first": continue
+                writes[k],owner[k]=x,i
+        for k,x in writes.items():
+            if x is _DELETED: shared.pop(k,None)
+            else: shared[k]=x
+    async def _run_async(self,shared):
+        p=await self.prep_async(shared); views=[dict(shared) for _ in self.branches]
+        rs=await _gather((self._run_branch(b,v) for b,v in zip(self.branches,views)),self.max_concurrency,self.return_exceptions)
+        self._merge(shared,[(i,v) for i,(v,r) in enumerate(zip(views,rs)) if not isinstance(r,BaseException)])
+        return await self.post_async(shared,p,rs)
@@ -1,5 +1,7 @@
 import asyncio
-from typing import Any, Dict, List, Optional, Union, TypeVar, Generic
+import os
+from concurrent.futures import Executor
+from typing import Any, Dict, Iterable, List, Optional, Union, TypeVar, Generic
 
 # Type variables for better type relationships
 _PrepResult = TypeVar('_PrepResult')
@@ -11,8 +13,17 @@ ParamValue = Union[str, int, float, bool, None, List[Any], Dict[str, Any]]
 SharedData = Dict[str, Any]
 Params = Dict[str, ParamValue]
 
+class RunLocal:
+    name: str
+
+    def __set_name__(self, owner: type, name: str) -> None: ...
+    def __get__(self, obj: Any, owner: Optional[type] = None) -> Any: ...
+    def __set__(self, obj: Any, value: Any) -> None: ...
+
 class BaseNode(Generic[_PrepResult, _ExecResult, _PostResult]):
     params: Params
+    actions: Optional[Iterable[str]]
+    copy_on_run: bool
     successors: Dict[str, BaseNode[Any, Any, Any]]
     
     def __init__(self) -> None: ...
@@ -25,14 +36,7 @@ class BaseNode(Generic[_PrepResult, _ExecResult, _PostResult]):
     def _run(self, shared: SharedData) -> _PostResult: ...
     def run(self, shared: SharedData) -> _PostResult: ...
     def __rshift__(self, other: BaseNode[Any, Any, Any]) -> BaseNode[Any, Any, Any]: ...
-    def __sub__(self, action: str) -> _ConditionalTransition: ...
-
-class _ConditionalTransition:
-    src: BaseNode[Any, Any, Any]
-    action: str
-    
-    def __init__(self, src: BaseNode[Any, Any, Any], action: str) -> None: ...
-    def __rshift__(self, tgt: BaseNode[Any, Any, Any]) -> BaseNode[Any, Any, Any]: ...
+    def __sub__(self, action: str) -> Any: ...
 
 class Node(BaseNode[_PrepResult, _ExecResult, _PostResult]):
     max_retries: int
@@ -46,6 +50,10 @@ class Node(BaseNode[_PrepResult, _ExecResult, _PostResult]):
 class BatchNode(Node[Optional[List[_PrepResult]], List[_ExecResult], _PostResult]):
     def _exec(self, items: Optional[List[_PrepResult]]) -> List[_ExecResult]: ...
 
+class StreamBatchNode(BatchNode[_PrepResult, _ExecResult, _PostResult]):
+    def post_item(self, shared: SharedData, item: _PrepResult, exec_res: _ExecResult) -> None: ...
+    def _run(self, shared: SharedData) -> _PostResult: ...
+
 class Flow(BaseNode[_PrepResult, Any, _PostResult]):
     start_node: Optional[BaseNode[Any, Any, Any]]
     
@@ -54,6 +62,7 @@ class Flow(BaseNode[_PrepResult, Any, _PostResult]):
     def get_next_node(
         self, curr: BaseNode[Any, Any, Any], action: Optional[str]
     ) -> Optional[BaseNode[Any, Any, Any]]: ...
+    def compile(self, validate: bool = True, strict: bool = False) -> Flow[_PrepResult, Any, _PostResult]: ...
     def _orch(
         self, shared: SharedData, params: Optional[Params] = None
     ) -> Any: ...
@@ -78,12 +87,52 @@ class AsyncNode(Node[_PrepResult, _ExecResult, _PostResult]):
 class AsyncBatchNode(AsyncNode[Optional[List[_PrepResult]], List[_ExecResult], _PostResult], BatchNode[Optional[List[_PrepResult]], List[_ExecResult], _PostResult]):
     async def _exec(self, items: Optional[List[_PrepResult]]) -> List[_ExecResult]: ...
 
+class AsyncStreamBatchNode(AsyncNode[_PrepResult, _ExecResult, _PostResult], StreamBatchNode[_PrepResult, _ExecResult, _PostResult]):
+    async def post_item_async(self, shared: SharedData, item: _PrepResult, exec_res: _ExecResult) -> None: ...
+    async def _run_async(self, shared: SharedData) -> _PostResult: ...
+
 class AsyncParallelBatchNode(AsyncNode[Optional[List[_PrepResult]], List[_ExecResult], _PostResult], BatchNode[Optional[List[_PrepResult]], List[_ExecResult], _PostResult]):
+    max_concurrency: Optional[int]
+    return_exceptions: bool
+
+    def __init__(
+        self,
+        max_retries: int = 1,
+        wait: Union[int, float] = 0,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: Optional[bool] = None,
+    ) -> None: ...
     async def _exec(self, items: Optional[List[_PrepResult]]) -> List[_ExecResult]: ...
 
+class FileCheckpointStore:
+    path: str
+
+    def __init__(self, path: Union[str, "os.PathLike[str]"]) -> None: ...
+    def save(self, checkpoint_id: str, state: Dict[str, Any]) -> None: ...
+    def save_text(self, checkpoint_id: str, text: str) -> None: ...
+    def load(self, checkpoint_id: str) -> Optional[Dict[str, Any]]: ...
+    def delete(self, checkpoint_id: str) -> None: ...
+
 class AsyncFlow(Flow[_PrepResult, Any, _PostResult], AsyncNode[_PrepResult, Any, _PostResult]):
+    executor: Optional[Executor]
+    max_workers: Optional[int]
+    checkpoint_store: Any
+    checkpoint_exclude: set
+    checkpoint_id: Optional[str]
+
+    def __init__(
+        self,
+        start: Optional[BaseNode[Any, Any, Any]] = None,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+        checkpoint_store: Any = None,
+        checkpoint_exclude: Iterable[str] = (),
+    ) -> None: ...
+    async def run_async(
+        self, shared: SharedData, resume_from: Optional[str] = None, checkpoint_id: Optional[str] = None
+    ) -> _PostResult: ...
     async def _orch_async(
-        self, shared: SharedData, params: Optional[Params] = None
+        self, shared: SharedData, params: Optional[Params] = None, checkpoint: bool = False
     ) -> Any: ...
     async def _run_async(self, shared: SharedData) -> _PostResult: ...
     async def post_async(
@@ -94,4 +143,35 @@ class AsyncBatchFlow(AsyncFlow[Optional[List[Params]], Any, _PostResult], BatchF
     async def _run_async(self, shared: SharedData) -> _PostResult: ...
 
 class AsyncParallelBatchFlow(AsyncFlow[Optional[List[Params]], Any, _PostResult], BatchFlow[Optional[List[Params]], Any, _PostResult]):
-    async def _run_async(self, shared: SharedData) -> _PostResult: ...
\ No newline at end of file
+    max_concurrency: Optional[int]
+    return_exceptions: bool
+
+    def __init__(
+        self,
+        start: Optional[BaseNode[Any, Any, Any]] = None,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: Optional[bool] = None,
+        *,
+        executor: Optional[Executor] = None,
+        max_workers: Optional[int] = None,
+        checkpoint_store: Any = None,
+        checkpoint_exclude: Iterable[str] = (),
+    ) -> None: ...
+    async def _run_async(self, shared: SharedData) -> _PostResult: ...
+
+class AsyncParallelFlow(AsyncNode[_PrepResult, List[Any], _PostResult]):
+    branches: List[BaseNode[Any, Any, Any]]
+    executor: Optional[Executor]
+    max_concurrency: Optional[int]
+    return_exceptions: bool
+    on_conflict: str
+
+    def __init__(
+        self,
+        branches: Iterable[BaseNode[Any, Any, Any]] = (),
+        executor: Optional[Executor] = None,
+        max_concurrency: Optional[int] = None,
+        return_exceptions: Optional[bool] = None,
+        on_conflict: Optional[str] = None,
+    ) -> None: ...
+    async def _run_async(self, shared: SharedData) -> _PostResult: ...
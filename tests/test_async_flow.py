@@ -1,6 +1,9 @@
 import unittest
 import asyncio
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -72,6 +75,50 @@ class AsyncPathNode(AsyncNode):
          await asyncio.sleep(0.01)
          # Return None by default
 
+class BlockingSyncNode(Node):
+    """ A sync node whose exec blocks the calling thread, like a urllib LLM call. """
+    def __init__(self, delay=0.2):
+        super().__init__()
+        self.delay = delay
+
+    def exec(self, prep_res):
+        time.sleep(self.delay)
+        return threading.current_thread().name
+
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage['sync_thread'] = exec_result
+        return "default"
+
+class LoopProbeSyncNode(Node):
+    """ A sync node that blocks until a coroutine on the event loop sets its event. """
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+        self.event = threading.Event()
+
+    def exec(self, prep_res):
+        return self.event.wait(self.timeout)
+
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage['loop_ran_meanwhile'] = exec_result
+        shared_storage['sync_thread'] = threading.current_thread().name
+
+class ConcurrencyProbeNode(Node):
+    """ A sync node that records how many probes are in flight and meets a partner at a barrier. """
+    def __init__(self, tracker, barrier):
+        super().__init__()
+        self.tracker, self.barrier = tracker, barrier
+
+    def exec(self, prep_res):
+        with self.tracker['lock']:
+            self.tracker['in_flight'] += 1
+            self.tracker['max'] = max(self.tracker['max'], self.tracker['in_flight'])
+        try:
+            self.barrier.wait()
+        finally:
+            with self.tracker['lock']:
+                self.tracker['in_flight'] -= 1
+
 class TestAsyncNode(unittest.TestCase):
     """
     Test the AsyncNode (and descendants) in isolation (not in a flow).
@@ -224,5 +271,64 @@ class TestAsyncFlow(unittest.TestCase):
         # path_b_node, which returns None from its post_async method.
         self.assertIsNone(last_action_outer)
 
+
+class TestAsyncFlowExecutor(unittest.TestCase):
+    """
+    Test offloading sync nodes from the event loop with an executor.
+    """
+    async def _run_with_setter(self, flow, node, shared_storage):
+        async def set_event():
+            await asyncio.sleep(0)
+            node.event.set()
+        task = asyncio.create_task(set_event())
+        await flow.run_async(shared_storage)
+        await task
+
+    def test_sync_node_runs_inline_by_default(self):
+        shared_storage = {}
+        node = LoopProbeSyncNode(timeout=0.05)
+        asyncio.run(self._run_with_setter(AsyncFlow(start=node), node, shared_storage))
+        self.assertEqual(shared_storage['sync_thread'], threading.main_thread().name)
+        # The node held the loop, so the coroutine that sets the event could not run
+        self.assertFalse(shared_storage['loop_ran_meanwhile'])
+
+    def test_sync_node_offloaded_with_max_workers(self):
+        shared_storage = {}
+        node = LoopProbeSyncNode(timeout=10)
+        asyncio.run(self._run_with_setter(AsyncFlow(start=node, max_workers=2), node, shared_storage))
+        self.assertNotEqual(shared_storage['sync_thread'], threading.main_thread().name)
+        self.assertTrue(shared_storage['sync_thread'].startswith("pocketflow"))
+        # The loop stayed responsive while the node blocked its worker thread
+        self.assertTrue(shared_storage['loop_ran_meanwhile'])
+
+    def test_owned_pool_is_shut_down_after_run(self):
+        flow = AsyncFlow(start=BlockingSyncNode(delay=0), max_workers=2)
+        before = {t.name for t in threading.enumerate()}
+        asyncio.run(flow.run_async({}))
+        self.assertIsNone(flow._pool)
+        for t in threading.enumerate():
+            if t.name.startswith("pocketflow") and t.name not in before:
+                t.join(timeout=5)
+                self.assertFalse(t.is_alive())
+
+    def test_shared_executor_bounds_concurrency(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        tracker = {'lock': threading.Lock(), 'in_flight': 0, 'max': 0}
+        # Each probe waits for a partner, so the run only finishes if two of them run at once
+        barrier = threading.Barrier(2, timeout=10)
+        async def run_many():
+            flows = [AsyncFlow(start=ConcurrencyProbeNode(tracker, barrier), executor=executor) for _ in range(4)]
+            await asyncio.gather(*(f.run_async({}) for f in flows))
+        asyncio.run(run_many())
+        executor.shutdown()
+        self.assertEqual(tracker['max'], 2)
+
+    def test_async_nodes_unaffected_by_executor(self):
+        start = AsyncNumberNode(5)
+        start - "number_set" >> AsyncIncrementNode()
+        shared_storage = {}
+        asyncio.run(AsyncFlow(start, max_workers=1).run_async(shared_storage))
+        self.assertEqual(shared_storage['current'], 6)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,190 @@
+import unittest
+import asyncio
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from pocketflow import Node, AsyncNode, AsyncFlow, AsyncBatchFlow, FileCheckpointStore
+
+class StepNode(AsyncNode):
+    def __init__(self, name, fail_times=0):
+        super().__init__()
+        # Kept in a dict so the count survives the per-run copies the flow makes of this node
+        self.name, self.failures = name, {'left': fail_times}
+
+    async def exec_async(self, prep_result):
+        if self.failures['left'] > 0:
+            self.failures['left'] -= 1
+            raise RuntimeError(f"{self.name} failed")
+        return self.name
+
+    async def post_async(self, shared_storage, prep_result, exec_result):
+        shared_storage['runs'].append(exec_result)
+        shared_storage[f'{self.name}_result'] = {0: exec_result.upper(), 1: [exec_result]}
+        return "default"
+
+class SyncStepNode(Node):
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage['runs'].append('sync')
+
+def build_flow(store, fail_at_c=1):
+    a, b, c = StepNode('a'), SyncStepNode(), StepNode('c', fail_times=fail_at_c)
+    a >> b >> c
+    return AsyncFlow(start=a, checkpoint_store=store)
+
+class TestAsyncFlowCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = FileCheckpointStore(self.tmp.name)
+
+    def tearDown(self):
+        self.loop.close()
+        self.tmp.cleanup()
+
+    def test_resume_restarts_at_the_failed_node(self):
+        flow = build_flow(self.store)
+        lock = threading.Lock()
+        shared_storage = {'runs': [], 'lock': lock}
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(flow.run_async(shared_storage))
+        checkpoint_id = flow.checkpoint_id
+        self.assertEqual(shared_storage['runs'], ['a', 'sync'])
+
+        state = self.store.load(checkpoint_id)
+        self.assertEqual((state['node'], state['node_name']), (2, 'StepNode'))
+        # Live objects are left out of the checkpoint
+        self.assertNotIn('lock', state['shared'])
+        # Non-string dict keys survive the round trip
+        self.assertEqual(state['shared']['a_result'], {0: 'A', 1: ['a']})
+
+        # A fresh process: new flow objects and a new shared store with live objects only
+        resumed = build_flow(self.store, fail_at_c=0)
+        new_lock = threading.Lock()
+        shared_storage = {'runs': [], 'lock': new_lock}
+        self.loop.run_until_complete(resumed.run_async(shared_storage, resume_from=checkpoint_id))
+
+        self.assertEqual(resumed.checkpoint_id, checkpoint_id)
+        self.assertEqual(shared_storage['runs'], ['a', 'sync', 'c'])
+        self.assertEqual(shared_storage['c_result'], {0: 'C', 1: ['c']})
+        self.assertIs(shared_storage['lock'], new_lock)
+        self.assertIsNone(self.store.load(checkpoint_id)['node'])
+
+    def test_resume_keeps_live_objects_passed_in(self):
+        flow = build_flow(self.store)
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(flow.run_async({'runs': [], 'client': None}))
+
+        client = object()
+        shared_storage = {'runs': [], 'client': client}
+        self.loop.run_until_complete(build_flow(self.store, fail_at_c=0).run_async(shared_storage, resume_from=flow.checkpoint_id))
+        self.assertIs(shared_storage['client'], client)
+
+    def test_no_store_means_no_checkpoints(self):
+        flow = build_flow(None, fail_at_c=0)
+        shared_storage = {'runs': []}
+        self.loop.run_until_complete(flow.run_async(shared_storage))
+        self.assertIsNone(flow.checkpoint_id)
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(flow.run_async({'runs': []}, resume_from="abc"))
+
+    def test_excluded_keys_and_params(self):
+        a = StepNode('a')
+        flow = AsyncFlow(start=a, checkpoint_store=self.store, checkpoint_exclude=['secret'])
+        flow.set_params({'job': 7})
+        self.loop.run_until_complete(flow.run_async({'runs': [], 'secret': 'token'}))
+        state = self.store.load(flow.checkpoint_id)
+        self.assertNotIn('secret', state['shared'])
+        self.assertEqual(state['params'], {'job': 7})
+
+    def test_nested_batch_flow_is_one_step(self):
+        class Batch(AsyncBatchFlow):
+            async def prep_async(self, shared_storage):
+                return [{'i': i} for i in range(3)]
+
+        class Item(AsyncNode):
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                shared_storage['runs'].append(self.params['i'])
+
+        batch = Batch(start=Item())
+        last = StepNode('z', fail_times=1)
+        batch >> last
+        flow = AsyncFlow(start=batch, checkpoint_store=self.store)
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(flow.run_async({'runs': []}))
+
+        shared_storage = {'runs': []}
+        self.loop.run_until_complete(flow.run_async(shared_storage, resume_from=flow.checkpoint_id))
+        self.assertEqual(shared_storage['runs'], [0, 1, 2, 'z'])
+
+    def test_saved_state_is_a_snapshot(self):
+        class RecordingStore:
+            def __init__(self):
+                self.saved = []
+
+            def save(self, checkpoint_id, state):
+                self.saved.append(state)
+
+            def load(self, checkpoint_id):
+                return None
+
+        class Appender(AsyncNode):
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                shared_storage['runs'].append(len(shared_storage['runs']))
+
+        a, b = Appender(), Appender()
+        a >> b
+        store = RecordingStore()
+        self.loop.run_until_complete(AsyncFlow(start=a, checkpoint_store=store).run_async({'runs': []}))
+        # The first checkpoint is not changed by what the second node does to the same list
+        self.assertEqual([st['shared']['runs'] for st in store.saved], [[0], [0, 1]])
+
+    def test_concurrent_runs_of_one_flow_keep_their_own_checkpoints(self):
+        class Tagger(AsyncNode):
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                await asyncio.sleep(0.01 if shared_storage['tag'] == 'x' else 0)
+                shared_storage['runs'].append(shared_storage['tag'])
+
+        a, b = Tagger(), StepNode('b', fail_times=1)
+        a >> b
+        flow = AsyncFlow(start=a, checkpoint_store=self.store)
+
+        async def run_both():
+            return await asyncio.gather(
+                flow.run_async({'runs': [], 'tag': 'x'}, checkpoint_id='run-x'),
+                flow.run_async({'runs': [], 'tag': 'y'}, checkpoint_id='run-y'),
+                return_exceptions=True,
+            )
+
+        results = self.loop.run_until_complete(run_both())
+        # b fails once, in whichever run reaches it first; the other run completes
+        self.assertEqual(sum(isinstance(r, RuntimeError) for r in results), 1)
+        for tag in ('x', 'y'):
+            state = self.store.load(f'run-{tag}')
+            self.assertEqual(state['shared']['tag'], tag)
+            self.assertEqual(state['shared']['runs'][0], tag)
+
+        failed = 'run-x' if isinstance(results[0], RuntimeError) else 'run-y'
+        self.assertEqual(self.store.load(failed)['node'], 1)
+        shared_storage = {'runs': []}
+        self.loop.run_until_complete(flow.run_async(shared_storage, resume_from=failed))
+        self.assertEqual(shared_storage['runs'], [failed[-1], 'b'])
+
+    def test_invalid_and_mismatched_checkpoints(self):
+        flow = build_flow(self.store)
+        with self.assertRaises(KeyError):
+            self.loop.run_until_complete(flow.run_async({'runs': []}, resume_from="missing"))
+        with self.assertRaises(ValueError):
+            self.store.save("../escape", {})
+
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(flow.run_async({'runs': []}))
+        other = AsyncFlow(start=StepNode('only'), checkpoint_store=self.store)
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(other.run_async({'runs': []}, resume_from=flow.checkpoint_id))
+
+if __name__ == '__main__':
+    unittest.main()
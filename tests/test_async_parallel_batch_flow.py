@@ -156,5 +156,40 @@ class TestAsyncParallelBatchFlow(unittest.TestCase):
         expected_total = sum(num * 2 for batch in shared_storage['batches'] for num in batch)
         self.assertEqual(shared_storage['total'], expected_total)
 
+    def test_max_concurrency_and_return_exceptions(self):
+        """
+        Test bounded concurrency across sub-flows and collecting per-batch failures
+        """
+        state = {'active': 0, 'peak': 0}
+
+        class TrackingProcessor(AsyncParallelNumberProcessor):
+            async def prep_async(self, shared_storage):
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+                if self.params['batch_id'] == 2:
+                    state['active'] -= 1
+                    raise ValueError("bad batch")
+                return await super().prep_async(shared_storage)
+
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                state['active'] -= 1
+                return await super().post_async(shared_storage, prep_result, exec_result)
+
+        class BoundedFlow(AsyncParallelBatchFlow):
+            async def prep_async(self, shared_storage):
+                return [{'batch_id': i} for i in range(len(shared_storage['batches']))]
+
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                shared_storage['errors'] = [i for i, r in enumerate(exec_result) if isinstance(r, Exception)]
+                return None
+
+        shared_storage = {'batches': [[i] for i in range(6)]}
+        flow = BoundedFlow(start=TrackingProcessor(delay=0.02), max_concurrency=2, return_exceptions=True)
+        self.loop.run_until_complete(flow.run_async(shared_storage))
+
+        self.assertEqual(state['peak'], 2)
+        self.assertEqual(shared_storage['errors'], [2])
+        self.assertEqual(sorted(shared_storage['processed_numbers']), [0, 1, 3, 4, 5])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
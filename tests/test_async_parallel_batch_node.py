@@ -139,5 +139,78 @@ class TestAsyncParallelBatchNode(unittest.TestCase):
         self.assertLess(execution_order.index(1), execution_order.index(0))
         self.assertLess(execution_order.index(3), execution_order.index(2))
 
+class TestAsyncParallelBatchNodeConcurrency(unittest.TestCase):
+    """
+    Test max_concurrency and the exception policies of AsyncParallelBatchNode
+    """
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_max_concurrency_bounds_in_flight_items(self):
+        state = {'active': 0, 'peak': 0}
+
+        class TrackingProcessor(AsyncParallelNumberProcessor):
+            async def exec_async(self, number):
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+                # Later items finish first, so ordering must come from the input position
+                await asyncio.sleep(0.01 * (20 - number))
+                state['active'] -= 1
+                return number * 2
+
+        shared_storage = {'input_numbers': list(range(20))}
+        processor = TrackingProcessor()
+        processor.max_concurrency = 3
+        self.loop.run_until_complete(processor.run_async(shared_storage))
+
+        self.assertEqual(shared_storage['processed_numbers'], [x * 2 for x in range(20)])
+        self.assertEqual(state['peak'], 3)
+
+    def test_max_concurrency_constructor_argument(self):
+        processor = AsyncParallelBatchNode(max_concurrency=5, return_exceptions=True)
+        self.assertEqual(processor.max_concurrency, 5)
+        self.assertTrue(processor.return_exceptions)
+        self.assertIsNone(AsyncParallelBatchNode().max_concurrency)
+
+    def test_fail_fast_cancels_pending_items(self):
+        finished = []
+
+        class FailingProcessor(AsyncParallelNumberProcessor):
+            async def exec_async(self, number):
+                if number == 0:
+                    raise ValueError("boom")
+                await asyncio.sleep(0.2)
+                finished.append(number)
+                return number
+
+        shared_storage = {'input_numbers': list(range(5))}
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(FailingProcessor().run_async(shared_storage))
+        self.loop.run_until_complete(asyncio.sleep(0.3))
+        self.assertEqual(finished, [])
+
+    def test_return_exceptions_keeps_positions(self):
+        class FailingProcessor(AsyncParallelNumberProcessor):
+            async def exec_async(self, number):
+                await asyncio.sleep(0.01)
+                if number % 2:
+                    raise ValueError(f"odd {number}")
+                return number
+
+        shared_storage = {'input_numbers': list(range(5))}
+        processor = FailingProcessor()
+        processor.return_exceptions = True
+        processor.max_concurrency = 2
+        self.loop.run_until_complete(processor.run_async(shared_storage))
+
+        results = shared_storage['processed_numbers']
+        self.assertEqual([r for r in results if not isinstance(r, Exception)], [0, 2, 4])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(str(results[3]), "odd 3")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import unittest
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from pocketflow import Node, AsyncNode, AsyncFlow, AsyncParallelFlow
+
+class WriteNode(AsyncNode):
+    def __init__(self, key, value, delay=0.0):
+        super().__init__()
+        self.key, self.value, self.delay = key, value, delay
+
+    async def exec_async(self, prep_result):
+        await asyncio.sleep(self.delay)
+        return self.value
+
+    async def post_async(self, shared_storage, prep_result, exec_result):
+        shared_storage[self.key] = exec_result
+        shared_storage['log'].append(self.key)
+        return f"wrote_{self.key}"
+
+class SyncWriteNode(Node):
+    def __init__(self, key, delay=0.0):
+        super().__init__()
+        self.key, self.delay = key, delay
+
+    def exec(self, prep_result):
+        time.sleep(self.delay)
+        return self.params.get('tag')
+
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage[self.key] = exec_result
+
+class JoinNode(AsyncNode):
+    async def prep_async(self, shared_storage):
+        shared_storage['joined'] = (shared_storage['a'], shared_storage['b'])
+
+class TestAsyncParallelFlow(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_branches_run_concurrently_then_join(self):
+        fan = AsyncParallelFlow([WriteNode('a', 1, delay=0.1), WriteNode('b', 2, delay=0.1)])
+        fan >> JoinNode()
+        shared_storage = {'log': []}
+
+        start = time.perf_counter()
+        self.loop.run_until_complete(AsyncFlow(start=fan).run_async(shared_storage))
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.18)
+        self.assertEqual(shared_storage['joined'], (1, 2))
+
+    def test_post_receives_branch_actions_in_order(self):
+        class Fan(AsyncParallelFlow):
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                shared_storage['actions'] = exec_result
+                return "next"
+
+        shared_storage = {'log': []}
+        fan = Fan([WriteNode('a', 1, delay=0.05), WriteNode('b', 2)])
+        self.loop.run_until_complete(fan.run_async(shared_storage))
+        self.assertEqual(shared_storage['actions'], ['wrote_a', 'wrote_b'])
+
+    def test_conflicts_merge_in_branch_order(self):
+        # The second branch finishes first; declaration order still decides the winner
+        branches = [WriteNode('x', 'slow', delay=0.05), WriteNode('x', 'fast')]
+
+        shared_storage = {'log': []}
+        self.loop.run_until_complete(AsyncParallelFlow(branches).run_async(shared_storage))
+        self.assertEqual(shared_storage['x'], 'fast')
+
+        shared_storage = {'log': []}
+        self.loop.run_until_complete(AsyncParallelFlow(branches, on_conflict="first").run_async(shared_storage))
+        self.assertEqual(shared_storage['x'], 'slow')
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(AsyncParallelFlow(branches, on_conflict="error").run_async({'log': []}))
+
+    def test_branches_see_a_snapshot_until_the_join(self):
+        class Reader(AsyncNode):
+            async def prep_async(self, shared_storage):
+                await asyncio.sleep(0.05)
+                shared_storage['seen_a'] = shared_storage.get('a')
+
+        shared_storage = {'log': []}
+        self.loop.run_until_complete(AsyncParallelFlow([WriteNode('a', 1), Reader()]).run_async(shared_storage))
+        self.assertIsNone(shared_storage['seen_a'])
+        self.assertEqual(shared_storage['a'], 1)
+
+    def test_deleted_keys_are_merged(self):
+        class Deleter(AsyncNode):
+            async def prep_async(self, shared_storage):
+                del shared_storage['tmp']
+
+        shared_storage = {'tmp': 1, 'log': []}
+        self.loop.run_until_complete(AsyncParallelFlow([Deleter(), WriteNode('a', 1)]).run_async(shared_storage))
+        self.assertNotIn('tmp', shared_storage)
+        self.assertEqual(shared_storage['a'], 1)
+
+    def test_sync_branches_and_nested_flows(self):
+        sub = AsyncFlow(start=WriteNode('a', 1))
+        sub.start_node - "wrote_a" >> WriteNode('b', 2)
+        fan = AsyncParallelFlow([sub, SyncWriteNode('s1', delay=0.05), SyncWriteNode('s2', delay=0.05)])
+        outer = AsyncFlow(start=fan)
+        outer.set_params({'tag': 't'})
+
+        shared_storage = {'log': []}
+        self.loop.run_until_complete(outer.run_async(shared_storage))
+        self.assertEqual((shared_storage['a'], shared_storage['b']), (1, 2))
+        self.assertEqual((shared_storage['s1'], shared_storage['s2']), ('t', 't'))
+        self.assertEqual(shared_storage['log'], ['a', 'b'])
+
+    def test_failures(self):
+        class Failing(AsyncNode):
+            async def exec_async(self, prep_result):
+                raise RuntimeError("branch failed")
+
+        slow = WriteNode('a', 1, delay=0.2)
+        shared_storage = {'log': []}
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(AsyncParallelFlow([slow, Failing()]).run_async(shared_storage))
+        self.assertNotIn('a', shared_storage)
+
+        class Collect(AsyncParallelFlow):
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                shared_storage['errors'] = [type(r).__name__ for r in exec_result if isinstance(r, Exception)]
+
+        shared_storage = {'log': []}
+        fan = Collect([WriteNode('a', 1), Failing()], return_exceptions=True)
+        self.loop.run_until_complete(fan.run_async(shared_storage))
+        self.assertEqual(shared_storage['a'], 1)
+        self.assertEqual(shared_storage['errors'], ['RuntimeError'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+import warnings
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from pocketflow import Node, Flow
+
+class StepNode(Node):
+    def __init__(self, name, action=None):
+        super().__init__()
+        self.name, self.action = name, action
+
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage.setdefault('path', []).append(self.name)
+        return self.action
+
+class CounterLoopNode(Node):
+    actions = ("loop", "done")
+
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage['count'] = shared_storage.get('count', 0) + 1
+        return "loop" if shared_storage['count'] < 3 else "done"
+
+class TestFlowCompile(unittest.TestCase):
+    def test_transition_table(self):
+        a, b, c = StepNode('a'), StepNode('b'), StepNode('c')
+        a >> b
+        a - "skip" >> c
+        b >> c
+        flow = Flow(start=a).compile()
+
+        _, start, nodes, table = flow._compiled
+        self.assertIs(start, a)
+        self.assertEqual(nodes, [a, b, c])
+        self.assertEqual(table, [{'default': 1, 'skip': 2}, {'default': 2}, {}])
+
+    def test_compiled_flow_runs_and_is_cached(self):
+        loop, end = CounterLoopNode(), StepNode('end')
+        loop - "loop" >> loop
+        loop - "done" >> end
+        flow = Flow(start=loop)
+
+        shared_storage = {}
+        flow.run(shared_storage)
+        compiled = flow._compiled
+        self.assertEqual(shared_storage, {'count': 3, 'path': ['end']})
+
+        flow.run({})
+        self.assertIs(flow._compiled, compiled)
+
+    def test_graph_changes_invalidate_the_cache(self):
+        a, b, c = StepNode('a'), StepNode('b'), StepNode('c')
+        a >> b
+        flow = Flow(start=a)
+        shared_storage = {}
+        flow.run(shared_storage)
+        self.assertEqual(shared_storage['path'], ['a', 'b'])
+
+        b >> c
+        shared_storage = {}
+        flow.run(shared_storage)
+        self.assertEqual(shared_storage['path'], ['a', 'b', 'c'])
+
+        flow.start(b)
+        shared_storage = {}
+        flow.run(shared_storage)
+        self.assertEqual(shared_storage['path'], ['b', 'c'])
+
+    def test_missing_action_still_warns_at_runtime(self):
+        a, b = StepNode('a', action="unknown"), StepNode('b')
+        a - "known" >> b
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            Flow(start=a).run({})
+        self.assertTrue(any("Flow ends: 'unknown'" in str(x.message) for x in w))
+
+    def test_validation_of_declared_actions(self):
+        class Router(Node):
+            actions = ("left", "right")
+
+        router, left, dead, orphan = Router(), StepNode('left'), StepNode('dead'), StepNode('orphan')
+        router - "left" >> left
+        router - "typo" >> dead
+        dead >> orphan
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            Flow(start=router).compile()
+        messages = [str(x.message) for x in w]
+        self.assertIn("Router can return ['right'] but has no successor for them", messages)
+        self.assertIn("Router has successors for ['typo'] that it never returns", messages)
+        self.assertIn("Unreachable from start: ['StepNode', 'StepNode']", messages)
+
+        with self.assertRaises(ValueError):
+            Flow(start=router).compile(strict=True)
+
+    def test_undeclared_actions_are_not_validated(self):
+        a, b = StepNode('a'), StepNode('b')
+        a - "x" >> b
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            Flow(start=a).compile(strict=True)
+        self.assertEqual(w, [])
+
+    def test_custom_get_next_node_is_honoured(self):
+        a, b, c = StepNode('a'), StepNode('b'), StepNode('c')
+        a >> b
+
+        class RedirectFlow(Flow):
+            def get_next_node(self, curr, action):
+                # Flows hand get_next_node the per-run copy of the node, so match on its name
+                return c if curr.name == 'a' else None
+
+        shared_storage = {}
+        RedirectFlow(start=a).run(shared_storage)
+        self.assertEqual(shared_storage['path'], ['a', 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
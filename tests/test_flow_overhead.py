@@ -0,0 +1,229 @@
+import unittest
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from pocketflow import Node, AsyncNode, Flow, AsyncFlow, AsyncParallelBatchFlow, RunLocal
+
+STEPS = 10000
+
+class LoopNode(Node):
+    copy_on_run = False
+
+    def post(self, shared_storage, prep_result, exec_result):
+        shared_storage['steps'] += 1
+        shared_storage['nodes'].add(id(self))
+        return "loop" if shared_storage['steps'] < STEPS else "done"
+
+class AsyncLoopNode(AsyncNode):
+    copy_on_run = False
+
+    async def post_async(self, shared_storage, prep_result, exec_result):
+        shared_storage['steps'] += 1
+        shared_storage['nodes'].add(id(self))
+        return "loop" if shared_storage['steps'] < STEPS else "done"
+
+class EndNode(Node):
+    pass
+
+def per_step_us(elapsed):
+    return elapsed / STEPS * 1e6
+
+class TestFlowTransitionOverhead(unittest.TestCase):
+    """
+    Benchmark a 10k-step self-looping flow; run with -s to see the timings
+    """
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_sync_flow_10k_steps(self):
+        node = LoopNode()
+        node - "loop" >> node
+        node - "done" >> EndNode()
+        shared_storage = {'steps': 0, 'nodes': set()}
+
+        start = time.perf_counter()
+        Flow(start=node).run(shared_storage)
+        elapsed = time.perf_counter() - start
+
+        print(f"\nFlow: {STEPS} transitions, {per_step_us(elapsed):.2f} us/transition")
+        self.assertEqual(shared_storage['steps'], STEPS)
+        # Opted-out nodes are not copied per transition
+        self.assertEqual(shared_storage['nodes'], {id(node)})
+
+    def test_async_flow_10k_steps(self):
+        node = AsyncLoopNode()
+        node - "loop" >> node
+        node - "done" >> EndNode()
+        shared_storage = {'steps': 0, 'nodes': set()}
+
+        start = time.perf_counter()
+        self.loop.run_until_complete(AsyncFlow(start=node).run_async(shared_storage))
+        elapsed = time.perf_counter() - start
+
+        print(f"\nAsyncFlow: {STEPS} transitions, {per_step_us(elapsed):.2f} us/transition")
+        self.assertEqual(shared_storage['steps'], STEPS)
+        self.assertEqual(shared_storage['nodes'], {id(node)})
+
+    def test_nodes_are_copied_per_transition_by_default(self):
+        class CopiedLoopNode(LoopNode):
+            copy_on_run = True
+
+        node = CopiedLoopNode()
+        node - "loop" >> node
+        node - "done" >> EndNode()
+        shared_storage = {'steps': 0, 'nodes': set()}
+        Flow(start=node).run(shared_storage)
+        self.assertEqual(shared_storage['steps'], STEPS)
+        self.assertNotIn(id(node), shared_storage['nodes'])
+
+class TestPerRunState(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_parallel_runs_keep_their_own_params(self):
+        class ParamEcho(AsyncNode):
+            async def prep_async(self, shared_storage):
+                batch_id = self.params['batch_id']
+                # Let the other sub-flows start and set their params before reading again
+                await asyncio.sleep(0.01 * (5 - batch_id))
+                shared_storage['seen'][batch_id] = self.params['batch_id']
+
+        class EchoFlow(AsyncParallelBatchFlow):
+            async def prep_async(self, shared_storage):
+                return [{'batch_id': i} for i in range(5)]
+
+        shared_storage = {'seen': {}}
+        node = ParamEcho()
+        self.loop.run_until_complete(EchoFlow(start=node).run_async(shared_storage))
+        self.assertEqual(shared_storage['seen'], {i: i for i in range(5)})
+        # The node's own params are untouched by the runs
+        self.assertEqual(node.params, {})
+
+    def test_instance_attributes_are_isolated_per_run(self):
+        class AttrEcho(AsyncNode):
+            async def prep_async(self, shared_storage):
+                self.batch_id = self.params['batch_id']
+                await asyncio.sleep(0.01 * (5 - self.batch_id))
+
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                shared_storage['seen'][self.params['batch_id']] = self.batch_id
+
+        class SharedAttrEcho(AttrEcho):
+            copy_on_run = False
+
+        class EchoFlow(AsyncParallelBatchFlow):
+            async def prep_async(self, shared_storage):
+                return [{'batch_id': i} for i in range(5)]
+
+        shared_storage = {'seen': {}}
+        node = AttrEcho()
+        self.loop.run_until_complete(EchoFlow(start=node).run_async(shared_storage))
+        self.assertEqual(shared_storage['seen'], {i: i for i in range(5)})
+        self.assertFalse(hasattr(node, 'batch_id'))
+
+        # Without the copy every run writes the same instance, so the last writer wins
+        shared_storage = {'seen': {}}
+        node = SharedAttrEcho()
+        self.loop.run_until_complete(EchoFlow(start=node).run_async(shared_storage))
+        self.assertEqual(set(shared_storage['seen'].values()), {4})
+        self.assertEqual(node.batch_id, 4)
+
+    def test_run_local_attribute(self):
+        class RememberShared(Node):
+            _shared = RunLocal()
+
+            def prep(self, shared_storage):
+                self._shared = shared_storage
+
+            def post(self, shared_storage, prep_result, exec_result):
+                self._shared['same'] = self._shared is shared_storage
+
+        node = RememberShared()
+        shared_storage = {}
+        Flow(start=node).run(shared_storage)
+        self.assertTrue(shared_storage['same'])
+
+        # Outside a flow the attribute behaves like a plain instance attribute
+        node.run({})
+        self.assertEqual(node._shared, {'same': True})
+
+    def test_run_local_state_does_not_leak_between_looped_copies(self):
+        class Counter(Node):
+            count = RunLocal()
+
+            def __init__(self):
+                super().__init__()
+                self.count = 0
+
+            def prep(self, shared_storage):
+                shared_storage['seen'].append(self.count)
+                self.count += 1
+
+            def post(self, shared_storage, prep_result, exec_result):
+                return "loop" if len(shared_storage['seen']) < 6 else "done"
+
+        class AsyncCounter(AsyncNode):
+            count = RunLocal()
+
+            def __init__(self):
+                super().__init__()
+                self.count = 0
+
+            async def prep_async(self, shared_storage):
+                shared_storage['seen'].append(self.count)
+                self.count += 1
+
+            async def post_async(self, shared_storage, prep_result, exec_result):
+                return "loop" if len(shared_storage['seen']) < 6 else "done"
+
+        class UncompiledFlow(Flow):
+            def get_next_node(self, curr, action):
+                return super().get_next_node(curr, action)
+
+        class UncompiledAsyncFlow(AsyncFlow):
+            def get_next_node(self, curr, action):
+                return super().get_next_node(curr, action)
+
+        for counter, flow_cls in ((Counter(), Flow), (Counter(), UncompiledFlow), (AsyncCounter(), AsyncFlow), (AsyncCounter(), UncompiledAsyncFlow)):
+            bounce = EndNode()
+            counter - "loop" >> bounce
+            counter - "done" >> EndNode()
+            bounce >> counter
+            shared_storage = {'seen': []}
+            flow = flow_cls(start=counter)
+            if isinstance(flow, AsyncFlow):
+                self.loop.run_until_complete(flow.run_async(shared_storage))
+            else:
+                flow.run(shared_storage)
+            # Every pass runs a fresh copy, which starts from the value set in __init__
+            self.assertEqual(shared_storage['seen'], [0] * 6, flow_cls.__name__)
+            self.assertEqual(counter.count, 0)
+
+    def test_sync_node_in_executor_sees_run_params(self):
+        class SyncEcho(Node):
+            def prep(self, shared_storage):
+                shared_storage['seen'] = self.params.get('tag')
+
+        class TaggedFlow(AsyncFlow):
+            async def prep_async(self, shared_storage):
+                pass
+
+        flow = TaggedFlow(start=SyncEcho(), max_workers=2)
+        flow.set_params({'tag': 'x'})
+        shared_storage = {}
+        self.loop.run_until_complete(flow.run_async(shared_storage))
+        self.assertEqual(shared_storage['seen'], 'x')
+
+if __name__ == '__main__':
+    unittest.main()
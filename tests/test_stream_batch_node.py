@@ -0,0 +1,177 @@
+import unittest
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from pocketflow import Node, StreamBatchNode, AsyncStreamBatchNode, Flow, AsyncFlow
+
+class SquareStreamNode(StreamBatchNode):
+    def prep(self, shared_storage):
+        # Yield lazily and record when each item is produced
+        for x in range(shared_storage['count']):
+            shared_storage['log'].append(('prep', x))
+            yield x
+
+    def exec(self, x):
+        return x * x
+
+    def post_item(self, shared_storage, item, exec_res):
+        shared_storage['log'].append(('post_item', item))
+        shared_storage['total'] = shared_storage.get('total', 0) + exec_res
+
+    def post(self, shared_storage, prep_res, exec_res):
+        shared_storage['processed'] = exec_res
+        return "done"
+
+class ReportNode(Node):
+    def prep(self, shared_storage):
+        shared_storage['report'] = f"{shared_storage['processed']} items, total {shared_storage['total']}"
+
+class TestStreamBatchNode(unittest.TestCase):
+    def test_items_are_processed_incrementally(self):
+        """
+        Each item reaches post_item before the next one is pulled from prep
+        """
+        shared_storage = {'count': 3, 'log': []}
+        action = SquareStreamNode().run(shared_storage)
+
+        self.assertEqual(action, "done")
+        self.assertEqual(shared_storage['log'], [
+            ('prep', 0), ('post_item', 0),
+            ('prep', 1), ('post_item', 1),
+            ('prep', 2), ('post_item', 2),
+        ])
+        self.assertEqual(shared_storage['total'], 0 + 1 + 4)
+        self.assertEqual(shared_storage['processed'], 3)
+
+    def test_empty_and_none_prep(self):
+        shared_storage = {'count': 0, 'log': []}
+        SquareStreamNode().run(shared_storage)
+        self.assertEqual(shared_storage['processed'], 0)
+
+        class NoneStreamNode(StreamBatchNode):
+            def post(self, shared_storage, prep_res, exec_res):
+                shared_storage['processed'] = exec_res
+
+        shared_storage = {}
+        NoneStreamNode().run(shared_storage)
+        self.assertEqual(shared_storage['processed'], 0)
+
+    def test_retries_and_fallback_apply_per_item(self):
+        attempts = {}
+
+        class FlakyStreamNode(StreamBatchNode):
+            def prep(self, shared_storage):
+                return iter(range(3))
+
+            def exec(self, x):
+                attempts[x] = attempts.get(x, 0) + 1
+                if x == 1 and attempts[x] < 2:
+                    raise ValueError("transient")
+                if x == 2:
+                    raise ValueError("permanent")
+                return x
+
+            def exec_fallback(self, prep_res, exc):
+                return -1
+
+            def post_item(self, shared_storage, item, exec_res):
+                shared_storage.setdefault('results', []).append(exec_res)
+
+        shared_storage = {}
+        FlakyStreamNode(max_retries=2).run(shared_storage)
+        self.assertEqual(shared_storage['results'], [0, 1, -1])
+        self.assertEqual(attempts, {0: 1, 1: 2, 2: 2})
+
+    def test_stream_node_in_flow(self):
+        shared_storage = {'count': 5, 'log': []}
+        stream = SquareStreamNode()
+        stream - "done" >> ReportNode()
+        Flow(start=stream).run(shared_storage)
+        self.assertEqual(shared_storage['report'], "5 items, total 30")
+
+    def test_large_input_is_not_materialised(self):
+        """
+        A long generator is consumed without keeping inputs or outputs around
+        """
+        class CountingStreamNode(StreamBatchNode):
+            def prep(self, shared_storage):
+                return (i for i in range(200000))
+
+            def exec(self, x):
+                return [x] * 4
+
+            def post_item(self, shared_storage, item, exec_res):
+                shared_storage['last'] = exec_res
+
+            def post(self, shared_storage, prep_res, exec_res):
+                shared_storage['processed'] = exec_res
+
+        shared_storage = {}
+        CountingStreamNode().run(shared_storage)
+        self.assertEqual(shared_storage['processed'], 200000)
+        self.assertEqual(shared_storage['last'], [199999] * 4)
+
+class TestAsyncStreamBatchNode(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_async_generator_prep(self):
+        class AsyncSquareStreamNode(AsyncStreamBatchNode):
+            async def prep_async(self, shared_storage):
+                async def gen():
+                    for x in range(4):
+                        await asyncio.sleep(0)
+                        shared_storage['log'].append(('prep', x))
+                        yield x
+                return gen()
+
+            async def exec_async(self, x):
+                await asyncio.sleep(0.001)
+                return x * x
+
+            async def post_item_async(self, shared_storage, item, exec_res):
+                shared_storage['log'].append(('post_item', item, exec_res))
+
+            async def post_async(self, shared_storage, prep_res, exec_res):
+                shared_storage['processed'] = exec_res
+                return "done"
+
+        shared_storage = {'log': []}
+        node = AsyncSquareStreamNode()
+        node - "done" >> AsyncStreamBatchNode()
+        flow = AsyncFlow(start=node)
+        self.loop.run_until_complete(flow.run_async(shared_storage))
+
+        self.assertEqual(shared_storage['processed'], 4)
+        self.assertEqual(shared_storage['log'][:4], [('prep', 0), ('post_item', 0, 0), ('prep', 1), ('post_item', 1, 1)])
+        self.assertEqual(len(shared_storage['log']), 8)
+
+    def test_sync_iterable_prep_with_retries(self):
+        attempts = {}
+
+        class AsyncFlakyStreamNode(AsyncStreamBatchNode):
+            async def prep_async(self, shared_storage):
+                return ['a', 'b']
+
+            async def exec_async(self, item):
+                attempts[item] = attempts.get(item, 0) + 1
+                if item == 'b' and attempts[item] == 1:
+                    raise ValueError("transient")
+                return item.upper()
+
+            async def post_item_async(self, shared_storage, item, exec_res):
+                shared_storage.setdefault('results', []).append(exec_res)
+
+        shared_storage = {}
+        self.loop.run_until_complete(AsyncFlakyStreamNode(max_retries=2).run_async(shared_storage))
+        self.assertEqual(shared_storage['results'], ['A', 'B'])
+        self.assertEqual(attempts, {'a': 1, 'b': 2})
+
+if __name__ == '__main__':
+    unittest.main()